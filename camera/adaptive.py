@@ -0,0 +1,220 @@
+import glob, time, threading, logging
+from picamera2.outputs import Output
+from session import CameraSession
+
+logger = logging.getLogger(__name__)
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+COOLING_DEVICES = "/sys/class/thermal/cooling_device*"
+
+# Quality rungs, best first. Moving between rungs with the same size only needs
+# a FrameRate control and/or an encoder restart, a size change reconfigures the camera.
+DEFAULT_LADDER = [
+    {"size": (1280, 720), "fps": 30, "bitrate": 2_500_000},
+    {"size": (1280, 720), "fps": 20, "bitrate": 1_500_000},
+    {"size": (960, 540), "fps": 15, "bitrate": 1_000_000},
+    {"size": (640, 360), "fps": 15, "bitrate": 500_000},
+    {"size": (640, 360), "fps": 10, "bitrate": 250_000},
+]
+
+# --- Thermal readings ---
+
+def read_cpu_temperature(path=THERMAL_ZONE):
+    """Return the SoC temperature in degrees Celsius, or None if it can't be read."""
+
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip()) / 1000
+
+    except (OSError, ValueError):
+        return None
+
+def read_throttle_state(pattern=COOLING_DEVICES) -> int:
+    """
+    Return the highest state of the CPU frequency cooling devices. Anything above
+    0 means the CPU is being throttled. Other cooling devices, like the Pi 5's
+    fan, are left out, a spinning fan doesn't slow the CPU down.
+    """
+
+    state = 0
+
+    for device in glob.glob(pattern):
+        try:
+            with open(f"{device}/type", "r") as f:
+                if "cpufreq" not in f.read():
+                    continue
+
+            with open(f"{device}/cur_state", "r") as f:
+                state = max(state, int(f.read().strip()))
+
+        except (OSError, ValueError):
+            continue
+
+    return state
+
+# --- Adaptive controller ---
+
+class AdaptiveController(threading.Thread):
+    """
+    Steps the stream up and down a quality ladder based on how well the uplink
+    keeps up and how hot the Pi is running.
+
+    Uplink congestion shows up as the RTSP output blocking on writes (ffmpeg can't
+    push frames out as fast as they arrive) or as the RTT to the server rising well
+    above its baseline. An optional pressure source (the memory governor) can also
+    ask for a lower rung through reason() and hold upgrades back through healthy().
+    Downgrades happen as soon as min_dwell allows, upgrades
+    only after upgrade_after seconds of healthy readings, so quality doesn't oscillate.
+    While an optional motion gate holds the stream at its keep-alive rate the
+    controller leaves the quality alone, the gate restores the current rung.
+    """
+
+    def __init__(self, session: CameraSession, output: Output, config_factory, ladder=None, connectivity=None,
+                 interval=5, min_dwell=15, upgrade_after=60, stall_threshold=0.25, rtt_factor=3,
+                 temp_high=80, temp_ok=70, pressure=None, motion=None):
+
+        super().__init__(name="adaptive", daemon=True)
+        self.session = session
+        self.output = output
+        self.config_factory = config_factory
+        self.ladder = ladder or DEFAULT_LADDER
+        self.connectivity = connectivity
+        self.interval = interval
+        self.min_dwell = min_dwell
+        self.upgrade_after = upgrade_after
+        self.stall_threshold = stall_threshold
+        self.rtt_factor = rtt_factor
+        self.temp_high = temp_high
+        self.temp_ok = temp_ok
+        self.pressure = pressure
+        self.motion = motion
+
+        self.rung = 0
+        self.throughput = None
+        self.stall_ratio = None
+        self.temperature = None
+
+        self._last_stats = None
+        self._last_change = time.monotonic()
+        self._healthy_since = None
+        self._rtt_baseline = None
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+
+        while not self._stopped.wait(self.interval):
+
+            try:
+                self.step()
+
+            except Exception as e:
+                logger.error(f"[Adaptive] Failed to adjust stream quality: {e}")
+
+    def step(self):
+
+        # Readings taken at the keep-alive rate say nothing about the full stream
+        if self.motion is not None and self.motion.gated:
+            self._last_stats = None
+            self._healthy_since = None
+            return
+
+        now = time.monotonic()
+        reason = self._congestion() or self._overheating() or (self.pressure.reason() if self.pressure else None)
+
+        if reason:
+            self._healthy_since = None
+
+            if self.rung < len(self.ladder) - 1 and now - self._last_change >= self.min_dwell:
+                self._apply(self.rung + 1, reason)
+
+            return
+
+        # Only heat that has clearly dropped counts as healthy, the gap between
+        # temp_ok and temp_high keeps us from bouncing around one threshold
+        if self.temperature is not None and self.temperature > self.temp_ok:
+            self._healthy_since = None
+            return
+
+        if self.pressure and not self.pressure.healthy():
+            self._healthy_since = None
+            return
+
+        self._healthy_since = self._healthy_since or now
+
+        if self.rung > 0 and now - self._healthy_since >= self.upgrade_after and now - self._last_change >= self.min_dwell:
+            self._apply(self.rung - 1, "link and temperature healthy")
+            self._healthy_since = now
+
+    def _congestion(self):
+        """Return a reason string if the uplink looks congested, otherwise None."""
+
+        now = time.monotonic()
+        stats = self.session.fanout.stats(self.output)
+
+        # Nothing to measure while the RTSP output isn't attached (offline mode)
+        if stats is None:
+            self._last_stats = None
+            return None
+
+        previous, self._last_stats = self._last_stats, (now, stats)
+        if previous is None:
+            return None
+
+        elapsed = now - previous[0]
+        self.throughput = (stats["bytes"] - previous[1]["bytes"]) * 8 / elapsed
+        self.stall_ratio = (stats["write_time"] - previous[1]["write_time"]) / elapsed
+
+        if self.stall_ratio > self.stall_threshold:
+            return f"output blocked {self.stall_ratio:.0%} of the time at {self.throughput / 1000:.0f} kbit/s"
+
+        rtt = self.connectivity.rtt if self.connectivity else None
+        if rtt is None:
+            return None
+
+        # Let the baseline creep up slowly so a route change doesn't pin us at a low rung forever
+        self._rtt_baseline = rtt if self._rtt_baseline is None else min(self._rtt_baseline * 1.01, rtt)
+
+        if rtt > self.rtt_factor * self._rtt_baseline and rtt > 0.2:
+            return f"rtt {rtt * 1000:.0f} ms against a baseline of {self._rtt_baseline * 1000:.0f} ms"
+
+        return None
+
+    def _overheating(self):
+        """Return a reason string if the SoC is too hot or already throttling, otherwise None."""
+
+        self.temperature = read_cpu_temperature()
+
+        if self.temperature is not None and self.temperature >= self.temp_high:
+            return f"cpu at {self.temperature:.1f}C"
+
+        throttle = read_throttle_state()
+        if throttle > 0:
+            return f"cpu throttled (cooling state {throttle})"
+
+        return None
+
+    def _apply(self, index: int, reason: str):
+
+        old, new = self.ladder[self.rung], self.ladder[index]
+        logger.info(
+            f"[Adaptive] {'Lowering' if index > self.rung else 'Raising'} quality to "
+            f"{new['size'][0]}x{new['size'][1]}@{new['fps']} {new['bitrate'] // 1000} kbit/s: {reason}"
+        )
+
+        # Use the cheapest path that covers the change
+        if new["size"] != old["size"]:
+            self.session.reconfigure(self.config_factory(new["size"], new["fps"]), bitrate=new["bitrate"])
+
+        else:
+            if new["bitrate"] != old["bitrate"]:
+                self.session.restart_encoder(new["bitrate"])
+
+            if new["fps"] != old["fps"]:
+                self.session.set_controls({"FrameRate": new["fps"]})
+
+        self.rung = index
+        self._last_change = time.monotonic()
+        self._last_stats = None
@@ -0,0 +1,186 @@
+import time, threading, subprocess, collections, logging
+from segment_store import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+# --- Backfill command ---
+
+def build_backfill_command(file_path: str, rtsp_url: str, rate=3.0, framerate=30) -> list:
+    """
+    Build the ffmpeg command that pushes one buffered segment to the RTSP server.
+
+    -readrate paces the input at a multiple of real time instead of the 1x that
+    -re forces, so a backlog drains faster than it was recorded without flooding
+    the uplink the live stream shares. Raw Annex-B carries no timestamps, so the
+    recorded frame rate is passed to the demuxer to keep the replay timeline right.
+    """
+
+    return [
+        "ffmpeg",
+        "-loglevel", "warning",
+        "-readrate", str(rate),
+        "-framerate", str(framerate),
+        "-i", file_path,
+        "-c", "copy",
+        "-rtsp_transport", "tcp",
+        "-f", "rtsp",
+        rtsp_url
+    ]
+
+# --- Backfill worker ---
+
+class BackfillUploader(threading.Thread):
+    """
+    Background worker that uploads buffered segments oldest first while the live
+    stream is already running again.
+
+    A segment is only removed from the store once ffmpeg has pushed it completely,
+    so an interrupted upload resumes from that segment on the next attempt. A
+    segment ffmpeg has failed on max_attempts times is taken to be corrupt and
+    quarantined, so it doesn't hold up the rest of the backlog.
+    """
+
+    def __init__(self, store: SegmentStore, rtsp_url: str, rate=3.0, poll_interval=5, max_backoff=60, is_online=None,
+                 max_attempts=5):
+
+        super().__init__(name="backfill", daemon=True)
+        self.store = store
+        self.rtsp_url = rtsp_url
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.is_online = is_online
+        self.max_attempts = max_attempts
+
+        self._attempts = collections.Counter()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+
+        self.uploaded_segments = 0
+        self.uploaded_seconds = 0.0
+        self.uploaded_bytes = 0
+        self.failures = 0
+        self.quarantined_segments = 0
+
+    def wake(self):
+        """Ask the worker to look at the store now, for example right after a reconnect."""
+        self._wake.set()
+
+    def stop(self):
+
+        self._stopped.set()
+        self._wake.set()
+
+        with self._lock:
+            if self._process is not None:
+                self._process.terminate()
+
+    def progress(self) -> dict:
+        """Return a snapshot of the upload progress and remaining backlog."""
+
+        entries = self.store.entries()
+        return {
+            "uploaded_segments": self.uploaded_segments,
+            "uploaded_seconds": round(self.uploaded_seconds, 1),
+            "pending_segments": len(entries),
+            "pending_seconds": round(sum(e["duration"] or self.store.segment_seconds for e in entries), 1),
+            "failures": self.failures,
+            "quarantined_segments": self.quarantined_segments
+        }
+
+    def run(self):
+
+        backoff = self.poll_interval
+
+        while not self._stopped.is_set():
+
+            try:
+                entries = self.store.entries()
+
+                if not entries or (self.is_online and not self.is_online()):
+                    self._wait(self.poll_interval)
+                    continue
+
+                if self.upload_segment(entries[0]):
+                    backoff = self.poll_interval
+                    continue
+
+                if self._attempts[entries[0]["name"]] >= self.max_attempts:
+                    self.quarantine(entries[0])
+                    continue
+
+                # Failed uploads back off exponentially so a dead uplink isn't hammered
+                # with ffmpeg restarts
+                backoff = min(backoff * 2, self.max_backoff)
+                logger.warning(f"[Backfill] Retrying in {backoff}s")
+
+            except Exception as e:
+                # The store's disk acting up must not end the backfill for good
+                self.failures += 1
+                backoff = min(backoff * 2, self.max_backoff)
+                logger.error(f"[Backfill] Unexpected error, retrying in {backoff}s: {e}")
+
+            self._wait(backoff)
+
+    def _wait(self, timeout: float):
+
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def upload_segment(self, entry: dict) -> bool:
+
+        duration = entry["duration"] or self.store.segment_seconds
+        framerate = round(entry["frames"] / duration) if entry["frames"] and duration else 30
+        command = build_backfill_command(self.store.path(entry["name"]), self.rtsp_url, self.rate, framerate)
+
+        start = time.time()
+
+        try:
+            with self._lock:
+                if self._stopped.is_set():
+                    return False
+                self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL)
+
+            returncode = self._process.wait()
+
+        except Exception as e:
+            logger.error(f"[Backfill] Error starting upload of {entry['name']}: {e}")
+            returncode = None
+
+        finally:
+            with self._lock:
+                self._process = None
+
+        if returncode != 0:
+            self.failures += 1
+            logger.error(f"[Backfill] Upload of {entry['name']} failed (exit code {returncode})")
+
+            # Only ffmpeg giving up on the segment counts against it, not ffmpeg
+            # failing to start or being stopped
+            if returncode is not None and not self._stopped.is_set():
+                self._attempts[entry["name"]] += 1
+
+            return False
+
+        self._attempts.pop(entry["name"], None)
+        self.store.remove(entry["name"])
+        self.uploaded_segments += 1
+        self.uploaded_seconds += duration
+        self.uploaded_bytes += entry["bytes"]
+
+        progress = self.progress()
+        logger.info(
+            f"[Backfill] Uploaded {entry['name']} ({duration:.1f}s in {time.time() - start:.1f}s), "
+            f"{progress['pending_segments']} segments / {progress['pending_seconds']}s remaining"
+        )
+        return True
+
+    def quarantine(self, entry: dict):
+
+        attempts = self._attempts.pop(entry["name"], 0)
+
+        if self.store.quarantine(entry["name"], f"upload failed {attempts} times"):
+            self.quarantined_segments += 1
+            logger.error(f"[Backfill] Upload of {entry['name']} failed {attempts} times, quarantined it and moving on")
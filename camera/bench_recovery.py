@@ -0,0 +1,485 @@
+"""
+Fault injection benchmark for the camera pipeline's recovery paths.
+
+Runs the real mainloop against stand-in camera and ffmpeg objects, so no camera
+or RTSP server is needed. Picamera2 itself still has to be importable. Faults are
+injected one after another, each the way it surfaces in production: the affected
+component stops delivering frames and the error is raised into the mainloop. For
+every error class it reports
+
+  recover_s  seconds from the fault until the supervisor is running again and
+             the live output receives frames
+  lost       frames the camera should have delivered to the live output during
+             the fault and the settle period after it, but didn't
+  fds, threads, children
+             open file descriptors, threads and child processes left over once
+             the pipeline has settled, compared to just before the fault
+  reopens    times the camera was opened again, i.e. cold restarts
+
+Backoff jitter is seeded, so runs are comparable between commits:
+
+  python bench_recovery.py --json before.json
+  python bench_recovery.py --compare before.json
+
+Repeating a class (--repeat 4) spends its retry budget and shows the
+escalation to a cold restart.
+"""
+
+import os, sys, json, time, errno, random, argparse, tempfile, threading, subprocess, _thread, logging
+from unittest.mock import patch
+import numpy as np
+from multiprocessing import shared_memory
+from picamera2.outputs import Output
+import camera
+from supervisor import Supervisor, RUNNING_STATES
+
+logger = logging.getLogger(__name__)
+
+SPS = b"\x00\x00\x00\x01\x67\x64\x00\x28"
+PPS = b"\x00\x00\x00\x01\x68\xee\x3c\x80"
+IDR = b"\x00\x00\x00\x01\x65\x88\x84\x21" + bytes(2000)
+SLICE = b"\x00\x00\x00\x01\x41\x9a\x02\x10" + bytes(200)
+
+# Error class -> (error raised into the mainloop, component that stops delivering frames)
+FAULTS = {
+    "pipe": (lambda: OSError(errno.EPIPE, "Broken pipe"), "output"),
+    "disk": (lambda: OSError(errno.ENOSPC, "No space left on device"), None),
+    "fds": (lambda: OSError(errno.EMFILE, "Too many open files"), "camera"),
+    "memory": (lambda: OSError(errno.ENOMEM, "Cannot allocate memory"), "camera"),
+    "busy": (lambda: OSError(errno.EBUSY, "Device or resource busy"), "camera"),
+    "encoder": (lambda: RuntimeError("Encoder failed to queue buffer"), "camera"),
+}
+
+# --- Resource accounting ---
+
+def count_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+def count_children() -> int:
+
+    pid = str(os.getpid())
+    children = 0
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces, the fields after it don't
+                fields = f.read().rsplit(")", 1)[1].split()
+
+        except OSError:
+            continue
+
+        if fields[1] == pid and fields[0] != "Z":
+            children += 1
+
+    return children
+
+def snapshot() -> dict:
+    return {"fds": count_fds(), "threads": threading.active_count(), "children": count_children()}
+
+# --- Stand-ins ---
+
+class Bench:
+    """Shared state between the stand-ins and the fault injector."""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.received = []
+        self.opens = 0
+        self.cameras = []
+        self.outputs = []
+        self.supervisor = None
+
+        self.pending = None
+        self.raised_at = None
+
+    def deliver(self):
+
+        with self.lock:
+            self.received.append(time.monotonic())
+
+    def received_between(self, start: float, end: float) -> int:
+
+        with self.lock:
+            return sum(1 for t in self.received if start <= t <= end)
+
+    def first_frame_after(self, start: float):
+
+        with self.lock:
+            return next((t for t in self.received if t > start), None)
+
+class FakeCamera:
+    """Stands in for Picamera2 and its encoder: delivers H.264 sized frames at the configured rate."""
+
+    def __init__(self, bench: Bench, camera_num=0):
+
+        self.bench = bench
+        self.fps = 30
+        self.broken = False
+        self.closed = False
+        self.config = {}
+        self.post_callback = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+        bench.opens += 1
+        bench.cameras.append(self)
+
+    @staticmethod
+    def create_video_configuration(**config):
+        config.setdefault("controls", {})
+        return config
+
+    def configure(self, config: dict):
+        self.config = config
+        self.fps = config.get("controls", {}).get("FrameRate", 30)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        self.stop_encoder()
+        self.closed = True
+
+    def set_controls(self, controls: dict):
+        self.fps = controls.get("FrameRate", self.fps)
+
+    def capture_array(self, stream="main"):
+
+        width, height = self.config.get(stream, {}).get("size", (320, 240))
+        return np.zeros((height * 3 // 2, width), dtype=np.uint8)
+
+    def start_recording(self, encoder, output):
+        self.start()
+        self.start_encoder(encoder, output)
+
+    def stop_recording(self):
+        self.stop_encoder()
+        self.stop()
+
+    def start_encoder(self, encoder, output):
+
+        # A fresh encoder clears whatever fault stalled the old one
+        self.broken = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(encoder, output, self._stopped), name="fake-encoder", daemon=True)
+        self._thread.start()
+
+    def stop_encoder(self, encoder=None):
+
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, encoder, output, stopped: threading.Event):
+
+        iperiod = getattr(encoder, "iperiod", None) or 30
+        frames = 0
+
+        while not stopped.wait(1 / self.fps):
+
+            # The camera keeps completing requests while the encoder is stalled
+            if self.post_callback is not None:
+                self.post_callback(None)
+
+            if self.broken:
+                continue
+
+            keyframe = frames % iperiod == 0
+            output.outputframe(SPS + PPS + IDR if keyframe else SLICE, keyframe, int(frames * 1e6 / self.fps))
+            frames += 1
+
+class FakeFfmpegOutput(Output):
+    """Stands in for FfmpegOutput, with a child process in place of ffmpeg so leaked processes show up."""
+
+    def __init__(self, bench: Bench, output_filename, audio=False, **kwargs):
+
+        super().__init__()
+        self.bench = bench
+        self.output_filename = output_filename
+        self.output_broken = False
+        self.process = None
+        bench.outputs.append(self)
+
+    def start(self):
+
+        super().start()
+        self.output_broken = False
+        self.process = subprocess.Popen(["sleep", "86400"], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop(self):
+
+        super().stop()
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+
+        if self.process is not None and not self.output_broken:
+            self.bench.deliver()
+
+class FakeConnectivity:
+    """Always online. Raises the injected fault into the mainloop the next time it checks the connection."""
+
+    def __init__(self, bench: Bench, rtsp_url: str, **kwargs):
+
+        self.bench = bench
+        self.rtt = 0.02
+        self.loss = 0.0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_url(self, rtsp_url: str):
+        pass
+
+    @property
+    def online(self) -> bool:
+
+        # Other threads check the connection too, the fault belongs to the camera pipeline
+        if self.bench.pending is not None and threading.current_thread().name.startswith("camera-"):
+            error, target = self.bench.pending
+            self.bench.pending = None
+
+            if target == "camera":
+                self.bench.cameras[-1].broken = True
+            elif target == "output":
+                self.bench.outputs[-1].output_broken = True
+
+            self.bench.raised_at = time.monotonic()
+            raise error
+
+        return True
+
+# --- Fault injection ---
+
+def wait_for(condition, timeout: float, interval=0.05) -> bool:
+
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+
+    return False
+
+def recovered_at(bench: Bench, since: float):
+    """Return when the pipeline was back in a running state with frames reaching the live output, or None."""
+
+    running = next((t for t, _, state, _ in list(bench.supervisor.history) if t > since and state in RUNNING_STATES), None)
+
+    # Frames that arrive before the supervisor gives the all clear don't count
+    return bench.first_frame_after(running) if running is not None else None
+
+def inject(bench: Bench, failure_class: str, settle: float, timeout: float) -> dict:
+
+    make_error, target = FAULTS[failure_class]
+    before = snapshot()
+    opens = bench.opens
+
+    bench.raised_at = None
+    bench.pending = (make_error(), target)
+
+    if not wait_for(lambda: bench.raised_at is not None, timeout):
+        raise RuntimeError(f"Fault {failure_class} was never picked up by the mainloop")
+
+    raised_at = bench.raised_at
+    wait_for(lambda: recovered_at(bench, raised_at) is not None, timeout)
+    recovered = recovered_at(bench, raised_at)
+
+    end = (recovered or time.monotonic()) + settle
+    time.sleep(max(0.0, end - time.monotonic()))
+
+    expected = round((end - raised_at) * camera.settings["frame_rate"])
+    after = snapshot()
+
+    return {
+        "recover_s": round(recovered - raised_at, 3) if recovered else None,
+        "lost": max(0, expected - bench.received_between(raised_at, end)),
+        "reopens": bench.opens - opens,
+        **{key: after[key] - before[key] for key in before},
+    }
+
+def run_faults(bench: Bench, classes: list, repeat: int, settle: float, timeout: float, results: dict):
+
+    try:
+        if not wait_for(lambda: bench.supervisor is not None and bench.first_frame_after(0) is not None, timeout):
+            raise RuntimeError("Pipeline never started streaming")
+
+        # Let the workers reach their steady state before the first baseline
+        time.sleep(settle)
+
+        for failure_class in classes:
+            for attempt in range(repeat):
+                result = inject(bench, failure_class, settle, timeout)
+                results.setdefault(failure_class, []).append(result)
+                logger.info(f"[Bench] {failure_class} #{attempt + 1}: {result}")
+
+    except Exception as e:
+        logger.error(f"[Bench] {e}")
+
+    finally:
+        _thread.interrupt_main()
+
+# --- Reporting ---
+
+def summarise(runs: list) -> dict:
+
+    times = [r["recover_s"] for r in runs if r["recover_s"] is not None]
+
+    return {
+        "runs": len(runs),
+        "failed": len(runs) - len(times),
+        "recover_mean_s": round(sum(times) / len(times), 3) if times else None,
+        "recover_max_s": max(times) if times else None,
+        "lost": sum(r["lost"] for r in runs),
+        "fds": sum(r["fds"] for r in runs),
+        "threads": sum(r["threads"] for r in runs),
+        "children": sum(r["children"] for r in runs),
+        "reopens": sum(r["reopens"] for r in runs),
+    }
+
+def format_seconds(value) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+def print_report(summary: dict, baseline=None):
+
+    print(f"{'class':<9} {'runs':>4} {'recover_s':>9} {'max_s':>6} {'lost':>6} {'fds':>4} {'threads':>7} {'children':>8} {'reopens':>7}")
+
+    for failure_class, s in summary.items():
+
+        line = (
+            f"{failure_class:<9} {s['runs']:>4} {format_seconds(s['recover_mean_s']):>9} {format_seconds(s['recover_max_s']):>6} "
+            f"{s['lost']:>6} {s['fds']:>+4} {s['threads']:>+7} {s['children']:>+8} {s['reopens']:>7}"
+        )
+
+        before = (baseline or {}).get(failure_class)
+        if before and before["recover_mean_s"] is not None and s["recover_mean_s"] is not None:
+            lost = s["lost"] / s["runs"] - before["lost"] / before["runs"]
+            line += f"   vs baseline {s['recover_mean_s'] - before['recover_mean_s']:+.2f}s, {lost:+.0f} frames per fault"
+
+        print(line)
+
+def git_commit():
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- Entry point ---
+
+def remove_ring(name: str):
+
+    try:
+        shm = shared_memory.SharedMemory(name)
+
+    except FileNotFoundError:
+        return
+
+    shm.close()
+    shm.unlink()
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--classes", nargs="+", choices=list(FAULTS), default=list(FAULTS))
+    parser.add_argument("--repeat", type=int, default=1, help="faults injected per class")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait after each recovery")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for a recovery")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the backoff jitter")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the pipeline's own logs")
+    args = parser.parse_args()
+
+    # camera already configured the root logger on import
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s", force=True)
+    logger.setLevel(logging.INFO)
+    random.seed(args.seed)
+
+    bench = Bench()
+    results = {}
+    control_server = camera.ControlServer
+
+    # A ring of its own, so the bench neither clashes with a running camera nor leaves one behind
+    ring_name = f"eleeye_bench_{os.getpid()}"
+
+    def supervisor(*a, **kwargs):
+        bench.supervisor = Supervisor(*a, **kwargs)
+        return bench.supervisor
+
+    with tempfile.TemporaryDirectory() as tmp, \
+         patch("camera.Picamera2", lambda *a, **kwargs: FakeCamera(bench, *a, **kwargs)), \
+         patch("camera.FfmpegOutput", lambda *a, **kwargs: FakeFfmpegOutput(bench, *a, **kwargs)), \
+         patch("camera.ConnectivityMonitor", lambda *a, **kwargs: FakeConnectivity(bench, *a, **kwargs)), \
+         patch("camera.ControlServer", lambda: control_server(os.path.join(tmp, "control.sock"))), \
+         patch("camera.kill_conflicting_processes"), \
+         patch("camera.Supervisor", supervisor), \
+         patch("camera.OFFLINE_BUFFER_DIR", os.path.join(tmp, "offline_buffer")), \
+         patch("camera.CLIPS_DIR", os.path.join(tmp, "clips")), \
+         patch("camera.CONFIG_FILE", os.path.join(tmp, "camera_config.json")), \
+         patch("camera.LOCATION_FILE", os.path.join(tmp, "location.txt")), \
+         patch("camera.LOG_DUMP_DIR", os.path.join(tmp, "logs")), \
+         patch("camera.FRAME_RING_NAME", ring_name):
+
+        injector = threading.Thread(
+            target=run_faults,
+            args=(bench, args.classes, args.repeat, args.settle, args.timeout, results),
+            name="fault-injector",
+            daemon=True
+        )
+        injector.start()
+
+        try:
+            camera.mainloop()
+
+        except KeyboardInterrupt:
+            pass
+
+        except SystemExit:
+            logger.error("[Bench] Pipeline went fatal")
+
+        finally:
+            # The pipeline threads die with the process, their stand-in ffmpeg processes wouldn't
+            for output in bench.outputs:
+                output.stop()
+
+            # Neither do the rings they would have closed
+            for camera_num in camera.CAMERAS:
+                remove_ring(camera.per_camera(ring_name, camera_num))
+
+    summary = {failure_class: summarise(runs) for failure_class, runs in results.items()}
+    baseline = None
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["summary"]
+
+    print_report(summary, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": git_commit(), "seed": args.seed, "summary": summary, "runs": results}, f, indent=2)
+
+    return 0 if results and all(s["failed"] == 0 for s in summary.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+End to end streaming benchmark with a synthetic source and a local RTSP sink.
+
+Runs on an ordinary Linux box with ffmpeg (and libx264) installed. Picamera2
+itself has to be importable, its FfmpegOutput is what gets measured.
+
+  source   ffmpeg encodes a test pattern in real time, standing in for the camera
+           and its hardware encoder
+  live     every frame goes through an OutputFanout with SEI telemetry into the
+           FfmpegOutput that create_ffmpeg_output() builds, exactly as in live mode
+  backfill the same footage is recorded into the segment store and pushed with
+           BackfillUploader's ffmpeg command at BACKFILL_RATE
+  sink     ffmpeg in RTSP listen mode receives each stream and hands it back
+           to the benchmark as Annex-B
+
+The capture time in every frame's SEI telemetry is its timestamp: it is set when
+the frame is handed to the outputs, and read back when it leaves the sink, so the
+live latency covers the fanout, ffmpeg, RTSP and the sink's demuxer but not the
+sensor or encoder. For each stream it reports latency percentiles, the achieved
+frame rate, lost frames and CPU per process.
+
+  python bench_stream.py --json before.json
+  python bench_stream.py --compare before.json
+
+--profile low_latency runs the same with the low latency profile, for the
+encoder settings it selects and the ffmpeg options of the live output.
+--backend pyav streams live from inside the benchmark process with PyAV, its
+CPU then shows under python instead of publisher.
+"""
+
+import sys, json, time, socket, argparse, tempfile, resource, threading, subprocess, logging
+import camera
+from session import OutputFanout
+from segment_store import SegmentStore, SegmentedOutput
+from backfill import BackfillUploader
+from telemetry import FrameTelemetry, nal_units, extract_telemetry
+from config import LATENCY_PROFILES, RTSP_BACKENDS
+from bench_recovery import git_commit
+
+logger = logging.getLogger(__name__)
+
+AUD = b"\x00\x00\x00\x01\x09"
+
+# --- Commands ---
+
+def source_command(size: tuple, fps: int, bitrate: int, keyframe_interval: int, profile=None) -> list:
+    """A real time H.264 test pattern with an access unit delimiter in front of every frame."""
+
+    width, height = size
+    profile = ["-profile:v", profile] if profile else []
+
+    return [
+        "ffmpeg",
+        "-loglevel", "warning",
+        "-re",
+        "-f", "lavfi",
+        "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+        "-c:v", "libx264",
+        "-preset", "ultrafast",
+        "-tune", "zerolatency",
+        "-pix_fmt", "yuv420p",
+        *profile,
+        "-g", str(keyframe_interval),
+        "-b:v", str(bitrate),
+        "-x264-params", "aud=1",
+        "-flush_packets", "1",
+        "-f", "h264",
+        "-"
+    ]
+
+def sink_command(rtsp_url: str) -> list:
+    """Accept one published stream and write it to stdout without buffering."""
+
+    return [
+        "ffmpeg",
+        "-loglevel", "warning",
+        "-rtsp_flags", "listen",
+        "-fflags", "nobuffer",
+        "-flags", "low_delay",
+        "-i", rtsp_url,
+        "-c", "copy",
+        "-flush_packets", "1",
+        "-f", "h264",
+        "-"
+    ]
+
+def free_port() -> int:
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def children_cpu() -> float:
+    """CPU seconds used by child processes that have exited and been waited for."""
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+# --- Source and sink ---
+
+class SyntheticSource(threading.Thread):
+    """Runs the source encoder and calls on_frame(frame, keyframe) for every access unit it produces."""
+
+    def __init__(self, on_frame, size, fps, bitrate, keyframe_interval, profile=None):
+
+        super().__init__(name="source", daemon=True)
+        self.on_frame = on_frame
+        self.command = source_command(size, fps, bitrate, keyframe_interval, profile)
+        self.frames = 0
+        self.process = None
+
+    def start(self):
+
+        self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        super().start()
+
+    def stop(self):
+
+        self.process.terminate()
+        self.process.wait()
+        self.join()
+
+    def run(self):
+
+        buffer = b""
+
+        while True:
+
+            chunk = self.process.stdout.read1(65536)
+            if not chunk:
+                break
+
+            buffer += chunk
+
+            # A frame is complete once the delimiter of the next one has arrived
+            while True:
+                end = buffer.find(AUD, 1)
+                if end == -1:
+                    break
+
+                frame, buffer = buffer[:end], buffer[end:]
+                keyframe = any(nal and nal[0] & 0x1f == 5 for _, nal in nal_units(frame))
+                self.on_frame(frame, keyframe)
+                self.frames += 1
+
+class RtspSink(threading.Thread):
+    """Receives one stream and records (sequence, capture time, receive time) for every frame's telemetry."""
+
+    def __init__(self, rtsp_url: str):
+
+        super().__init__(name="sink", daemon=True)
+        self.rtsp_url = rtsp_url
+        self.records = []
+        self.process = None
+
+    def start(self):
+
+        self.process = subprocess.Popen(sink_command(self.rtsp_url), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        super().start()
+
+    def stop(self, timeout=10):
+
+        try:
+            self.process.wait(timeout)
+
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            self.process.wait()
+
+        self.join()
+
+    def run(self):
+
+        buffer = b""
+
+        while True:
+
+            chunk = self.process.stdout.read1(65536)
+            received = time.time()
+
+            if not chunk:
+                break
+
+            buffer += chunk
+
+            # Only complete NAL units, the last one may still be arriving
+            cut = buffer.rfind(b"\x00\x00\x01")
+            if cut <= 0:
+                continue
+
+            complete, buffer = buffer[:cut], buffer[cut:]
+
+            for record in extract_telemetry(complete):
+                self.records.append((record["sequence"], record["capture_time"], received))
+
+# --- Reporting ---
+
+def percentile(values: list, p: float):
+
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def stream_report(sink: RtspSink, sent: int, duration: float, target_fps: float, cpu: dict, latency=True) -> dict:
+
+    sequences = {sequence for sequence, _, _ in sink.records}
+    report = {
+        "frames": len(sequences),
+        "lost": max(0, sent - len(sequences)),
+        "fps": round(len(sequences) / duration, 2) if duration else None,
+        "target_fps": round(target_fps, 2),
+        "cpu_percent": {name: round(seconds / duration * 100, 1) for name, seconds in cpu.items()},
+    }
+
+    if latency:
+        latencies = [(received - captured) * 1000 for _, captured, received in sink.records]
+        report["latency_ms"] = {f"p{p}": round(percentile(latencies, p), 1) if latencies else None for p in (50, 90, 99)}
+        report["latency_ms"]["max"] = round(max(latencies), 1) if latencies else None
+
+    return report
+
+def print_report(results: dict, baseline=None):
+
+    for stream, r in results.items():
+
+        latency = r.get("latency_ms")
+        line = f"{stream:<9} {r['frames']:>6} frames  {r['fps']:>6} / {r['target_fps']} fps  {r['lost']:>4} lost"
+
+        if latency:
+            line += f"  latency p50 {latency['p50']} p90 {latency['p90']} p99 {latency['p99']} max {latency['max']} ms"
+
+        print(line)
+        print(f"{'':<9} cpu " + ", ".join(f"{name} {value}%" for name, value in r["cpu_percent"].items()))
+
+        before = (baseline or {}).get(stream)
+        if before:
+            delta = f"{'':<9} vs baseline {r['fps'] - before['fps']:+.2f} fps"
+            if latency and before.get("latency_ms") and latency["p50"] is not None and before["latency_ms"]["p50"] is not None:
+                delta += f", p50 {latency['p50'] - before['latency_ms']['p50']:+.1f} ms, p99 {latency['p99'] - before['latency_ms']['p99']:+.1f} ms"
+            print(delta)
+
+# --- Benchmark ---
+
+def run_live(args, store: SegmentStore) -> dict:
+    """Stream the synthetic source live for args.duration seconds, recording it into the store on the side."""
+
+    url = f"rtsp://127.0.0.1:{free_port()}/live"
+    sink = RtspSink(url)
+    sink.start()
+    time.sleep(args.sink_delay)
+
+    camera.settings["live_rtsp_url"] = url
+    output = camera.create_ffmpeg_output()
+    segment_output = SegmentedOutput(store)
+
+    # Live mode also keeps a local consumer attached (the pre-event buffer), the
+    # segment output stands in for it and provides the footage for backfill
+    fanout = OutputFanout()
+    fanout.annotate = FrameTelemetry()
+    # Described the way the encoder does it as it starts, outputs that mux in process need it
+    fanout._add_stream("video", "h264", width=args.size[0], height=args.size[1])
+    fanout.attach(output)
+    fanout.attach(segment_output, passive=True)
+
+    encoder = camera.encoder_settings()
+    source = SyntheticSource(fanout.outputframe, args.size, args.fps, args.bitrate, encoder["keyframe_interval"], encoder["profile"])
+    cpu = {}
+
+    start, python_start, children_start = time.monotonic(), time.process_time(), children_cpu()
+    source.start()
+    time.sleep(args.duration)
+
+    source.stop()
+    cpu["source"] = children_cpu() - children_start
+    duration = time.monotonic() - start
+    cpu["python"] = time.process_time() - python_start
+
+    stats = fanout.stats(output)
+    fanout.detach(segment_output)
+
+    mark = children_cpu()
+    fanout.detach(output)
+    cpu["publisher"] = children_cpu() - mark
+
+    mark = children_cpu()
+    sink.stop()
+    cpu["sink"] = children_cpu() - mark
+
+    report = stream_report(sink, source.frames, duration, args.fps, cpu)
+    report["write_ms"] = round(stats["write_time"] / stats["frames"] * 1000, 3) if stats and stats["frames"] else None
+    return report
+
+def run_backfill(args, store: SegmentStore) -> dict:
+    """Push the recorded footage with the backfill command and measure how fast it drains."""
+
+    entries = store.entries()
+    if not entries:
+        raise RuntimeError("Nothing was recorded for the backfill run")
+
+    url = f"rtsp://127.0.0.1:{free_port()}/backfill"
+    sink = RtspSink(url)
+    sink.start()
+    time.sleep(args.sink_delay)
+
+    uploader = BackfillUploader(store, url, rate=camera.BACKFILL_RATE)
+    entry = entries[0]
+    sent = entry["frames"]
+    recorded = entry["duration"] or args.duration
+
+    start, children_start = time.monotonic(), children_cpu()
+    if not uploader.upload_segment(entry):
+        raise RuntimeError("Backfill upload failed")
+
+    duration = time.monotonic() - start
+    cpu = {"publisher": children_cpu() - children_start}
+
+    mark = children_cpu()
+    sink.stop()
+    cpu["sink"] = children_cpu() - mark
+
+    # Backfilled footage is old by design, only the drain rate matters
+    report = stream_report(sink, sent, duration, sent / recorded * camera.BACKFILL_RATE, cpu, latency=False)
+    report["speed"] = round(recorded / duration, 2)
+    return report
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of live streaming")
+    parser.add_argument("--size", type=lambda s: tuple(int(x) for x in s.split("x")), default=camera.settings["main_size"], help="frame size, WxH")
+    parser.add_argument("--fps", type=int, default=camera.settings["frame_rate"])
+    parser.add_argument("--bitrate", type=int, default=camera.settings["bitrate"])
+    parser.add_argument("--keyframe-interval", type=int, default=camera.settings["keyframe_interval"])
+    parser.add_argument("--profile", choices=LATENCY_PROFILES, default=camera.settings["latency_profile"], help="latency profile")
+    parser.add_argument("--backend", choices=RTSP_BACKENDS, default=camera.settings["rtsp_backend"], help="live RTSP output backend")
+    parser.add_argument("--sink-delay", type=float, default=1.0, help="seconds to give the sink to start listening")
+    parser.add_argument("--no-backfill", action="store_true", help="skip the backfill stream")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the pipeline's own logs")
+    args = parser.parse_args()
+
+    # camera already configured the root logger on import
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s", force=True)
+    camera.settings.update(main_size=args.size, frame_rate=args.fps, bitrate=args.bitrate, latency_profile=args.profile,
+                           keyframe_interval=args.keyframe_interval, rtsp_backend=args.backend)
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        # One segment holds the whole run, so backfill pushes it in a single upload
+        store = SegmentStore(tmp, segment_seconds=args.duration + 60, max_segments=2)
+        results["live"] = run_live(args, store)
+
+        if not args.no_backfill:
+            results["backfill"] = run_backfill(args, store)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            settings = {"size": args.size, "fps": args.fps, "bitrate": args.bitrate, "keyframe_interval": args.keyframe_interval, "profile": args.profile, "backend": args.backend}
+            json.dump({"commit": git_commit(), "settings": settings, "results": results}, f, indent=2)
+
+    return 0 if results["live"]["frames"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,28 @@
-import time, errno, sys, subprocess, signal, os, gc, psutil, socket, logging
+import time, errno, sys, subprocess, signal, os, gc, threading, logging
+from urllib.parse import urlsplit, urlunsplit
 from picamera2 import Picamera2
-from picamera2.outputs import FfmpegOutput
-from picamera2.encoders import H264Encoder
+from picamera2.outputs import Output, FfmpegOutput
+from segment_store import SegmentStore, SegmentedOutput
+from backfill import BackfillUploader
+from retention import TieredRetention
+from session import CameraSession
+from connectivity import ConnectivityMonitor
+from event_buffer import PreEventBuffer
+from control import ControlServer
+from lores import LoresReader
+from adaptive import AdaptiveController
+from motion import MotionGate
+from snapshot import SnapshotCache, encode_yuv420, encode_rgbx
+from framering import FrameRing
+from rtsp_output import PyavRtspOutput
+from watchdog import FrameWatchdog, sd_notify
+from logbuffer import BufferedLogging, LogLimiter
+from memory import MemoryGovernor, read_meminfo
+from storage import StorageGovernor
+from telemetry import FrameTelemetry, LocationSource
+from config import ConfigReloader, CONFIG_FILE, CONTROL_KEYS, ENCODER_KEYS, CONFIGURE_KEYS, RESTART_KEYS
+from metrics import registry
+from supervisor import Supervisor, INIT, LIVE, OFFLINE, BACKFILL, REINIT, FATAL
 
 # Configure top-level logger using Python's built-in logger.
 logging.basicConfig(
@@ -11,6 +32,199 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Camera configuration ---
+# Camera indices to run, one pipeline each. With more than one camera, every
+# camera streams to its own RTSP path and keeps its own offline buffer, clips
+# directory and location file, see per_camera().
+CAMERAS = [0]
+
+# Device checked for processes holding the camera when it reports EBUSY
+CAMERA_DEVICES = {0: "/dev/video0"}
+
+# --- Stream configuration ---
+LIVE_RTSP_URL = "rtsp://192.168.1.8:8554/test"
+
+# Latitude on the first line, longitude on the second. Re-read when it changes.
+LOCATION_FILE = "location.txt"
+
+# "dual" encodes a high resolution main stream for RTSP and exposes a small
+# YUV lores stream to local analytics. "single" is the original 640x640 stream.
+STREAM_MODE = "dual"
+MAIN_SIZE = (1280, 720)
+MAIN_FRAME_RATE = 30
+MAIN_BITRATE = 2_500_000
+LORES_SIZE = (320, 240)
+LORES_FRAME_RATE = 5
+
+# --- Adaptive quality configuration ---
+# Rungs the adaptive controller steps through in dual mode, best first. The top
+# rung is replaced by the configured main stream settings, see adaptive_ladder().
+ADAPTIVE_ENABLED = True
+ADAPTIVE_LADDER = [
+    {"size": MAIN_SIZE, "fps": MAIN_FRAME_RATE, "bitrate": MAIN_BITRATE},
+    {"size": (1280, 720), "fps": 20, "bitrate": 1_500_000},
+    {"size": (960, 540), "fps": 15, "bitrate": 1_000_000},
+    {"size": (640, 360), "fps": 15, "bitrate": 500_000},
+    {"size": (640, 360), "fps": 10, "bitrate": 250_000},
+]
+
+# --- Motion gating configuration ---
+# In dual mode the lores stream is checked for motion, and after MOTION_HOLD
+# seconds of a static scene the main stream drops to a keep-alive frame rate and
+# bitrate, which also shrinks what the offline buffer has to upload later. Full
+# quality comes back after MOTION_TRIGGER_FRAMES lores frames with motion.
+MOTION_GATING = False
+MOTION_THRESHOLD = 0.01         # share of the frame that has to change
+MOTION_PIXEL_DELTA = 12         # mean luma change of a 4x4 tile that counts as changed
+MOTION_HOLD = 30
+MOTION_TRIGGER_FRAMES = 2
+KEEPALIVE_FRAME_RATE = 2
+KEEPALIVE_BITRATE = 150_000
+
+# --- Offline buffer configuration ---
+OFFLINE_BUFFER_DIR = "offline_buffer"
+OFFLINE_SEGMENT_SECONDS = 10
+OFFLINE_RETENTION = 400
+
+# --- Tiered retention ---
+# With TIERED_RETENTION the newest TIER_FULL_SECONDS of an outage stay at full
+# quality and older segments are re-encoded in the background by a niced ffmpeg
+# to TIER_SIZE at TIER_FRAME_RATE and TIER_BITRATE. The buffer is then bounded by
+# OFFLINE_BUDGET_MB instead, up to TIER_MAX_RETENTION seconds of footage, so the
+# same card covers hours instead of minutes.
+TIERED_RETENTION = False
+TIER_FULL_SECONDS = 300
+TIER_SIZE = (640, 360)
+TIER_FRAME_RATE = 10
+TIER_BITRATE = 300_000
+TIER_NICE = 19
+TIER_MAX_RETENTION = 6 * 3600
+OFFLINE_BUDGET_MB = 512
+
+# Segments and newly attached outputs can only start on a keyframe, so the
+# keyframe interval bounds both the segment granularity and the switch gap.
+KEYFRAME_INTERVAL = 30
+
+# --- Storage configuration ---
+# Our own recordings are evicted below STORAGE_LOW_MB free until STORAGE_HIGH_MB
+# is free again. SPILL_MB of RAM holds offline footage while the disk is full.
+STORAGE_LOW_MB = 200
+STORAGE_HIGH_MB = 400
+SPILL_MB = 16
+
+# --- Event clip configuration ---
+CLIPS_DIR = "clips"
+PRE_EVENT_SECONDS = 10
+POST_EVENT_SECONDS = 10
+
+# --- Snapshot configuration ---
+# Stills for the /snapshot endpoint are encoded on request, at most every
+# SNAPSHOT_INTERVAL seconds. In dual mode they come from the lores frames the
+# reader already has, "main" captures a full size frame instead.
+SNAPSHOT_STREAM = "lores"
+SNAPSHOT_INTERVAL = 5
+SNAPSHOT_QUALITY = 80
+
+# --- Frame ring configuration ---
+# Lores frames are published to local processes through a shared memory ring
+# (/dev/shm/eleeye_frames, one per camera), see framering.FrameRingReader.
+FRAME_RING = True
+FRAME_RING_NAME = "eleeye_frames"
+FRAME_RING_SLOTS = 8
+
+# --- Live output backend ---
+# "ffmpeg" pipes the encoded stream into an ffmpeg child process that pushes it
+# to the RTSP server. "pyav" muxes and sends it from inside this process with
+# PyAV and reconnects by itself, which saves the extra process and a copy of
+# every frame. Without PyAV installed it falls back to ffmpeg.
+RTSP_BACKEND = "ffmpeg"
+
+# --- Low latency profile ---
+# With the "low_latency" latency_profile the encoder uses the baseline profile,
+# so it never holds frames back for B-frames, and keyframes come at least every
+# LOW_LATENCY_KEYFRAME_INTERVAL frames. ffmpeg starts forwarding the stream
+# without probing it first and doesn't buffer it in the demuxer or muxer.
+LOW_LATENCY_KEYFRAME_INTERVAL = 15
+LOW_LATENCY_FFMPEG_INPUT = ["-fflags", "nobuffer", "-probesize", "32", "-analyzeduration", "0"]
+LOW_LATENCY_FFMPEG_OUTPUT = "-flush_packets 1 -muxdelay 0"
+
+# --- Watchdog configuration ---
+# The mode loops restart a stage that has made no progress for its deadline:
+# the camera or encoder after WATCHDOG_FRAME_DEADLINE seconds without a frame,
+# the live output after WATCHDOG_OUTPUT_DEADLINE seconds without taking one.
+# Under systemd WATCHDOG=1 is only sent while every camera has frames flowing,
+# so WatchdogSec should leave room for a few recovery attempts (60s or so).
+WATCHDOG_FRAME_DEADLINE = 5
+WATCHDOG_OUTPUT_DEADLINE = 10
+
+# --- Logging configuration ---
+# With LOG_BUFFERED, log calls only queue the record. A listener thread keeps
+# the last LOG_RING_SIZE records in memory, drops repeats and messages beyond
+# LOG_RATE per second (after a burst of LOG_BURST) per module, and writes the
+# rest every LOG_FLUSH_INTERVAL seconds, to stderr or LOG_FILE. The ring is
+# written to LOG_DUMP_DIR on a crash or through the dump_logs command.
+LOG_BUFFERED = True
+LOG_FILE = None
+LOG_RING_SIZE = 1000
+LOG_RATE = 5
+LOG_BURST = 20
+LOG_REPEAT_WINDOW = 30
+LOG_FLUSH_INTERVAL = 5
+LOG_DUMP_DIR = "logs"
+
+# --- Backfill configuration ---
+BACKFILL_RTSP_URL = "rtsp://192.168.1.8:8554/stream"
+BACKFILL_RATE = 3.0 # upload speed as a multiple of real time
+BACKFILL_MAX_ATTEMPTS = 5 # failed uploads before a segment is quarantined
+
+# --- Runtime settings ---
+# The stream settings camera_config.json may override, with the constants above
+# as defaults. The file is read at start and again on SIGHUP or the reload_config
+# control command, and every change is applied through the cheapest path.
+settings = {
+    "live_rtsp_url": LIVE_RTSP_URL,
+    "backfill_rtsp_url": BACKFILL_RTSP_URL,
+    "stream_mode": STREAM_MODE,
+    "main_size": MAIN_SIZE,
+    "frame_rate": MAIN_FRAME_RATE,
+    "bitrate": MAIN_BITRATE,
+    "encoder": "h264",
+    "keyframe_interval": KEYFRAME_INTERVAL,
+    "latency_profile": "standard",
+    "rtsp_backend": RTSP_BACKEND,
+}
+
+# --- Metrics ---
+MODE_TRANSITIONS = registry.counter("eleeye_mode_transitions_total", "Switches between live and offline mode")
+FFMPEG_RESTARTS = registry.counter("eleeye_ffmpeg_restarts_total", "FFmpeg output restarts from restart_ffmpeg_output")
+PIPELINE_RESTARTS = registry.counter("eleeye_pipeline_restarts_total", "Camera pipeline restarts from restart_recording")
+RECOVERIES = registry.counter("eleeye_recoveries_total", "Recovery attempts in the main loop by error")
+
+# --- Camera naming ---
+
+def camera_name(camera_num: int) -> str:
+    return f"cam{camera_num}"
+
+def per_camera(name: str, camera_num: int) -> str:
+    """
+    Return the RTSP URL, directory or file name one camera uses. A single camera
+    keeps the configured names, with several each gets a _cam<N> suffix, for
+    example rtsp://host:8554/test_cam1 or offline_buffer_cam1. A URL without a
+    path gets /cam<N>.
+    """
+
+    if len(CAMERAS) == 1:
+        return name
+
+    # Only the path of a URL is changed, the host may well contain dots
+    url = urlsplit(name)
+    if url.scheme and url.netloc:
+        path = url.path.rstrip("/")
+        return urlunsplit(url._replace(path=f"{path}_{camera_name(camera_num)}" if path else f"/{camera_name(camera_num)}"))
+
+    root, ext = os.path.splitext(name)
+    return f"{root}_{camera_name(camera_num)}{ext}"
+
 # --- FFmpeg error handler callback ---
 
 def ffmpeg_error_handler(error):
@@ -31,19 +245,6 @@ def ffmpeg_error_handler(error):
 
 # --- Recovery functions ---
 
-def check_connection(host="0.0.0.0", port=54, timeout=3) -> bool:
-    """Returns True if an internet connection is available,
-    checks if theres a connection on port 54, which is the default
-    port using for the RTSP stream
-    """
-
-    try:
-        socket.create_connection((host, port), timeout=timeout)
-        return True
-    
-    except OSError:
-        return False
-
 def kill_conflicting_processes(device='/dev/video0'):
 
     """Find and kill any processes using the specified camera device."""
@@ -87,450 +288,893 @@ def kill_conflicting_processes(device='/dev/video0'):
             logger.warning(f"Permission denied trying to kill conflicting PID {pid_str}")
 
 def free_memory():
-    """Attempt to free up memory by forcing garbage collection and dropping caches."""
+    """
+    Release memory held by this process after an allocation has failed. The page
+    cache is left alone: dropping it throws away pages our own segment writes
+    still need and can stall for seconds. Pressure is handled before allocations
+    fail by the memory governor.
+    """
 
     logger.info("[Recovery] Attempting to free memory")
     collected = gc.collect()
 
     logger.info(f"[Recovery] Garbage collection complete: collected {collected} objects")
 
-    mem = psutil.virtual_memory()
-    logger.info(f"[Recovery] Memory before cache drop: {mem.percent}% used, {mem.available / (1024 * 1024):.2f} MB available")
-
-    try:
-        os.system("sync")
-        os.system("echo 3 | sudo tee /proc/sys/vm/drop_caches")
-        logger.info("[Recovery] Successfully dropped file system caches")
+    meminfo = read_meminfo()
+    logger.info(
+        f"[Recovery] Memory available: {meminfo.get('MemAvailable', 0) / 1024:.2f} MB, "
+        f"CMA free: {meminfo.get('CmaFree', 0) / 1024:.2f} MB"
+    )
 
-    except Exception as e:
-        logger.info("[Recovery] Failed to drop caches")
+def handle_disk_full(storage: StorageGovernor, e):
+    """
+    Make room right away instead of waiting for the governor's next pass. The
+    camera keeps running, the segmented output spills to RAM until space is back.
+    """
 
-    mem = psutil.virtual_memory()
-    logger.info(f"Memory after cache drop: {mem.percent}% used, {mem.available / (1024 * 1024):.2f} MB available")
-    time.sleep(2)
+    logger.error(f"[Recovery] Disk full: {e}")
 
-def handle_disk_full(picam: Picamera2, ffmpeg_output: FfmpegOutput, e):
-    logger.info("[Recovery] Attempting to clear disk")
     try:
-
-        try:
-            picam.stop_recording()
-
-        except Exception:
-            pass
-
-        try:
-            picam.stop()
-
-        except Exception:
-            pass
-
-        try:
-            ffmpeg_output.stop()
-            
-        except Exception:
-            pass
-
-        logger.info("[Recovery] Recording stopped due to full disk. Attempting to free disk space")
-        while True:
-            disk_usage = psutil.disk_usage("/")
-            free_mb = disk_usage.free() / (1024 * 1024)
-
-            logger.info(f"[Recovery] Free disk space: {free_mb:.2f} MB")
-
-            if free_mb > 100: break
-
-            time.sleep(2)
-
-        logger.info("[Recovery] Sufficient disk space available. Restarting camera pipeline")
-        restart_recording(picam, ffmpeg_output)
+        storage.step()
 
     except Exception as e:
         logger.error(f"[Recovery] Exception while handling disk full: {e}")
 
-def handle_file_overflow(picam: Picamera2, ffmpeg_output: FfmpegOutput, e):
+def handle_file_overflow(session: CameraSession, e):
 
     logger.error(f"[Recovery] File table overflow: {e}")
 
     try:
         logger.info("[Recovery] Restarting camera pipeline to clean up file descriptors")
-        restart_recording(picam, ffmpeg_output)
+        restart_recording(session)
 
     except Exception as e:
         logger.error(f"[Recovery] Exception while handling file table overflow: {e}")
 
-# --- Location metadata functions ---
-def read_location_metadata(file_path: str):
+# --- FFmpeg Output Creation ---
+
+class LowLatencyFfmpegOutput(FfmpegOutput):
     """
-    Read latitude and longitude from the configuration file.
-    The file should contain latitude on the first line and longitude on the second.
+    FfmpegOutput with options for how ffmpeg reads the encoded stream. Picamera2
+    appends the output string after "-i -", so input options need their own
+    command line. Otherwise the same as FfmpegOutput, without audio.
     """
-    try:
-        with open(file_path, 'r') as f:
 
-            lines = f.readlines()
+    def __init__(self, output_filename: str, input_options: list):
 
-            if len(lines) != 2:
-                raise ValueError("Configuration file must contain exactly two lines (latitude and longitude)")
-            
-            latitude = float(lines[0].strip())
-            longitude = float(lines[1].strip())
-            logger.info(f"Location metadata read: latitude={latitude}, longitude={longitude}")
+        super().__init__(output_filename, audio=False)
+        self.input_options = input_options
 
-            return latitude, longitude
-        
-    except Exception as e:
-        logger.error(f"Failed to read configuration file: {e}")
-        return None
+    def start(self):
 
-# --- FFmpeg Output Creation ---
+        # Installed with picamera2, which uses it the same way
+        import prctl
 
-def create_ffmpeg_output() -> FfmpegOutput:
+        command = (
+            ["ffmpeg", "-loglevel", "warning", "-y"] + self.input_options +
+            ["-use_wallclock_as_timestamps", "1", "-thread_queue_size", "64", "-i", "-", "-c:v", "copy"] +
+            self.output_filename.split()
+        )
+        self.ffmpeg = subprocess.Popen(command, stdin=subprocess.PIPE, preexec_fn=lambda: prctl.set_pdeathsig(signal.SIGKILL))
+        Output.start(self)
+
+def create_ffmpeg_output(rtsp_url=None) -> FfmpegOutput:
     """
-    Create an FfmpegOutput for live RTSP streaming.
+    Create the output for live RTSP streaming, to the configured URL unless
+    another one is given, with the selected backend (see RTSP_BACKEND). The location and capture time travel inside the H.264
+    stream as SEI messages (see telemetry.py), so the URL stays fixed and a
+    location change doesn't need a new ffmpeg process.
     """
 
-    BASE_URL = "rtsp://192.168.1.8:8554/test"
+    rtsp_url = rtsp_url or settings["live_rtsp_url"]
 
-    # Read location metadata from the file
-    lat, lon = read_location_metadata("location.txt")
+    if settings["rtsp_backend"] == "pyav":
+        try:
+            ffmpeg_output = PyavRtspOutput(rtsp_url)
+            ffmpeg_output.error_callback = ffmpeg_error_handler
+            return ffmpeg_output
+
+        except ImportError as e:
+            logger.warning(f"[Output] PyAV is not available ({e}), streaming through ffmpeg")
+
+    # Muxing in process has no pipe or demuxer to buffer in, so only ffmpeg needs the low latency options
+    if settings["latency_profile"] == "low_latency":
+        ffmpeg_output = LowLatencyFfmpegOutput(f"{LOW_LATENCY_FFMPEG_OUTPUT} -rtsp_transport tcp -f rtsp {rtsp_url}", LOW_LATENCY_FFMPEG_INPUT)
 
-    if lat and lon:
-        RTSP_URL = f"{BASE_URL}?lat={lat}&lon={lon}"
     else:
-        RTSP_URL = BASE_URL
+        ffmpeg_output = FfmpegOutput(f"-rtsp_transport tcp -f rtsp {rtsp_url}", audio=False)
 
-    ffmpeg_command = f"-rtsp_transport tcp -f rtsp {RTSP_URL}"
-    ffmpeg_output = FfmpegOutput(ffmpeg_command, audio=False)
     ffmpeg_output.error_callback = ffmpeg_error_handler
     return ffmpeg_output
 
+def encoder_settings() -> dict:
+    """The keyframe interval and H.264 profile for the selected latency profile."""
+
+    if settings["latency_profile"] == "low_latency":
+        return {"keyframe_interval": min(settings["keyframe_interval"], LOW_LATENCY_KEYFRAME_INTERVAL), "profile": "baseline"}
 
-def create_ffmpeg_output_file(file_path: str) -> FfmpegOutput:
+    return {"keyframe_interval": settings["keyframe_interval"], "profile": None}
+
+
+def create_segment_output(store: SegmentStore) -> SegmentedOutput:
     """
-    Create an FfmpegOutput for offline file recording.
-    Location metadata is not needed in this mode.
-    Instead, after recording, we will push the file to MediaMTX RTSP server
-    which has this location metadata attached via query parameters
+    Create a SegmentedOutput for offline recording into the segment ring. The
+    segments carry the same SEI telemetry as the live stream, so backfilled
+    footage keeps its original capture time and location.
     """
-    ffmpeg_command = f"-f h264 -y {file_path}"
-    ffmpeg_output = FfmpegOutput(ffmpeg_command, audio=False)
-    return ffmpeg_output
+    return SegmentedOutput(store, spill_bytes=SPILL_MB * 1024 * 1024)
 
 # --- Camera Initialization Functions ---
 
-def start_camera(max_tries=3, config_params=None) -> tuple[Picamera2, FfmpegOutput]:
+def create_camera_configuration(picamera: Picamera2, stream_mode=None, main_size=None, frame_rate=None, buffer_count=None) -> dict:
+    """
+    Build the video configuration for the selected stream mode. In dual mode the
+    H.264 encoder only sees the main stream, the lores stream stays raw YUV420 so
+    local consumers can read it without decoding anything. main_size and frame_rate
+    override the configured settings, for example when the adaptive controller steps down.
+    buffer_count overrides Picamera2's default when the memory governor sheds buffers.
+    """
+
+    stream_mode = stream_mode or settings["stream_mode"]
+    extra = {"buffer_count": buffer_count} if buffer_count else {}
+
+    if stream_mode == "dual":
+        return picamera.create_video_configuration(
+            main={"size": main_size or settings["main_size"]},
+            lores={"size": LORES_SIZE, "format": "YUV420"},
+            encode="main",
+            controls={"FrameRate": frame_rate or settings["frame_rate"]},
+            **extra
+        )
 
-    if max_tries == 0:
-        logger.critical("[Recovery]: Could not repair camera pipeline. Shutting down")
-        sys.exit(1)
+    return picamera.create_video_configuration(
+        main={"size": (640, 640)},
+        encode="main",
+        controls={"FrameRate": frame_rate or settings["frame_rate"]},
+        **extra
+    )
+
+def adaptive_ladder() -> list:
+    """The adaptive ladder with the configured main stream settings as its top rung."""
+
+    top = {"size": settings["main_size"], "fps": settings["frame_rate"], "bitrate": settings["bitrate"]}
+    return [top] + ADAPTIVE_LADDER[1:]
+
+def start_camera(config_params=None, camera_num=0) -> tuple[Picamera2, FfmpegOutput]:
+    """
+    Open and configure the camera once. Problems that can be fixed on the spot
+    (an unsupported configuration, a buffer allocation failure) are worked around
+    here, everything else is raised for the supervisor to classify and retry.
+    The camera is closed again on failure so the next attempt can reopen it.
+    """
+
+    try:
+        picamera = Picamera2(camera_num)
+
+    except IndexError as ie:
+        raise OSError(errno.ENODEV, "Camera not found") from ie
 
     try:
-        try:
-            picamera = Picamera2()
-        
-        except IndexError as ie:
-            raise OSError(errno.ENODEV, "Camera not found") from ie
-    
         if not config_params:
-            config_params = picamera.create_video_configuration(
-                encode="h264",
-                main={"size": (640, 640)},
-                controls={"FrameRate": 30}
-            )
+            config_params = create_camera_configuration(picamera)
 
-        picamera.configure(config_params)
-        ffmpeg_output = create_ffmpeg_output()
-        return picamera, ffmpeg_output
-    
-    except OSError as e:
-
-        # If the device is not recognized, this would be an irrecoverable 
-        # fatal error. The camera could have been damaged or removed when in 
-        # the production environment. To preserve the camera, the script is killed. 
-        if e.errno == errno.ENODEV:
-            logger.critical(f"[Camera initialization error]: {e}")
-            sys.exit(1)
-
-        # if, for whatever reason, another process is also using the camera device
-        # which is not supposed to happen, the conflicting process is killed so the 
-        # device is solely used for initialization and usage of the camera.
-        elif e.errno == errno.EBUSY:
-            logger.error(f"[Camera initialization error] Device or resource busy: {e}")
-            kill_conflicting_processes()
-            return start_camera(max_tries-1, config_params)
-        
-        # if the raspberry Pi runs out of memory during initialization, a free_memory 
-        # recovery function is run in an attempt to free some memory from the raspberry pi.
-        elif e.errno == errno.ENOMEM:
-            logger.error(f"[Camera initialization error] Out of memory: {e}")
-            free_memory()
-            return start_camera(max_tries-1, config_params)
-        
-        elif e.errno == errno.EINVAL:
-            video_config = Picamera2.create_video_configuration(encode="h264")
-            picamera.configure(video_config)
-
-        elif e.errno == errno.EIO:
-            logger.error(f"[Camera initialization error] I/O error while initializing: {e}")
-            time.sleep(2)
-            return start_camera(max_tries-1, config_params)
-        
-        else:
-            logger.critical(f"[Camera initialization error] Error: {e}")
-            return start_camera(max_tries-1, config_params)
-        
-    except RuntimeError as re:
+        try:
+            picamera.configure(config_params)
+
+        except OSError as e:
+
+            if e.errno != errno.EINVAL:
+                raise
 
-        runtime_error = str(re).lower()
+            # The sensor doesn't support the requested configuration, fall back to its default
+            logger.error(f"[Camera initialization error] Invalid configuration, using the default: {e}")
+            picamera.configure(picamera.create_video_configuration(encode="main"))
+
+        except RuntimeError as re:
+
+            if "buffer" not in str(re).lower():
+                raise
 
-        if "buffer" in runtime_error:
             logger.error("[Camera initialization error] Buffer related issue detected. Freeing memory and reducing framerate")
             free_memory()
             config_params["main"]["size"] = (640, 640)
             config_params["controls"]["FrameRate"] = 15
-            return start_camera(max_tries-1, config_params)
-        
-        else:
-            logger.critical(f"[Camera initialization error] Unrecoverable runtime error: {re}")
-            return start_camera(max_tries-1, config_params)
+            picamera.configure(config_params)
 
-def start_file_recording(file_path: str, max_tries=3, config_params=None) -> tuple[Picamera2, FfmpegOutput]:
-
-    if max_tries == 0:
-        logger.critical("[Recovery] Could not start file recording. Shutting down")
-        sys.exit(1)
+        ffmpeg_output = create_ffmpeg_output(per_camera(settings["live_rtsp_url"], camera_num))
+        return picamera, ffmpeg_output
 
-    try:
-        try:
-            picamera = Picamera2()
-        
-        except IndexError as ie:
-            raise OSError(errno.ENODEV, "Camera not found") from ie
-        
-        if not config_params:
-            config_params = picamera.create_video_configuration(
-                encode="h264",
-                main={"size": (640, 640)},
-                controls={"FrameRate": 30}
-            )
-            
-        picamera.configure(config_params)
-        file_output = create_ffmpeg_output_file(file_path)
-        return picamera, file_output
-    
-    except Exception as e:
-        logger.error(f"[File recording error]: {e}")
-        return start_file_recording(file_path, max_tries-1, config_params)
+    except Exception:
+        picamera.close()
+        raise
 
 # --- Mode Functions ---
 
-def live_mode(picam: Picamera2, ffmpeg_output: FfmpegOutput):
+def live_mode(session: CameraSession, ffmpeg_output: FfmpegOutput, connectivity: ConnectivityMonitor, on_tick=None, watchdog=None):
 
     logger.info("[Live mode] Starting live RTSP stream")
-    picam.start()
-    encoder = H264Encoder()
-    picam.start_recording(encoder, ffmpeg_output)
+    session.switch_to(ffmpeg_output)
+
+    if watchdog:
+        watchdog.arm()
 
     while True:
-        if not check_connection():
+        if not connectivity.online:
             logger.warning("[Live mode] Internet connection lost. Switching to offline mode")
-            picam.stop_recording()
-            picam.stop()
             break
+
+        if watchdog:
+            watchdog.check()
+
+        if on_tick:
+            on_tick()
+
         time.sleep(1)
 
-def offline_mode(picam: Picamera2, file_output: FfmpegOutput, file_path: str, offline_timeout=300):
+def offline_mode(session: CameraSession, segment_output: SegmentedOutput, store: SegmentStore, connectivity: ConnectivityMonitor, watchdog=None):
 
     start_time_val = time.time()
-    logger.info("[Offline Mode] Starting file recording mode")
+    logger.info("[Offline Mode] Starting segmented file recording mode")
 
-    picam.start()
-    encoder = H264Encoder()
-    picam.start_recording(encoder, file_output)
+    session.switch_to(segment_output)
+
+    if watchdog:
+        watchdog.arm()
 
     while True:
 
-        if check_connection():
+        if watchdog:
+            watchdog.check()
+
+        if connectivity.online:
             elapsed = time.time() - start_time_val
             logger.info(f"[Offline Mode] Internet returned after {elapsed:.2f} seconds")
-            picam.stop_recording()
-            picam.stop()
+            logger.info(f"[Offline Mode] {store.retained_seconds():.0f}s of buffered footage queued for backfill")
+            break
 
-            if elapsed < offline_timeout:
-                logger.info("[Offline Mode] Replaying buffered footage to RTSP stream")
-                stream_buffer_to_rtsp(file_path)
+        time.sleep(1)
 
-            else:
-                logger.info("[Offline Mode] Buffer exceeded timeout. Discarding stored footage")
+# --- Restart Functions ---
 
-                try:
-                    os.remove(file_path)
+def restart_recording(session: CameraSession):
 
-                except Exception as e:
-                    logger.error(f"[Offline Mode] Error deleting file: {e}")
-            break
+    logger.warning("[Recovery] Restarting camera pipeline")
+    PIPELINE_RESTARTS.inc()
+    session.restart()
 
-        if (time.time() - start_time_val) > offline_timeout:
+def restart_ffmpeg_output(session: CameraSession, ffmpeg_output: FfmpegOutput):
 
-            logger.info("[Offline Mode] Offline timeout reached. Stopping recording and discarding buffer")
-            picam.stop_recording()
-            picam.stop()
+    logger.warning("[Recovery] Restarting FFmpeg process")
+    FFMPEG_RESTARTS.inc()
 
-            try:
-                os.remove(file_path)
+    session.fanout.detach(ffmpeg_output)
 
-            except Exception as e:
-                logger.error(f"[Offline Mode] Error deleting file: {e}")
+    time.sleep(2)
 
-            break
+    # FfmpegOutput never clears this flag by itself once its pipe has broken
+    ffmpeg_output.output_broken = False
+    session.fanout.attach(ffmpeg_output)
 
-        time.sleep(1)
+    logger.info("[Recovery] FFmpeg restarted successfully")
 
-def stream_buffer_to_rtsp(file_path: str):
+# --- Session lifecycle ---
 
+def open_session(event_buffer: PreEventBuffer, connectivity: ConnectivityMonitor, telemetry: FrameTelemetry, camera_num=0, frame_ring=None) -> tuple[CameraSession, FfmpegOutput, list]:
     """
-    Function that streams the buffer video accumulated in the offline mode, back to the RTSP
-    URL (MediaMTX), with location query parameters attached. 
+    Start the camera and encoder, and the workers that read from them in dual mode.
+    The frame ring outlives the session, so local readers keep their mapping
+    across camera restarts.
     """
 
-    logger.info(f"[Stream buffer] Streaming stored file {file_path} to RTSP")
+    dual = settings["stream_mode"] == "dual"
+    picam, ffmpeg_output = start_camera(camera_num=camera_num)
+    session, started = None, []
+
+    # Whatever fails after the camera is open must close it again, or every
+    # retry finds the camera still held and fails with EBUSY
+    try:
+        session = CameraSession(
+            picam,
+            bitrate=settings["bitrate"] if dual else None,
+            encoder_name=settings["encoder"],
+            **encoder_settings()
+        )
+        session.fanout.annotate = telemetry
+        session.pin(event_buffer)
+        session.start()
+
+        adaptive = None
+
+        def profile() -> tuple:
+            rung = adaptive.ladder[adaptive.rung] if adaptive else {}
+            return rung.get("size"), rung.get("fps")
+
+        # Sheds frame buffers under memory pressure and hands the rest to the adaptive
+        # controller, so the configuration it rebuilds keeps the current rung
+        governor = MemoryGovernor(
+            session,
+            lambda: create_camera_configuration(picam, main_size=profile()[0], frame_rate=profile()[1], buffer_count=governor.buffer_count)
+        )
+        register_memory_metrics(governor, camera_name(camera_num) if len(CAMERAS) > 1 else None)
+        workers = [governor]
+
+        # Catches a camera, encoder or live output that stops without raising anything
+        workers.append(FrameWatchdog(session, ffmpeg_output, frame_deadline=WATCHDOG_FRAME_DEADLINE, output_deadline=WATCHDOG_OUTPUT_DEADLINE))
+
+        if dual:
+            workers.append(LoresReader(picam, rate=LORES_FRAME_RATE))
+
+            if frame_ring is not None:
+                workers[-1].subscribe(frame_ring)
+
+        if dual and ADAPTIVE_ENABLED:
+            adaptive = AdaptiveController(
+                session,
+                ffmpeg_output,
+                lambda size, fps: create_camera_configuration(picam, main_size=size, frame_rate=fps, buffer_count=governor.buffer_count),
+                ladder=adaptive_ladder(),
+                connectivity=connectivity,
+                pressure=governor
+            )
+            workers.append(adaptive)
+
+        if dual and MOTION_GATING:
+            gate = MotionGate(
+                session,
+                lambda: adaptive.ladder[adaptive.rung] if adaptive else {"fps": settings["frame_rate"], "bitrate": settings["bitrate"]},
+                LORES_SIZE,
+                threshold=MOTION_THRESHOLD,
+                pixel_delta=MOTION_PIXEL_DELTA,
+                hold=MOTION_HOLD,
+                trigger_frames=MOTION_TRIGGER_FRAMES,
+                keepalive_fps=KEEPALIVE_FRAME_RATE,
+                keepalive_bitrate=KEEPALIVE_BITRATE
+            )
+            find_worker(workers, LoresReader).subscribe(gate)
+            register_motion_metrics(gate, camera_name(camera_num) if len(CAMERAS) > 1 else None)
 
-    command = [
-        "ffmpeg",
-        "-re",
-        "-i", file_path,
-        "-c", "copy",
-        "-rtsp_transport", "tcp",
-        "-f", "rtsp",
-        "rtsp://192.168.1.8:8554/stream"
-    ]
+            if adaptive is not None:
+                adaptive.motion = gate
+
+        for worker in workers:
+            worker.start()
+            started.append(worker)
+
+    except Exception:
+        if session is not None:
+            close_session(session, started)
+        else:
+            picam.close()
+        raise
+
+    return session, ffmpeg_output, workers
+
+def close_session(session: CameraSession, workers: list):
+    """Tear the session down completely so the camera can be opened again from scratch."""
+
+    for worker in workers:
+        worker.stop()
 
     try:
-        subprocess.run(command, check=True)
+        session.close()
 
     except Exception as e:
-        logger.error(f"[Stream Buffer] Error streaming buffer: {e}")
+        logger.error(f"[Recovery] Error stopping camera session: {e}")
 
-# --- Restart Functions ---
+    try:
+        session.picam.close()
 
-def restart_recording(picamera: Picamera2, ffmpeg_output: FfmpegOutput):
+    except Exception as e:
+        logger.error(f"[Recovery] Error closing camera: {e}")
 
-    logger.warning("[Recovery] Restarting camera pipeline")
+def find_worker(workers: list, cls):
+    return next((worker for worker in workers if isinstance(worker, cls)), None)
 
-    picamera.stop_recording()
-    picamera.stop()
+def find_motion_gate(workers: list):
+    lores = find_worker(workers, LoresReader)
+    return next((s for s in lores.subscribers if isinstance(s, MotionGate)), None) if lores else None
 
-    time.sleep(2)
+# --- Runtime reconfiguration ---
 
-    picamera.start()
-    encoder = H264Encoder()
-    picamera.start_recording(encoder, ffmpeg_output)
+def apply_settings(changed: set, session, ffmpeg_output, workers: list, backfill: BackfillUploader, camera_num=0) -> tuple[dict, FfmpegOutput]:
+    """
+    Apply reloaded settings to one camera through the cheapest path that covers
+    them: camera controls on the fly, an encoder restart, or a full reconfigure,
+    with the measured downtime. A changed RTSP URL only swaps the output, the
+    stream mode waits for the next camera start. Returns a summary and the live
+    output, which is a new one if the URL changed.
+    """
 
-def restart_ffmpeg_output(picamera: Picamera2, ffmpeg_output: FfmpegOutput):
+    summary = {"path": None, "downtime_ms": 0}
 
-    logger.warning("[Recovery] Restarting FFmpeg process")
+    if changed & RESTART_KEYS:
+        logger.warning(f"[Config] {', '.join(sorted(changed & RESTART_KEYS))} takes effect the next time the camera starts")
+        summary["pending"] = sorted(changed & RESTART_KEYS)
 
-    picamera.stop_recording()
-    picamera.stop()
-    ffmpeg_output.stop()
+    if "backfill_rtsp_url" in changed:
+        backfill.rtsp_url = per_camera(settings["backfill_rtsp_url"], camera_num)
 
-    time.sleep(2)
+    # Without a session everything is picked up when the camera starts
+    if session is None:
+        return summary, ffmpeg_output
 
-    ffmpeg_output.start()
-    encoder = H264Encoder()
-    picamera.start_recording(encoder, ffmpeg_output)
-    picamera.start()
+    adaptive = find_worker(workers, AdaptiveController)
+    governor = find_worker(workers, MemoryGovernor)
+    watchdog = find_worker(workers, FrameWatchdog)
+    gate = find_motion_gate(workers)
 
-    logger.info("[Recovery] FFmpeg restarted successfully")
+    # The low latency profile also changes how ffmpeg reads the stream
+    if changed & {"live_rtsp_url", "latency_profile", "rtsp_backend"}:
+        old, ffmpeg_output = ffmpeg_output, create_ffmpeg_output(per_camera(settings["live_rtsp_url"], camera_num))
 
-# --- Main Loop ---
-def mainloop():
+        # Offline mode picks the new output up on the next switch to live
+        if old in session.fanout.outputs():
+            session.switch_to(ffmpeg_output)
 
-    OFFLINE_BUFFER_FILE = "offline_buffer.h264"
-    OFFLINE_TIMEOUT = 400
+        if adaptive is not None:
+            adaptive.output = ffmpeg_output
 
-    while True:
+        if watchdog is not None:
+            watchdog.output = ffmpeg_output
 
-        try:
+    if adaptive is not None:
+        adaptive.ladder = adaptive_ladder()
 
-            if check_connection():
-                logger.info("[Mainloop] Internet available. Starting live RTSP stream")
-                picam, ffmpeg_output = start_camera()
-                live_mode(picam, ffmpeg_output)
+        quality = changed & {"main_size", "frame_rate", "bitrate"}
+        if adaptive.rung != 0 and quality:
+            logger.info(f"[Config] Quality is stepped down, {', '.join(sorted(quality))} applies once it is back on the top rung")
+            changed = changed - quality
 
-            else:
-                logger.warning("[Mainloop] Internet not available. Switching to offline mode")
-                picam, file_output = start_file_recording(OFFLINE_BUFFER_FILE)
-                offline_mode(picam, file_output, OFFLINE_BUFFER_FILE, OFFLINE_TIMEOUT)
+    # A reconfigure rebuilds the stream at full rate, so the gate opens first.
+    # Otherwise it restores the new frame rate and bitrate when motion comes back.
+    quality = changed & {"frame_rate", "bitrate"}
+    if gate is not None and gate.gated and changed & CONFIGURE_KEYS:
+        gate.open("main stream size changed")
 
-            time.sleep(2)
+    elif gate is not None and gate.gated and quality:
+        logger.info(f"[Config] Stream is at its keep-alive rate, {', '.join(sorted(quality))} applies once motion returns")
+        changed = changed - quality
 
+    bitrate = settings["bitrate"] if "bitrate" in changed else None
+    encoder = encoder_settings()
+    downtime = 0.0
 
-        # Exception handling during the mainloop run. The same exceptions that were handled in initialization
-        # are also handled in the mainloop. 
-        except RuntimeError as e:
+    if changed & CONFIGURE_KEYS:
+        session.encoder_name = settings["encoder"]
+        session.keyframe_interval = encoder["keyframe_interval"]
+        session.profile = encoder["profile"]
+        downtime = session.reconfigure(governor.config_factory(), bitrate=bitrate)
+        summary["path"] = "reconfigure"
 
-            error_message = str(e).lower()
-            logger.error(f"[Mainloop] Runtime error: {error_message}")
+    else:
+        if changed & ENCODER_KEYS:
+            session.profile = encoder["profile"]
+            downtime = session.restart_encoder(bitrate, settings["encoder"], encoder["keyframe_interval"])
+            summary["path"] = "encoder"
 
-            if ("camera not found" in error_message) or ("not found" in error_message):
-                logger.critical("[Mainloop] Camera physically disconnected or not detected.")
-                sys.exit(1)
+        if changed & CONTROL_KEYS:
+            session.set_controls({"FrameRate": settings["frame_rate"]})
+            summary["path"] = summary["path"] or "controls"
 
-            elif ("buffers" in error_message) or ("mmal error" in error_message) or ("encoder" in error_message):
+    summary["downtime_ms"] = round(downtime * 1000)
 
-                logger.error("[Mainloop] Encoder issue detected, restarting camera")
-                restart_recording(picam, ffmpeg_output)
+    if summary["path"]:
+        logger.info(f"[Config] Applied through {summary['path']} with {summary['downtime_ms']} ms downtime")
 
-            else:
-                logger.error("[Mainloop] Unhandled runtime error; attempting recovery")
-                restart_recording(picam, ffmpeg_output)
+    return summary, ffmpeg_output
 
+def recover(failure_class: str, error, session, ffmpeg_output, storage=None, device="/dev/video0"):
+    """
+    Run the remediation for a failure class. Without a session the camera failed
+    to start, so only the remediation runs and the main loop tries again.
+    """
 
-        except OSError as e:
+    logger.error(f"[Recovery] Handling {failure_class} failure: {error}")
 
-            logger.error(f"[Mainloop] OSError: {e}")
+    if failure_class == "busy":
+        if device is None:
+            # Guessing would kill whatever holds another camera's device
+            logger.warning("[Recovery] No device node configured for this camera in CAMERA_DEVICES, not killing any process")
+        else:
+            kill_conflicting_processes(device)
 
-            if e.errno == errno.EPIPE:
-                logger.error("FFmpeg pipe error, restarting subprocess...")
-                restart_ffmpeg_output(picam, ffmpeg_output)
+    elif failure_class == "memory":
+        free_memory()
 
+    elif failure_class == "disk" and storage is not None:
+        # A full disk doesn't need the camera restarted
+        handle_disk_full(storage, error)
+        return
 
-            elif e.errno == errno.ENOSPC:
-                logger.error(f"[Mainloop] Disk is full: {e}")
-                handle_disk_full(picam, ffmpeg_output, e)
+    if session is None:
+        return
 
+    if failure_class == "pipe":
+        restart_ffmpeg_output(session, ffmpeg_output)
 
-            elif e.errno in (errno.ENFILE, errno.EMFILE):
-                logger.error(f"File table overflow: {e}")
-                handle_file_overflow(picam, ffmpeg_output, e)
+    elif failure_class == "fds":
+        handle_file_overflow(session, error)
 
+    else:
+        restart_recording(session)
 
-            elif e.errno == errno.ENODEV:
-                logger.critical(f"[Mainloop] No such device, camera disconnected: {e}")
-                sys.exit(1)
+def error_name(error) -> str:
 
+    if isinstance(error, OSError) and error.errno in errno.errorcode:
+        return errno.errorcode[error.errno]
 
-            elif e.errno == errno.ENOMEM:
-                logger.error(f"[Mainloop] Insufficient memory: {e}")
-                free_memory()
+    return type(error).__name__
 
+# --- Metrics collection ---
 
-            else:
-                logger.error("[Mainloop] Unhandled OS Error; attempting full pipeline restart")
+def count_transition(previous_mode, mode: str, camera=None) -> str:
 
+    if previous_mode is not None and previous_mode != mode:
+        MODE_TRANSITIONS.inc(to=mode, **({"camera": camera} if camera else {}))
 
-        except MemoryError as e:
-            logger.error(f"[Mainloop] Memory exhaustion: {e}")
-            free_memory()
-            restart_recording(picam, ffmpeg_output)
+    return mode
+
+def register_pipeline_metrics(get_session, get_ffmpeg_output, store: SegmentStore, backfill: BackfillUploader, camera=None):
+    """
+    Register the metrics that are read from live pipeline objects at scrape time.
+    The session and RTSP output are passed as getters since they are only created
+    once the camera has started. With several cameras each registers its own
+    series, labelled with the camera name.
+    """
+
+    labels = {"camera": camera} if camera else {}
+
+    def fanout_value(key):
+        session = get_session()
+        return getattr(session.fanout, key) if session else None
+
+    def live_bytes():
+        session, output = get_session(), get_ffmpeg_output()
+        return session.fanout.totals(output)["bytes"] if session and output else None
+
+    registry.counter("eleeye_frames_encoded_total", "Frames produced by the H.264 encoder", fn=lambda: fanout_value("frames"), **labels)
+    registry.counter("eleeye_frames_dropped_total", "Encoded frames that reached no output", fn=lambda: fanout_value("uncovered_frames"), **labels)
+    registry.counter("eleeye_live_bytes_sent_total", "Bytes written to the live RTSP output", fn=live_bytes, **labels)
+    registry.counter("eleeye_backfill_bytes_sent_total", "Bytes of buffered footage uploaded by the backfill worker", fn=lambda: backfill.uploaded_bytes, **labels)
+    registry.gauge("eleeye_offline_buffer_bytes", "Size of the offline segment ring on disk", fn=store.total_bytes, **labels)
+    registry.gauge("eleeye_backfill_backlog_seconds", "Seconds of buffered footage waiting for upload", fn=store.retained_seconds, **labels)
+
+    def capture_latency(quantile):
+        session = get_session()
+        latency = session.fanout.latency() if session else None
+        return latency[quantile] if latency else None
+
+    # From the sensor to the outputs, the rest of the way to a viewer shows in bench_stream.py
+    for quantile, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+        registry.gauge("eleeye_capture_latency_seconds", "Time from the sensor capturing a frame to its encoded frame reaching the outputs",
+                       fn=lambda key=key: capture_latency(key), quantile=quantile, **labels)
+
+def register_link_metrics(connectivity: ConnectivityMonitor):
+
+    registry.gauge("eleeye_link_up", "Debounced connectivity to the RTSP server", fn=lambda: int(connectivity.online))
+    registry.gauge("eleeye_link_rtt_seconds", "Smoothed RTT of RTSP OPTIONS probes", fn=lambda: connectivity.rtt)
+    registry.gauge("eleeye_link_loss_ratio", "Fraction of failed connectivity probes", fn=lambda: connectivity.loss)
+
+def register_memory_metrics(governor: MemoryGovernor, camera=None):
+    """Register the memory pressure readings, bound to the governor of the current session."""
+
+    labels = {"camera": camera} if camera else {}
+    pressure = governor.pressure
+    registry.gauge("eleeye_memory_pressure_some_avg10", "Share of time some tasks stalled on memory over 10s, percent", fn=lambda: pressure.stall("some"))
+    registry.gauge("eleeye_memory_available_bytes", "MemAvailable from /proc/meminfo", fn=lambda: pressure.meminfo.get("MemAvailable", 0) * 1024 if pressure.meminfo else None)
+    registry.gauge("eleeye_memory_cma_free_bytes", "Free contiguous memory for camera buffers", fn=lambda: pressure.meminfo.get("CmaFree", 0) * 1024 if pressure.meminfo.get("CmaTotal") else None)
+    registry.gauge("eleeye_camera_buffer_count", "Frame buffers the camera is configured with", fn=lambda: governor.buffer_count, **labels)
+
+def register_motion_metrics(gate: MotionGate, camera=None):
+
+    labels = {"camera": camera} if camera else {}
+    registry.gauge("eleeye_motion_gated", "1 while the stream is held at its keep-alive rate", fn=lambda: int(gate.gated), **labels)
+    registry.gauge("eleeye_motion_score", "Share of the lores frame that changed since the previous one", fn=lambda: gate.score, **labels)
+    registry.counter("eleeye_motion_gated_seconds_total", "Time spent at the keep-alive rate", fn=lambda: gate.gated_seconds, **labels)
+
+def register_log_metrics(log_buffer: BufferedLogging):
+
+    registry.counter("eleeye_log_records_suppressed_total", "Log records held back as repeats or over the rate limit", fn=lambda: log_buffer.limiter.suppressed)
+    registry.counter("eleeye_log_batches_total", "Batched writes of log output", fn=lambda: log_buffer.handler.batches)
+
+def register_storage_metrics(storage: StorageGovernor, segment_output: SegmentedOutput, camera=None):
+
+    labels = {"camera": camera} if camera else {}
+    registry.gauge("eleeye_disk_free_bytes", "Free space on the recording filesystem", fn=lambda: storage.free_bytes)
+    registry.counter("eleeye_storage_evicted_bytes_total", "Bytes of recordings evicted to free disk space", fn=lambda: storage.evicted_bytes, **labels)
+    registry.gauge("eleeye_spill_bytes", "Encoded video held in RAM while the disk is full", fn=segment_output.spilled_bytes, **labels)
+    registry.counter("eleeye_spill_dropped_frames_total", "Frames dropped because the RAM spill was full", fn=lambda: segment_output.spill_dropped, **labels)
+
+def register_retention_metrics(retention: TieredRetention, camera=None):
+
+    labels = {"camera": camera} if camera else {}
+    registry.counter("eleeye_retention_transcoded_segments_total", "Buffered segments re-encoded to the lower tier", fn=lambda: retention.transcoded_segments, **labels)
+    registry.counter("eleeye_retention_saved_bytes_total", "Disk space saved by re-encoding buffered segments", fn=lambda: retention.saved_bytes, **labels)
+    registry.counter("eleeye_retention_failures_total", "Failed re-encodes of buffered segments", fn=lambda: retention.failures, **labels)
+
+# --- Camera pipeline ---
+
+class CameraPipeline(threading.Thread):
+    """
+    Runs one camera: its session, live and offline mode, offline store, backfill,
+    pre-event buffer and supervisor. Each camera runs in its own pipeline thread,
+    so a fault on one camera is recovered without touching the others. A pipeline
+    that can't be repaired stops on its own and leaves the others running.
+    """
+
+    def __init__(self, camera_num: int, connectivity: ConnectivityMonitor):
+
+        self.camera = camera_name(camera_num)
+        super().__init__(name=f"camera-{self.camera}", daemon=True)
+        self.camera_num = camera_num
+        self.connectivity = connectivity
+        self.device = CAMERA_DEVICES.get(camera_num)
+        self.fatal = False
+        self._stopped = threading.Event()
+
+        # Metrics only carry a camera label once there is more than one camera
+        self.label = self.camera if len(CAMERAS) > 1 else None
+
+        # The ring keeps the newest OFFLINE_RETENTION seconds of an outage, or as
+        # much as fits the budget once older footage is re-encoded smaller
+        buffer_dir = per_camera(OFFLINE_BUFFER_DIR, camera_num)
+        self.store = SegmentStore(
+            buffer_dir,
+            segment_seconds=OFFLINE_SEGMENT_SECONDS,
+            max_segments=(TIER_MAX_RETENTION if TIERED_RETENTION else OFFLINE_RETENTION) // OFFLINE_SEGMENT_SECONDS,
+            max_bytes=OFFLINE_BUDGET_MB * 1024 * 1024 if TIERED_RETENTION else None
+        )
+        self.retention = TieredRetention(
+            self.store,
+            full_seconds=TIER_FULL_SECONDS,
+            size=TIER_SIZE,
+            frame_rate=TIER_FRAME_RATE,
+            bitrate=TIER_BITRATE,
+            nice=TIER_NICE
+        ) if TIERED_RETENTION else None
+
+        # Buffered footage is uploaded in the background so the camera can go
+        # straight back to live mode after a reconnect
+        self.backfill = BackfillUploader(
+            self.store,
+            per_camera(settings["backfill_rtsp_url"], camera_num),
+            rate=BACKFILL_RATE,
+            is_online=lambda: connectivity.online,
+            max_attempts=BACKFILL_MAX_ATTEMPTS
+        )
+
+        # The camera and encoder are started once and kept running. Live and offline
+        # mode only swap the outputs attached to the session.
+        self.session = None
+        self.workers = []
+        self.ffmpeg_output = None
+        self.segment_output = create_segment_output(self.store)
+
+        # Keeps the last few seconds of encoded video in RAM so a detection can save
+        # a clip that starts before the event. Triggered through the control socket.
+        clips_dir = per_camera(CLIPS_DIR, camera_num)
+        self.event_buffer = PreEventBuffer(clips_dir, pre_seconds=PRE_EVENT_SECONDS, post_seconds=POST_EVENT_SECONDS)
+
+        # Capture time, frame sequence and location are embedded in every frame. The
+        # sequence carries on across camera restarts.
+        self.telemetry = FrameTelemetry(LocationSource(per_camera(LOCATION_FILE, camera_num)))
+
+        # Frees space by evicting our oldest recordings well before writes fail
+        self.storage = StorageGovernor(buffer_dir, self.store, self.segment_output, clips_dir, low_mb=STORAGE_LOW_MB, high_mb=STORAGE_HIGH_MB)
+
+        # Every failure goes through the supervisor, which owns the retry budgets and
+        # decides between a targeted fix, a cold restart of the camera, or giving up
+        self.supervisor = Supervisor(camera=self.label)
+
+        # The last still, shared by every client polling /snapshot
+        self.snapshot = SnapshotCache(self.capture_snapshot, max_age=SNAPSHOT_INTERVAL)
+
+        # Raw lores frames for local processes, so they don't have to decode the stream
+        self.frame_ring = FrameRing(per_camera(FRAME_RING_NAME, camera_num), slots=FRAME_RING_SLOTS) if FRAME_RING else None
+
+    def start(self):
+
+        self.backfill.start()
+
+        if self.retention is not None:
+            self.retention.start()
+            register_retention_metrics(self.retention, self.label)
+
+        self.storage.start()
+        register_storage_metrics(self.storage, self.segment_output, self.label)
+        register_pipeline_metrics(lambda: self.session, lambda: self.ffmpeg_output, self.store, self.backfill, self.label)
+        super().start()
+
+    def apply(self, changed: set) -> dict:
+
+        summary, self.ffmpeg_output = apply_settings(changed, self.session, self.ffmpeg_output, self.workers, self.backfill, self.camera_num)
+        return summary
+
+    def capture_snapshot(self) -> tuple[bytes, float]:
+
+        session, lores = self.session, find_worker(self.workers, LoresReader)
+
+        if session is None:
+            raise RuntimeError(f"{self.camera} is not running")
+
+        if lores is not None and SNAPSHOT_STREAM == "lores":
+            frame, timestamp = lores.latest()
+
+            if frame is not None:
+                stride = session.picam.stream_configuration("lores")["stride"]
+                return encode_yuv420(frame, LORES_SIZE, stride, SNAPSHOT_QUALITY), timestamp
+
+        return encode_rgbx(session.picam.capture_array("main"), SNAPSHOT_QUALITY), time.time()
+
+    def flowing(self) -> bool:
+        """Whether frames are flowing through this camera's pipeline right now."""
+
+        watchdog = find_worker(self.workers, FrameWatchdog)
+        return watchdog is not None and watchdog.flowing()
+
+    def live_state(self):
+        self.supervisor.transition(BACKFILL if self.store.entries() else LIVE)
+
+    def run(self):
+
+        mode = None
+
+        while not self._stopped.is_set():
+
+            try:
+
+                if self.session is None:
+                    self.supervisor.transition(INIT)
+                    self.session, self.ffmpeg_output, self.workers = open_session(self.event_buffer, self.connectivity, self.telemetry, self.camera_num, self.frame_ring)
+
+                if self.connectivity.online:
+                    logger.info(f"[Mainloop] {self.camera}: Internet available. Starting live RTSP stream")
+                    mode = count_transition(mode, "live", self.label)
+                    self.live_state()
+                    live_mode(self.session, self.ffmpeg_output, self.connectivity, on_tick=self.live_state, watchdog=find_worker(self.workers, FrameWatchdog))
+
+                else:
+                    logger.warning(f"[Mainloop] {self.camera}: Internet not available. Switching to offline mode")
+                    mode = count_transition(mode, "offline", self.label)
+                    self.supervisor.transition(OFFLINE)
+                    offline_mode(self.session, self.segment_output, self.store, self.connectivity, watchdog=find_worker(self.workers, FrameWatchdog))
+                    self.backfill.wake()
+
+            # Anything else the supervisor doesn't know is handled as an "other" failure
+            except Exception as e:
+
+                logger.error(f"[Mainloop] {self.camera}: {type(e).__name__}: {e}")
+                RECOVERIES.inc(error=error_name(e), **({"camera": self.label} if self.label else {}))
+
+                decision = self.supervisor.recover(
+                    e,
+                    lambda failure_class: recover(failure_class, e, self.session, self.ffmpeg_output, self.storage, self.device)
+                )
+
+                if decision == REINIT and self.session is not None:
+                    close_session(self.session, self.workers)
+                    self.session, self.workers = None, []
+
+                elif decision == FATAL:
+                    logger.critical(f"[Mainloop] Could not repair the {self.camera} pipeline. Stopping it")
+                    self.fatal = True
+                    break
+
+        self._close()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _close(self):
+
+        if self.session is not None:
+            close_session(self.session, self.workers)
+            self.session, self.workers = None, []
+
+        self.backfill.stop()
+
+        if self.retention is not None:
+            self.retention.stop()
+
+        self.storage.stop()
+
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+
+# --- Main Loop ---
+def mainloop():
+
+    pipelines = []
+
+    # Recovery storms would otherwise write to the SD card on every line
+    log_buffer = None
+    if LOG_BUFFERED:
+        log_buffer = BufferedLogging(
+            ring_size=LOG_RING_SIZE,
+            filename=LOG_FILE,
+            dump_dir=LOG_DUMP_DIR,
+            limiter=LogLimiter(rate=LOG_RATE, burst=LOG_BURST, repeat_window=LOG_REPEAT_WINDOW),
+            flush_interval=LOG_FLUSH_INTERVAL
+        ).install()
+        register_log_metrics(log_buffer)
+
+    # Settings from the config file replace the defaults before anything is started
+    def apply_config(changed: set, new: dict) -> dict:
+
+        settings.update(new)
+
+        if "live_rtsp_url" in changed:
+            connectivity.set_url(settings["live_rtsp_url"])
+
+        return {"cameras": {pipeline.camera: pipeline.apply(changed) for pipeline in pipelines if pipeline.is_alive()}}
+
+    reloader = ConfigReloader(CONFIG_FILE, dict(settings), apply=apply_config)
+    settings.update(reloader.settings)
+
+    # The mode loops only read the monitor's debounced state, probing happens
+    # on its own thread against the RTSP server itself. All cameras share it.
+    connectivity = ConnectivityMonitor(settings["live_rtsp_url"])
+    connectivity.start()
+    register_link_metrics(connectivity)
+
+    # apply_config needs the connectivity monitor, so SIGHUP is only handled from here on
+    reloader.install_signal_handler()
+
+    pipelines.extend(CameraPipeline(camera_num, connectivity) for camera_num in CAMERAS)
+    by_number = {pipeline.camera_num: pipeline for pipeline in pipelines}
+
+    def trigger_clip(camera=CAMERAS[0], **kwargs):
+
+        if camera not in by_number:
+            raise ValueError(f"Unknown camera {camera}")
+
+        return by_number[camera].event_buffer.trigger(**kwargs)
+
+    def snapshot(camera=CAMERAS[0], etag=None):
+
+        if camera not in by_number:
+            raise ValueError(f"Unknown camera {camera}")
+
+        return by_number[camera].snapshot.get(etag)
+
+    control = ControlServer()
+    control.register("trigger_clip", trigger_clip)
+    control.register("metrics", registry.render)
+    control.register("reload_config", reloader.reload)
+    control.register("snapshot", snapshot)
+
+    if log_buffer is not None:
+        control.register("logs", lambda: {"records": log_buffer.records()})
+        control.register("dump_logs", log_buffer.dump)
+
+    for pipeline in pipelines:
+        pipeline.start()
+
+    control.start()
+    sd_notify("READY=1")
+    stalled = []
+
+    # The process only gives up once every camera has. systemd is only told
+    # we're alive while every running camera has frames flowing, so a node
+    # that can't recover by itself is restarted.
+    while any(pipeline.is_alive() for pipeline in pipelines):
+
+        previous, stalled = stalled, [pipeline.camera for pipeline in pipelines if pipeline.is_alive() and not pipeline.flowing()]
+
+        if not stalled:
+            sd_notify("WATCHDOG=1")
+
+        if stalled != previous:
+            sd_notify(f"STATUS=No frames from {', '.join(stalled)}" if stalled else "STATUS=Streaming")
+
+        time.sleep(1)
+
+    logger.critical("[Mainloop] No camera pipeline left running. Shutting down")
 
-        except ConnectionError as e:
-            logger.error(f"[Mainloop] Network related error: {e}")
-            restart_ffmpeg_output(picam, ffmpeg_output)
+    if log_buffer is not None:
+        log_buffer.dump("fatal")
 
-        time.sleep(2)
+    sys.exit(1)
 
 if __name__ == "__main__":
     mainloop()
\ No newline at end of file
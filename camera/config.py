@@ -0,0 +1,119 @@
+import json, signal, threading, logging
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "camera_config.json"
+
+# How each setting is applied at runtime, cheapest first. Control changes cost
+# no frames, encoder changes a short gap, configure changes stop the camera.
+CONTROL_KEYS = {"frame_rate"}
+ENCODER_KEYS = {"bitrate", "encoder", "keyframe_interval", "latency_profile"}
+CONFIGURE_KEYS = {"main_size"}
+OUTPUT_KEYS = {"live_rtsp_url", "backfill_rtsp_url", "rtsp_backend"}
+RESTART_KEYS = {"stream_mode"}
+
+ENCODERS = ("h264", "libav")
+STREAM_MODES = ("dual", "single")
+LATENCY_PROFILES = ("standard", "low_latency")
+RTSP_BACKENDS = ("ffmpeg", "pyav")
+
+# --- Validation ---
+
+def _positive_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def validate(settings: dict) -> dict:
+    """Check every setting and normalise sizes to tuples. Raises ValueError naming the offending settings."""
+
+    checks = {
+        "live_rtsp_url": lambda v: isinstance(v, str) and v.startswith("rtsp://"),
+        "backfill_rtsp_url": lambda v: isinstance(v, str) and v.startswith("rtsp://"),
+        "stream_mode": lambda v: v in STREAM_MODES,
+        "main_size": lambda v: isinstance(v, (list, tuple)) and len(v) == 2 and all(_positive_int(x) and x % 2 == 0 for x in v),
+        "frame_rate": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and 0 < v <= 120,
+        "bitrate": _positive_int,
+        "encoder": lambda v: v in ENCODERS,
+        "keyframe_interval": _positive_int,
+        "latency_profile": lambda v: v in LATENCY_PROFILES,
+        "rtsp_backend": lambda v: v in RTSP_BACKENDS,
+    }
+
+    errors = [f"unknown setting {key}" for key in settings if key not in checks]
+    errors += [f"invalid {key}: {settings[key]!r}" for key, check in checks.items() if key in settings and not check(settings[key])]
+
+    if errors:
+        raise ValueError(", ".join(errors))
+
+    settings = dict(settings)
+    if "main_size" in settings:
+        settings["main_size"] = tuple(settings["main_size"])
+
+    return settings
+
+def load_config(path: str, defaults: dict) -> dict:
+    """Return the defaults overridden by the JSON config file. A missing file means all defaults."""
+
+    try:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+
+    except FileNotFoundError:
+        logger.info(f"[Config] {path} not found, using defaults")
+        return dict(defaults)
+
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+
+    return {**defaults, **validate(overrides)}
+
+# --- Runtime reload ---
+
+class ConfigReloader:
+    """
+    Holds the current settings and reloads them from the config file on request.
+    apply(changed, settings) is called with the names of the settings that differ
+    from the running ones and returns a summary of what it did. A file that fails
+    validation leaves the running settings untouched.
+    """
+
+    def __init__(self, path: str, defaults: dict, apply=None):
+
+        self.path = path
+        self.defaults = defaults
+        self.apply = apply
+        self.settings = load_config(path, defaults)
+        self._lock = threading.Lock()
+
+    def reload(self) -> dict:
+
+        with self._lock:
+
+            settings = load_config(self.path, self.defaults)
+            changed = sorted(key for key in settings if settings[key] != self.settings.get(key))
+
+            if not changed:
+                logger.info("[Config] Reloaded, nothing changed")
+                return {"changed": []}
+
+            logger.info(f"[Config] Reloaded, changed: {', '.join(changed)}")
+            summary = self.apply(set(changed), settings) if self.apply else {}
+
+            # Only recorded once applied, so a failed apply is retried on the next reload
+            self.settings = settings
+            return {"changed": changed, **summary}
+
+    def install_signal_handler(self, signum=signal.SIGHUP):
+        """Reload on SIGHUP. The reload runs on its own thread, never inside the signal handler."""
+
+        def handler(signum, frame):
+            threading.Thread(target=self._reload_logged, name="config-reload", daemon=True).start()
+
+        signal.signal(signum, handler)
+
+    def _reload_logged(self):
+
+        try:
+            self.reload()
+
+        except Exception as e:
+            logger.error(f"[Config] Reload failed, keeping the running settings: {e}")
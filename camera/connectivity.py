@@ -0,0 +1,196 @@
+import time, socket, threading, logging, collections
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# --- RTSP probe ---
+
+class RtspProbe:
+    """
+    Sends RTSP OPTIONS requests to the streaming server over one reused TCP
+    connection. The connection is only reopened after a failure, so a healthy link
+    costs one socket for the lifetime of the process instead of one per probe.
+    """
+
+    def __init__(self, rtsp_url: str, timeout=2):
+
+        parsed = urlparse(rtsp_url)
+        self.url = rtsp_url
+        self.host = parsed.hostname
+        self.port = parsed.port or 554
+        self.timeout = timeout
+        self._sock = None
+        self._cseq = 0
+
+    def probe(self) -> float:
+        """Send one OPTIONS request and return the round trip time in seconds. Raises OSError on failure."""
+
+        try:
+            if self._sock is None:
+                self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+            self._cseq += 1
+            request = f"OPTIONS {self.url} RTSP/1.0\r\nCSeq: {self._cseq}\r\nUser-Agent: eleeye-camera\r\n\r\n"
+
+            start = time.monotonic()
+            self._sock.sendall(request.encode("ascii"))
+            response = self._read_response(start + self.timeout)
+            rtt = time.monotonic() - start
+
+            if not response.startswith(b"RTSP/1.0"):
+                raise OSError(f"Unexpected RTSP response: {response[:32]!r}")
+
+            return rtt
+
+        except OSError:
+            self.close()
+            raise
+
+    def _read_response(self, deadline: float) -> bytes:
+        """Read until the end of the response headers, which may come in several segments."""
+
+        response = b""
+
+        # A response that isn't RTSP is rejected without waiting for the rest of it
+        while b"\r\n\r\n" not in response and (len(response) < 8 or response.startswith(b"RTSP/1.0")):
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("Timed out waiting for the RTSP response")
+
+            self._sock.settimeout(remaining)
+            chunk = self._sock.recv(4096)
+
+            if not chunk:
+                raise ConnectionResetError("RTSP server closed the connection")
+
+            response += chunk
+
+        return response
+
+    def close(self):
+
+        if self._sock is not None:
+            try:
+                self._sock.close()
+
+            except OSError:
+                pass
+
+            self._sock = None
+
+# --- Connectivity monitor ---
+
+class ConnectivityMonitor(threading.Thread):
+    """
+    Background thread that probes the RTSP server and publishes a debounced
+    online/offline state.
+
+    The state only flips after up_after consecutive successes or down_after
+    consecutive failures, so a single lost probe on a flaky link does not cause a
+    mode switch. While offline, probes back off exponentially up to max_interval.
+    Reading `online` is just an attribute read, so the mode loops can poll it freely.
+    """
+
+    def __init__(self, rtsp_url: str, interval=1, max_interval=16, timeout=2, up_after=3, down_after=3, window=60):
+
+        super().__init__(name="connectivity", daemon=True)
+        self.probe = RtspProbe(rtsp_url, timeout=timeout)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.up_after = up_after
+        self.down_after = down_after
+
+        self.online = False
+        self.rtt = None
+        self.transitions = 0
+        self.last_change = time.monotonic()
+
+        self._results = collections.deque(maxlen=window)
+        self._streak = 0
+        self._changed = threading.Condition()
+        self._stopped = threading.Event()
+
+    @property
+    def loss(self) -> float:
+        """Fraction of failed probes over the recent window."""
+
+        results = list(self._results)
+        if not results:
+            return 0.0
+
+        return results.count(False) / len(results)
+
+    def start(self):
+        """Start probing. The first probe is made synchronously so the initial state is known straight away."""
+
+        self.online = self._probe_once()
+        logger.info(f"[Connectivity] Initial state: {'online' if self.online else 'offline'}")
+        super().start()
+
+    def stop(self):
+
+        self._stopped.set()
+        self.probe.close()
+
+    def set_url(self, rtsp_url: str):
+        """Probe a different RTSP server from the next probe on, for example after a config reload."""
+
+        old, self.probe = self.probe, RtspProbe(rtsp_url, timeout=self.probe.timeout)
+        old.close()
+        self.rtt = None
+
+    def wait_for_change(self, timeout=None) -> bool:
+        """Block until the state flips or the timeout expires, then return the current state."""
+
+        with self._changed:
+            self._changed.wait(timeout)
+            return self.online
+
+    def _probe_once(self) -> bool:
+
+        try:
+            rtt = self.probe.probe()
+
+        except OSError as e:
+            logger.debug(f"[Connectivity] Probe failed: {e}")
+            self._results.append(False)
+            return False
+
+        # Exponentially weighted so a single slow probe doesn't dominate
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+        self._results.append(True)
+        return True
+
+    def run(self):
+
+        delay = self.interval
+
+        while not self._stopped.wait(delay):
+
+            success = self._probe_once()
+
+            # Count how many probes in a row disagree with the published state
+            self._streak = self._streak + 1 if success != self.online else 0
+
+            threshold = self.up_after if success else self.down_after
+            if self._streak >= threshold:
+                self._set_online(success)
+
+            if self.online or success:
+                delay = self.interval
+
+            else:
+                delay = min(delay * 2, self.max_interval)
+
+    def _set_online(self, online: bool):
+
+        with self._changed:
+            self.online = online
+            self._streak = 0
+            self.transitions += 1
+            self.last_change = time.monotonic()
+            self._changed.notify_all()
+
+        rtt = f"{self.rtt * 1000:.0f} ms" if self.rtt is not None else "n/a"
+        logger.info(f"[Connectivity] Link {'up' if online else 'down'} (rtt {rtt}, loss {self.loss:.0%})")
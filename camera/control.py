@@ -0,0 +1,95 @@
+import os, json, socket, threading, logging
+
+logger = logging.getLogger(__name__)
+
+# Unix socket shared by the camera process (server side) and the HTTP request
+# server (client side), which run as separate processes from start_stream.sh
+CONTROL_SOCKET = "/tmp/eleeye_camera.sock"
+
+# --- Camera side ---
+
+class ControlServer(threading.Thread):
+    """
+    Line-delimited JSON command channel into the running camera process.
+
+    Each connection carries one request {"command": ..., "payload": {...}} and
+    gets one JSON response back. Commands are plain callables registered by name
+    that take the payload as keyword arguments and return a JSON serialisable dict.
+    """
+
+    def __init__(self, path=CONTROL_SOCKET):
+
+        super().__init__(name="control", daemon=True)
+        self.path = path
+        self.commands = {}
+        self._sock = None
+
+    def register(self, name: str, func):
+        self.commands[name] = func
+
+    def start(self):
+
+        try:
+            os.unlink(self.path)
+
+        except FileNotFoundError:
+            pass
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen()
+        super().start()
+
+    def stop(self):
+
+        if self._sock is not None:
+            self._sock.close()
+
+    def run(self):
+
+        while True:
+
+            try:
+                conn, _ = self._sock.accept()
+
+            except OSError:
+                return
+
+            with conn:
+                try:
+                    request = json.loads(conn.makefile("rb").readline())
+                    response = self.dispatch(request.get("command"), request.get("payload") or {})
+
+                except Exception as e:
+                    logger.error(f"[Control] Bad request: {e}")
+                    response = {"status": "error", "message": "Bad request"}
+
+                try:
+                    conn.sendall(json.dumps(response).encode("utf-8") + b"\n")
+
+                except OSError as e:
+                    logger.error(f"[Control] Failed to send response: {e}")
+
+    def dispatch(self, name: str, payload: dict) -> dict:
+
+        if name not in self.commands:
+            return {"status": "error", "message": f"Unknown command {name}"}
+
+        try:
+            result = self.commands[name](**payload)
+            return {"status": "success", "result": result}
+
+        except Exception as e:
+            logger.error(f"[Control] Command {name} failed: {e}")
+            return {"status": "error", "message": str(e)}
+
+# --- Client side ---
+
+def send_command(name: str, payload=None, timeout=5, path=CONTROL_SOCKET) -> dict:
+    """Send one command to the camera process. Raises OSError if the camera process is not reachable."""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"command": name, "payload": payload or {}}).encode("utf-8") + b"\n")
+        return json.loads(sock.makefile("rb").readline())
@@ -0,0 +1,161 @@
+import os, time, queue, threading, logging, collections
+from picamera2.outputs import Output
+from keyframe_index import scan_keyframes, write_index
+
+logger = logging.getLogger(__name__)
+
+# --- Pre-event buffer ---
+
+class PreEventBuffer(Output):
+    """
+    RAM-backed circular buffer of encoded H.264, in the spirit of picamera2's
+    CircularOutput but sized in seconds.
+
+    Frames are kept grouped by GOP so the buffer always starts on a keyframe and
+    whole GOPs are dropped once they fall outside the pre-roll window. Nothing
+    touches the SD card until trigger() is called, which writes the pre-roll and
+    the following post-roll seconds to a clip file on a background thread.
+    """
+
+    def __init__(self, directory: str, pre_seconds=10, post_seconds=10, max_bytes=32 * 1024 * 1024):
+
+        super().__init__()
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._gops = collections.deque()
+        self._bytes = 0
+        self._clip = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+
+        if audio:
+            return
+
+        now = time.monotonic()
+
+        with self._lock:
+
+            if keyframe:
+                self._gops.append({"start": now, "bytes": 0, "frames": []})
+
+            # Frames before the first keyframe can't be decoded, so there is no point keeping them
+            if not self._gops:
+                return
+
+            gop = self._gops[-1]
+            gop["frames"].append(frame)
+            gop["bytes"] += len(frame)
+            self._bytes += len(frame)
+            self._trim(now)
+
+            clip = self._clip
+            if clip is not None:
+
+                if now >= clip["deadline"]:
+                    clip["queue"].put(None)
+                    self._clip = None
+
+                else:
+                    clip["queue"].put(frame)
+
+    def _trim(self, now: float):
+        """Drop whole GOPs that are entirely older than the pre-roll window, or over the memory cap."""
+
+        while len(self._gops) > 1 and (self._gops[1]["start"] <= now - self.pre_seconds or self._bytes > self.max_bytes):
+            self._bytes -= self._gops.popleft()["bytes"]
+
+    def buffered_seconds(self) -> float:
+
+        with self._lock:
+            if not self._gops:
+                return 0.0
+            return time.monotonic() - self._gops[0]["start"]
+
+    def trigger(self, post_seconds=None, label=None) -> dict:
+        """
+        Save the buffered pre-roll plus post_seconds of upcoming footage to a clip.
+        Triggering again while a clip is being written extends its post-roll instead
+        of starting a second clip.
+        """
+
+        post_seconds = self.post_seconds if post_seconds is None else post_seconds
+        now = time.monotonic()
+
+        with self._lock:
+
+            if self._clip is not None:
+                self._clip["deadline"] = max(self._clip["deadline"], now + post_seconds)
+                logger.info(f"[Event buffer] Extended clip {self._clip['path']} by {post_seconds}s")
+                return {"path": self._clip["path"], "extended": True}
+
+            stamp = time.time()
+            name = time.strftime("clip_%Y%m%d-%H%M%S", time.localtime(stamp)) + f"-{int(stamp * 1000) % 1000:03d}"
+
+            # The label comes from an HTTP request, so only keep characters that are safe in a file name
+            label = "".join(c for c in str(label or "") if c.isalnum() or c in "-_")[:32]
+            if label:
+                name += f"_{label}"
+            path = os.path.join(self.directory, name + ".h264")
+
+            # Never overwrite an earlier clip, even one saved in the same millisecond
+            count = 1
+            while os.path.exists(path):
+                count += 1
+                path = os.path.join(self.directory, f"{name}_{count}.h264")
+
+            pre_roll = [frame for gop in self._gops for frame in gop["frames"]]
+            pre_seconds = now - self._gops[0]["start"] if self._gops else 0.0
+
+            clip = {"path": path, "deadline": now + post_seconds, "queue": queue.Queue()}
+            self._clip = clip
+
+        threading.Thread(target=self._write_clip, args=(clip, pre_roll, post_seconds), name="clip-writer", daemon=True).start()
+        logger.info(f"[Event buffer] Saving clip {path} with {pre_seconds:.1f}s pre-roll and {post_seconds}s post-roll")
+
+        return {"path": path, "pre_roll": round(pre_seconds, 1), "post_roll": post_seconds, "extended": False}
+
+    def _write_clip(self, clip: dict, pre_roll: list, post_seconds: float):
+
+        written = 0
+
+        try:
+            with open(clip["path"], "wb") as f:
+
+                for frame in pre_roll:
+                    f.write(frame)
+                    written += len(frame)
+
+                while True:
+
+                    # The timeout covers the encoder stopping mid clip, in which case
+                    # no frame would ever arrive to close it
+                    try:
+                        frame = clip["queue"].get(timeout=post_seconds + 5)
+
+                    except queue.Empty:
+                        break
+
+                    if frame is None:
+                        break
+
+                    f.write(frame)
+                    written += len(frame)
+
+            logger.info(f"[Event buffer] Clip {clip['path']} saved ({written / 1024:.0f} KB)")
+
+            # The pre-roll doesn't keep keyframe flags, so the index comes from a scan of the finished clip
+            write_index(clip["path"], scan_keyframes(clip["path"]))
+
+        except OSError as e:
+            logger.error(f"[Event buffer] Failed to write clip {clip['path']}: {e}")
+
+        finally:
+            with self._lock:
+                if self._clip is clip:
+                    self._clip = None
@@ -0,0 +1,258 @@
+"""
+Raw frames shared with local processes through a multiprocessing.shared_memory ring.
+
+The camera process writes every lores frame into the next slot of a fixed ring
+and never waits for readers. Readers in other processes map the slots as numpy
+arrays without copying. Each slot carries a sequence word that works as a
+seqlock: it is odd while the slot is being written and 2 * seq once frame seq
+is complete, so a reader can tell when a slot it looked at has been overwritten.
+
+    reader = FrameRingReader("eleeye_frames")
+
+    while True:
+        try:
+            frame = reader.read(timeout=1)
+        except FrameOverrun as e:
+            print(f"fell behind, skipped {e.missed} frames")
+            continue
+
+        if frame is not None:
+            detect(frame.array)          # a view into shared memory
+            if not frame.valid():        # overwritten while we were using it
+                ...
+
+A reader that needs a frame for longer than the ring takes to wrap around
+should copy it and check valid() after the copy.
+"""
+
+import time, struct, logging
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ELEFRAME"
+VERSION = 1
+
+# magic, version, slots, slot stride, frame shape (up to 3 dims), dtype
+HEADER = struct.Struct("<8sHHI3I16s")
+HEAD_OFFSET = 56        # uint64 sequence of the newest complete frame, 0 before the first
+DATA_OFFSET = 64
+SLOT_HEADER = 16        # uint64 sequence word, float64 timestamp
+ALIGN = 64
+
+def slot_stride(nbytes: int) -> int:
+    return (SLOT_HEADER + nbytes + ALIGN - 1) // ALIGN * ALIGN
+
+# --- Writer ---
+
+class FrameRing:
+    """
+    The writing end, owned by the camera process. The shared memory is created
+    on the first frame, once its shape is known, and kept for as long as the
+    ring lives, so readers keep their mapping across camera restarts. Used as a
+    LoresReader subscriber it is called with (frame, timestamp).
+    """
+
+    def __init__(self, name: str, slots=8):
+
+        self.name = name
+        self.slots = slots
+        self.head = 0
+        self.published = 0
+
+        self._shm = None
+        self._shape = None
+        self._views = []
+
+    def __call__(self, frame, timestamp):
+        self.publish(frame, timestamp)
+
+    def publish(self, frame, timestamp: float):
+
+        if self._shm is None or frame.shape != self._shape:
+            self._create(frame)
+
+        seq = self.head + 1
+        slot = seq % self.slots
+        offset = DATA_OFFSET + slot * self._stride
+        buf = self._shm.buf
+
+        struct.pack_into("<Q", buf, offset, 2 * seq + 1)
+        self._views[slot][...] = frame
+        struct.pack_into("<d", buf, offset + 8, timestamp)
+        struct.pack_into("<Q", buf, offset, 2 * seq)
+        struct.pack_into("<Q", buf, HEAD_OFFSET, seq)
+
+        self.head = seq
+        self.published += 1
+
+    def _create(self, frame):
+
+        if self._shm is not None:
+            logger.warning(f"[FrameRing] Frame shape changed from {self._shape} to {frame.shape}, recreating {self.name}")
+            self.close()
+
+        if frame.ndim > 3:
+            raise ValueError(f"Frames with {frame.ndim} dimensions can't be shared")
+
+        self._shape = frame.shape
+        self._stride = slot_stride(frame.nbytes)
+        size = DATA_OFFSET + self.slots * self._stride
+
+        try:
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+
+        except FileExistsError:
+            # Left behind by a camera process that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+
+        shape = tuple(frame.shape) + (0,) * (3 - frame.ndim)
+        HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, self.slots, self._stride, *shape, frame.dtype.str.encode())
+        struct.pack_into("<Q", self._shm.buf, HEAD_OFFSET, self.head)
+
+        self._views = [
+            np.ndarray(frame.shape, frame.dtype, buffer=self._shm.buf, offset=DATA_OFFSET + slot * self._stride + SLOT_HEADER)
+            for slot in range(self.slots)
+        ]
+        logger.info(f"[FrameRing] Publishing {frame.shape} {frame.dtype} frames to /dev/shm/{self.name} in {self.slots} slots")
+
+    def close(self):
+        """Remove the ring. Readers that still have it mapped keep their view of the last frames."""
+
+        if self._shm is None:
+            return
+
+        self._views = []
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+# --- Reader ---
+
+class FrameOverrun(Exception):
+    """The reader fell more than a ring behind. missed frames were overwritten before it got to them."""
+
+    def __init__(self, missed: int):
+        super().__init__(f"Reader fell behind, {missed} frames were overwritten")
+        self.missed = missed
+
+class Frame:
+    """One frame in the ring. array is a read-only view into shared memory, valid() says whether it still holds this frame."""
+
+    def __init__(self, ring, seq: int, timestamp: float, array):
+
+        self.seq = seq
+        self.timestamp = timestamp
+        self.array = array
+        self._ring = ring
+
+    def valid(self) -> bool:
+        return self._ring._sequence_word(self.seq) == 2 * self.seq
+
+class FrameRingReader:
+    """
+    The reading end, for any local process. read() returns the frames in order
+    and raises FrameOverrun when the writer has lapped the reader, after which
+    reading resumes from the newest frame. latest() skips straight to it.
+    """
+
+    def __init__(self, name: str, poll=0.005):
+
+        self._shm = attach(name)
+        magic, version, self.slots, self._stride, *shape, dtype = HEADER.unpack_from(self._shm.buf, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError(f"{name} is not a version {VERSION} frame ring")
+
+        self.shape = tuple(dim for dim in shape if dim)
+        self.dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        self.poll = poll
+        self.overruns = 0
+
+        self._views = []
+        for slot in range(self.slots):
+            view = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf, offset=DATA_OFFSET + slot * self._stride + SLOT_HEADER)
+            view.flags.writeable = False
+            self._views.append(view)
+
+        # Start with the next frame the camera writes
+        self.next_seq = self.head() + 1
+
+    def head(self) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, HEAD_OFFSET)[0]
+
+    def latest(self):
+        """The newest complete frame, or None before the first one."""
+
+        head = self.head()
+        frame = self._frame(head) if head else None
+
+        if frame is not None:
+            self.next_seq = head + 1
+
+        return frame
+
+    def read(self, timeout=None):
+        """Wait for the next frame in sequence. Returns None on timeout."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+
+            head = self.head()
+
+            if head >= self.next_seq:
+                frame = self._frame(self.next_seq)
+
+                if frame is None:
+                    missed, self.next_seq = head - self.next_seq, head
+                    self.overruns += 1
+                    raise FrameOverrun(missed)
+
+                self.next_seq += 1
+                return frame
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+            time.sleep(self.poll)
+
+    def close(self):
+
+        self._views = []
+        self._shm.close()
+
+    def _sequence_word(self, seq: int) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, DATA_OFFSET + seq % self.slots * self._stride)[0]
+
+    def _frame(self, seq: int):
+
+        offset = DATA_OFFSET + seq % self.slots * self._stride
+
+        if self._sequence_word(seq) != 2 * seq:
+            return None
+
+        timestamp = struct.unpack_from("<d", self._shm.buf, offset + 8)[0]
+        frame = Frame(self, seq, timestamp, self._views[seq % self.slots])
+
+        # The timestamp is only ours if the slot wasn't rewritten while reading it
+        return frame if frame.valid() else None
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Map an existing ring without taking ownership of it. Before Python 3.13 the
+    resource tracker would otherwise unlink the writer's memory when a reader exits.
+    """
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
@@ -0,0 +1,209 @@
+import os, json, mmap, bisect, logging
+from telemetry import NAL_SEI, TELEMETRY_UUID, parse_sei, unpack_telemetry
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+
+NAL_IDR = 5
+
+# --- Index files ---
+
+def index_path(media_path: str) -> str:
+    """Return the path of the index kept alongside a recording."""
+    return os.path.splitext(media_path)[0] + INDEX_SUFFIX
+
+class KeyframeIndexWriter:
+    """
+    Appends one JSON line per keyframe to a recording's index while it is being
+    written: the byte offset the keyframe's access unit starts at, the number of
+    frames before it and its capture time. Lines are flushed as they are written,
+    so after a crash the index still covers everything up to the last keyframe.
+    """
+
+    def __init__(self, media_path: str):
+
+        self.path = index_path(media_path)
+        self._file = open(self.path, "w")
+
+    def add(self, offset: int, frame: int, capture_time):
+
+        self._file.write(json.dumps({"offset": offset, "frame": frame, "time": capture_time}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def write_index(media_path: str, entries: list):
+
+    with open(index_path(media_path), "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+def read_index(media_path: str):
+    """Return the index entries of a recording, or None if it has no index. A torn last line is ignored."""
+
+    try:
+        with open(index_path(media_path), "r") as f:
+            lines = f.readlines()
+
+    except FileNotFoundError:
+        return None
+
+    entries = []
+
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+
+        except ValueError:
+            break
+
+    return entries
+
+def remove_index(media_path: str):
+
+    try:
+        os.remove(index_path(media_path))
+
+    except FileNotFoundError:
+        pass
+
+# --- NAL scanner ---
+
+def scan_keyframes(media_path: str) -> list:
+    """
+    Build the index of an existing Annex-B recording by scanning its NAL headers.
+    The file is memory mapped, so only the pages around start codes are touched
+    and nothing is copied. A keyframe entry points at the start of its access unit
+    (the SPS/PPS in front of the IDR slice), which is where a decoder has to begin.
+    Capture times are taken from our SEI telemetry when the recording carries it.
+    """
+
+    entries = []
+
+    with open(media_path, "rb") as f:
+
+        if os.fstat(f.fileno()).st_size == 0:
+            return entries
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+            frames = 0
+            unit_start = None
+            capture_time = None
+            pos = data.find(b"\x00\x00\x01")
+
+            while pos != -1 and pos + 3 < len(data):
+
+                start = pos - 1 if pos > 0 and data[pos - 1] == 0 else pos
+                nal_type = data[pos + 3] & 0x1f
+                following = data.find(b"\x00\x00\x01", pos + 3)
+
+                if 1 <= nal_type <= 5:
+
+                    # first_mb_in_slice == 0 (a leading 1 bit) marks the first slice of a picture
+                    if pos + 4 < len(data) and data[pos + 4] & 0x80:
+
+                        if nal_type == NAL_IDR:
+                            entries.append({"offset": start if unit_start is None else unit_start, "frame": frames, "time": capture_time})
+
+                        frames += 1
+
+                    unit_start, capture_time = None, None
+
+                else:
+                    if unit_start is None:
+                        unit_start = start
+
+                    if nal_type == NAL_SEI:
+                        end = len(data) if following == -1 else following
+                        capture_time = _sei_capture_time(data[pos + 3:end]) or capture_time
+
+                pos = following
+
+    return entries
+
+def _sei_capture_time(nal: bytes):
+
+    try:
+        for message_uuid, user_data in parse_sei(nal):
+            if message_uuid == TELEMETRY_UUID:
+                return unpack_telemetry(user_data)["capture_time"]
+
+    except (IndexError, ValueError):
+        pass
+
+    return None
+
+def frame_capture_time(frame):
+    """Return the capture time from a frame's SEI telemetry, looking only at the NAL units before its first slice."""
+
+    frame = bytes(frame)
+    pos = frame.find(b"\x00\x00\x01")
+
+    while pos != -1 and pos + 3 < len(frame):
+
+        nal_type = frame[pos + 3] & 0x1f
+        if 1 <= nal_type <= 5:
+            break
+
+        following = frame.find(b"\x00\x00\x01", pos + 3)
+
+        if nal_type == NAL_SEI:
+            capture_time = _sei_capture_time(frame[pos + 3:len(frame) if following == -1 else following])
+            if capture_time is not None:
+                return capture_time
+
+        pos = following
+
+    return None
+
+def load_index(media_path: str) -> list:
+    """Return a recording's index, scanning the file and saving the result if it has none yet."""
+
+    entries = read_index(media_path)
+
+    if entries is None:
+        logger.info(f"[Index] Scanning {os.path.basename(media_path)} for keyframes")
+        entries = scan_keyframes(media_path)
+        write_index(media_path, entries)
+
+    return entries
+
+# --- Random access ---
+
+def window(entries: list, file_size: int, start_time=None, end_time=None) -> tuple:
+    """
+    Return the (start, end) byte range that covers start_time to end_time. The
+    range starts at the last keyframe at or before start_time and ends at the
+    first keyframe after end_time, so it decodes on its own. Either bound may be
+    None for the start or end of the file.
+    """
+
+    times = [e["time"] for e in entries]
+    start, end = 0, file_size
+
+    if not entries or None in times:
+        return start, end
+
+    if start_time is not None:
+        i = bisect.bisect_right(times, start_time) - 1
+        start = entries[max(i, 0)]["offset"]
+
+    if end_time is not None:
+        i = bisect.bisect_right(times, end_time)
+        if i < len(entries):
+            end = entries[i]["offset"]
+
+    return start, end
+
+def read_window(media_path: str, start_time=None, end_time=None) -> bytes:
+    """Read the part of a recording between two capture times with a single seek."""
+
+    entries = load_index(media_path)
+    start, end = window(entries, os.path.getsize(media_path), start_time, end_time)
+
+    with open(media_path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
@@ -0,0 +1,274 @@
+import os, sys, time, queue, atexit, threading, collections, logging, logging.handlers
+
+logger = logging.getLogger(__name__)
+
+# --- Repeat and rate limiting ---
+
+class LogLimiter:
+    """
+    Thins out the records of a failure loop before they are written. A message
+    identical to the previous one within repeat_window seconds is only counted,
+    and each logger may write burst records at once and rate records per second
+    after that. What was held back is reported in a single line once the
+    logger writes again. CRITICAL records are never held back.
+    """
+
+    def __init__(self, rate=5, burst=20, repeat_window=30):
+
+        self.rate = rate
+        self.burst = burst
+        self.repeat_window = repeat_window
+        self.suppressed = 0
+
+        self._last = None
+        self._last_at = 0.0
+        self._repeats = 0
+        self._buckets = {}
+        self._dropped = collections.Counter()
+
+    def filter(self, record) -> list:
+        """Return the records to write for this one, which may include summaries of held back ones."""
+
+        records = []
+        key = (record.name, record.levelno, record.getMessage())
+
+        if key == self._last and record.created - self._last_at < self.repeat_window:
+            self._repeats += 1
+            self.suppressed += 1
+            return records
+
+        if self._repeats:
+            records.append(summary(record, self._last[0], self._last[1], f"[Log] Previous message repeated {self._repeats} times"))
+            self._repeats = 0
+
+        self._last, self._last_at = key, record.created
+
+        if record.levelno < logging.CRITICAL and not self._take(record.name, record.created):
+            self._dropped[record.name] += 1
+            self.suppressed += 1
+            return records
+
+        if self._dropped[record.name]:
+            records.append(summary(record, record.name, logging.WARNING, f"[Log] Dropped {self._dropped.pop(record.name)} messages from {record.name}"))
+
+        records.append(record)
+        return records
+
+    def _take(self, name: str, now: float) -> bool:
+
+        tokens, updated = self._buckets.get(name, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens < 1:
+            self._buckets[name] = (tokens, now)
+            return False
+
+        self._buckets[name] = (tokens - 1, now)
+        return True
+
+def summary(record, name: str, level: int, message: str):
+    return logging.makeLogRecord({"name": name, "levelno": level, "levelname": logging.getLevelName(level), "msg": message, "created": record.created, "msecs": record.msecs})
+
+# --- Batched writes ---
+
+class BatchingHandler(logging.Handler):
+    """
+    Collects formatted records and writes them out in one go: every interval
+    seconds, once capacity records are waiting, or straight away for a record
+    at flush_level or above. Writes to stderr, or appends to filename.
+    """
+
+    def __init__(self, filename=None, capacity=200, interval=5, flush_level=logging.CRITICAL):
+
+        super().__init__()
+        self.filename = filename
+        self.capacity = capacity
+        self.interval = interval
+        self.flush_level = flush_level
+        self.batches = 0
+
+        self._buffer = []
+        self._stream = open(filename, "a", encoding="utf-8") if filename else sys.stderr
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-flush", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+
+        try:
+            line = self.format(record)
+
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self.lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.capacity
+
+        if full or record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self):
+
+        with self.lock:
+            if not self._buffer:
+                return
+
+            text = "\n".join(self._buffer) + "\n"
+            self._buffer = []
+
+            try:
+                self._stream.write(text)
+                self._stream.flush()
+                self.batches += 1
+
+            except (OSError, ValueError):
+                # Nowhere left to report it but stderr
+                sys.stderr.write(text)
+
+    def _run(self):
+
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def close(self):
+
+        self._stopped.set()
+        self.flush()
+
+        if self.filename:
+            self._stream.close()
+
+        super().close()
+
+# --- Queued logging ---
+
+class BufferedLogging(logging.handlers.QueueListener):
+    """
+    Takes the root logger's output off the calling threads. Loggers only put
+    records on a queue, and this listener's thread keeps the last ring_size of
+    them in memory, runs them through a LogLimiter and hands the rest to a
+    BatchingHandler. The ring holds every record, including the ones held back,
+    and can be read with records() or written to a file with dump(), which
+    also happens on an uncaught exception.
+    """
+
+    def __init__(self, ring_size=1000, filename=None, dump_dir="logs", limiter=None, batch=200, flush_interval=5):
+
+        self.ring = collections.deque(maxlen=ring_size)
+        self.limiter = limiter or LogLimiter()
+        self.dump_dir = dump_dir
+        self.handler = BatchingHandler(filename, capacity=batch, interval=flush_interval)
+        super().__init__(queue.SimpleQueue(), self.handler)
+
+        self._replaced = []
+        self._hooks = None
+
+    def install(self, formatter=None):
+        """Route the root logger through the queue, keeping the current handlers' format."""
+
+        root = logging.getLogger()
+        self._replaced = list(root.handlers)
+        formatter = formatter or next((h.formatter for h in self._replaced if h.formatter), None)
+
+        if formatter is not None:
+            self.handler.setFormatter(formatter)
+
+        for handler in self._replaced:
+            root.removeHandler(handler)
+
+        root.addHandler(logging.handlers.QueueHandler(self.queue))
+        self.start()
+
+        # Runs before logging's own shutdown, which flushes the handler
+        atexit.register(self.stop)
+
+        self._hooks = (sys.excepthook, threading.excepthook)
+        sys.excepthook = self._excepthook
+        threading.excepthook = self._thread_excepthook
+
+        logger.info(f"[Log] Buffering log output, writing every {self.handler.interval}s, keeping the last {self.ring.maxlen} records")
+        return self
+
+    def uninstall(self):
+
+        root = logging.getLogger()
+
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is self.queue:
+                root.removeHandler(handler)
+
+        atexit.unregister(self.stop)
+        self.stop()
+        self.handler.close()
+
+        for handler in self._replaced:
+            root.addHandler(handler)
+
+        if self._hooks is not None:
+            sys.excepthook, threading.excepthook = self._hooks
+            self._hooks = None
+
+    def stop(self):
+        """Write out everything still queued and stop the listener thread."""
+
+        if self._thread is not None:
+            super().stop()
+            self.handler.flush()
+
+    def handle(self, record):
+
+        self.ring.append(record)
+
+        for allowed in self.limiter.filter(record):
+            self.handler.handle(allowed)
+
+    def records(self) -> list:
+        """The formatted records in the ring, oldest first."""
+        return [self.handler.format(record) for record in list(self.ring)]
+
+    def dump(self, reason="request") -> dict:
+        """Write the ring to log_dump_<time>_<reason>.log in dump_dir, and flush whatever is batched."""
+
+        # Let the listener take in what was logged just before
+        deadline = time.monotonic() + 1
+        while self._thread is not None and not self.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.handler.flush()
+        lines = self.records()
+        os.makedirs(self.dump_dir, exist_ok=True)
+        path = os.path.join(self.dump_dir, f"log_dump_{time.strftime('%Y%m%d-%H%M%S')}_{reason}.log")
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        logger.warning(f"[Log] Dumped {len(lines)} records to {path}")
+        return {"path": path, "records": len(lines)}
+
+    def _excepthook(self, exc_type, exc, tb):
+
+        logger.critical(f"[Log] Uncaught {exc_type.__name__}: {exc}", exc_info=(exc_type, exc, tb))
+        self._crash_dump()
+
+        # The default hooks would only print the traceback a second time
+        if self._hooks[0] is not sys.__excepthook__:
+            self._hooks[0](exc_type, exc, tb)
+
+    def _thread_excepthook(self, args):
+
+        logger.critical(f"[Log] Uncaught {args.exc_type.__name__} in thread {args.thread.name if args.thread else '?'}: {args.exc_value}",
+                        exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
+        self._crash_dump()
+
+        if self._hooks[1] is not threading.__excepthook__:
+            self._hooks[1](args)
+
+    def _crash_dump(self):
+
+        try:
+            self.dump("crash")
+
+        except OSError as e:
+            sys.stderr.write(f"Could not dump the log ring: {e}\n")
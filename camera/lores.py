@@ -0,0 +1,77 @@
+import time, threading, logging
+from picamera2 import Picamera2
+
+logger = logging.getLogger(__name__)
+
+# --- Lores frame helpers ---
+
+def y_plane(frame, size: tuple):
+    """
+    Return the luma plane of a YUV420 lores frame as a view, without copying.
+    Picamera2 returns YUV420 as a (height * 3 / 2, width) array with Y on top.
+    """
+
+    width, height = size
+    return frame[:height, :width]
+
+# --- Lores reader ---
+
+class LoresReader(threading.Thread):
+    """
+    Reads the raw YUV420 lores stream at its own, lower rate and hands frames to
+    local consumers, so on-device analytics never have to decode the H.264 main
+    stream. Subscribers are called on this thread with (frame, timestamp) and
+    should return quickly. The latest frame is also kept for consumers that poll.
+    """
+
+    def __init__(self, picam: Picamera2, rate=5, stream="lores"):
+
+        super().__init__(name="lores", daemon=True)
+        self.picam = picam
+        self.rate = rate
+        self.stream = stream
+        self.subscribers = []
+
+        self.frames = 0
+        self._latest = (None, None)
+        self._stopped = threading.Event()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def latest(self) -> tuple:
+        """Return the most recent (frame, timestamp), or (None, None) before the first frame."""
+        return self._latest
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+
+        interval = 1 / self.rate
+
+        while not self._stopped.is_set():
+
+            start = time.monotonic()
+
+            try:
+                frame = self.picam.capture_array(self.stream)
+
+            except Exception as e:
+                # The camera is expected to be unavailable while the session restarts
+                logger.warning(f"[Lores] Failed to capture {self.stream} frame: {e}")
+                self._stopped.wait(1)
+                continue
+
+            timestamp = time.time()
+            self._latest = (frame, timestamp)
+            self.frames += 1
+
+            for callback in self.subscribers:
+                try:
+                    callback(frame, timestamp)
+
+                except Exception as e:
+                    logger.error(f"[Lores] Subscriber {getattr(callback, '__name__', callback)} failed: {e}")
+
+            self._stopped.wait(max(0.0, interval - (time.monotonic() - start)))
@@ -0,0 +1,205 @@
+import time, threading, logging
+from session import CameraSession
+
+logger = logging.getLogger(__name__)
+
+PSI_MEMORY = "/proc/pressure/memory"
+MEMINFO = "/proc/meminfo"
+
+# --- Memory readings ---
+
+def read_psi(path=PSI_MEMORY):
+    """
+    Return the memory pressure stall information as {"some": {...}, "full": {...}}
+    with the avg10/avg60/avg300 percentages and the total stall time, or None when
+    the kernel has PSI disabled (Raspberry Pi OS needs psi=1 on the command line).
+    """
+
+    try:
+        psi = {}
+
+        with open(path, "r") as f:
+            for line in f:
+                kind, *fields = line.split()
+                psi[kind] = {key: float(value) for key, value in (field.split("=") for field in fields)}
+
+        return psi
+
+    except (OSError, ValueError):
+        return None
+
+def read_meminfo(path=MEMINFO) -> dict:
+    """Return the /proc/meminfo fields in kB, or an empty dict if it can't be read."""
+
+    meminfo = {}
+
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0])
+
+    except (OSError, ValueError, IndexError):
+        return {}
+
+    return meminfo
+
+# --- Memory pressure ---
+
+class MemoryPressure:
+    """
+    Judges memory pressure from PSI and /proc/meminfo before allocations start
+    failing. PSI shows tasks already stalling on reclaim, MemAvailable shows how
+    close the system is to the OOM killer, and CmaFree covers the contiguous pool
+    the camera and encoder buffers come from, which runs out long before RAM does.
+    High and ok thresholds are kept apart so the verdict doesn't flap.
+    """
+
+    def __init__(self, some_high=10.0, some_ok=2.0, full_high=1.0, available_low_mb=64, cma_low_mb=8,
+                 psi_path=PSI_MEMORY, meminfo_path=MEMINFO):
+
+        self.some_high = some_high
+        self.some_ok = some_ok
+        self.full_high = full_high
+        self.available_low_mb = available_low_mb
+        self.cma_low_mb = cma_low_mb
+        self.psi_path = psi_path
+        self.meminfo_path = meminfo_path
+
+        self.psi = None
+        self.meminfo = {}
+
+    def sample(self):
+
+        self.psi = read_psi(self.psi_path)
+        self.meminfo = read_meminfo(self.meminfo_path)
+
+    def available_mb(self):
+        return self.meminfo["MemAvailable"] / 1024 if "MemAvailable" in self.meminfo else None
+
+    def cma_free_mb(self):
+        return self.meminfo["CmaFree"] / 1024 if self.meminfo.get("CmaTotal") else None
+
+    def stall(self, kind="some"):
+        return self.psi[kind]["avg10"] if self.psi and kind in self.psi else None
+
+    def reason(self):
+        """Return a reason string if memory is under pressure as of the last sample, otherwise None."""
+
+        some, full = self.stall("some"), self.stall("full")
+        available, cma_free = self.available_mb(), self.cma_free_mb()
+
+        if full is not None and full >= self.full_high:
+            return f"all tasks stalled on memory {full:.1f}% of the time"
+
+        if some is not None and some >= self.some_high:
+            return f"tasks stalled on memory {some:.1f}% of the time"
+
+        if available is not None and available < self.available_low_mb:
+            return f"only {available:.0f} MB available"
+
+        if cma_free is not None and cma_free < self.cma_low_mb:
+            return f"only {cma_free:.1f} MB of CMA free"
+
+        return None
+
+    def healthy(self) -> bool:
+        """True once every reading is comfortably clear of its threshold."""
+
+        some, available, cma_free = self.stall("some"), self.available_mb(), self.cma_free_mb()
+
+        return (
+            (some is None or some <= self.some_ok)
+            and (available is None or available >= 2 * self.available_low_mb)
+            and (cma_free is None or cma_free >= 2 * self.cma_low_mb)
+        )
+
+# --- Memory governor ---
+
+class MemoryGovernor(threading.Thread):
+    """
+    Sheds camera memory when pressure builds, instead of waiting for ENOMEM.
+
+    The first steps lower the number of frame buffers the camera allocates, which
+    costs nothing in image quality. Once the buffer count is at its minimum the
+    pressure is reported through reason() so the adaptive controller steps down
+    resolution and frame rate. Buffers are restored after recover_after seconds
+    of healthy readings.
+    """
+
+    def __init__(self, session: CameraSession, config_factory, pressure=None, buffer_counts=(6, 4, 3),
+                 interval=1, min_dwell=10, recover_after=120):
+
+        super().__init__(name="memory", daemon=True)
+        self.session = session
+        self.config_factory = config_factory
+        self.pressure = pressure or MemoryPressure()
+        self.buffer_counts = buffer_counts
+        self.interval = interval
+        self.min_dwell = min_dwell
+        self.recover_after = recover_after
+
+        self.level = 0
+        self._reason = None
+        self._last_change = time.monotonic()
+        self._healthy_since = None
+        self._stopped = threading.Event()
+
+    @property
+    def buffer_count(self) -> int:
+        return self.buffer_counts[self.level]
+
+    def stop(self):
+        self._stopped.set()
+
+    def reason(self):
+        """Pressure left over once the buffer count can't go any lower, for the adaptive controller."""
+        return self._reason if self.level == len(self.buffer_counts) - 1 else None
+
+    def healthy(self) -> bool:
+        return self.pressure.healthy()
+
+    def run(self):
+
+        while not self._stopped.wait(self.interval):
+
+            try:
+                self.step()
+
+            except Exception as e:
+                logger.error(f"[Memory] Failed to adjust camera buffers: {e}")
+
+    def step(self):
+
+        now = time.monotonic()
+        self.pressure.sample()
+        self._reason = self.pressure.reason()
+
+        if self._reason:
+            self._healthy_since = None
+
+            if self.level < len(self.buffer_counts) - 1 and now - self._last_change >= self.min_dwell:
+                self._apply(self.level + 1, self._reason)
+
+            return
+
+        if not self.pressure.healthy():
+            self._healthy_since = None
+            return
+
+        self._healthy_since = self._healthy_since or now
+
+        if self.level > 0 and now - self._healthy_since >= self.recover_after and now - self._last_change >= self.min_dwell:
+            self._apply(self.level - 1, "memory pressure cleared")
+            self._healthy_since = now
+
+    def _apply(self, level: int, reason: str):
+
+        logger.info(
+            f"[Memory] {'Lowering' if level > self.level else 'Raising'} camera buffers from "
+            f"{self.buffer_count} to {self.buffer_counts[level]}: {reason}"
+        )
+
+        self.level = level
+        self._last_change = time.monotonic()
+        self.session.reconfigure(self.config_factory())
@@ -0,0 +1,114 @@
+import threading
+
+# --- Metric types ---
+
+class Metric:
+    """
+    A metric family in the Prometheus text format. Values are either kept per
+    label set, or read from a callable at render time for numbers that already
+    live somewhere else (frame counters, buffer sizes and so on).
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, fn=None, labels=None):
+
+        self.name = name
+        self.help_text = help_text
+        self._collectors = {tuple(sorted((labels or {}).items())): fn} if fn else {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> list:
+
+        with self._lock:
+            collectors = list(self._collectors.items())
+            values = list(self._values.items())
+
+        for labels, fn in collectors:
+            value = fn()
+            if value is not None:
+                values.append((labels, value))
+
+        return values
+
+    def value(self, **labels):
+
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> str:
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+        for labels, value in self.samples():
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{self.name}{{{label_text}}} {value}" if label_text else f"{self.name} {value}")
+
+        return "\n".join(lines)
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+# --- Registry ---
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help_text: str, fn=None, **labels) -> Counter:
+        return self._register(Counter(name, help_text, fn, labels))
+
+    def gauge(self, name: str, help_text: str, fn=None, **labels) -> Gauge:
+        return self._register(Gauge(name, help_text, fn, labels))
+
+    def _register(self, metric: Metric) -> Metric:
+
+        existing = self._metrics.get(metric.name)
+
+        # A labelled collector joins the collectors for other label sets, such as
+        # the other cameras, and only replaces the one with the same labels
+        if metric._collectors and () not in metric._collectors and type(existing) is type(metric):
+            with existing._lock:
+                existing._collectors.update(metric._collectors)
+            return existing
+
+        # Registering the same name again replaces the old metric, so collectors
+        # bound to a restarted component don't keep pointing at the old instance
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+
+        blocks = []
+
+        for metric in list(self._metrics.values()):
+            try:
+                blocks.append(metric.render())
+
+            except Exception as e:
+                blocks.append(f"# {metric.name} unavailable: {e}")
+
+        return "\n".join(blocks) + "\n"
+
+# Process wide registry, the camera process exposes it over the control socket
+registry = MetricsRegistry()
@@ -0,0 +1,114 @@
+import time, threading, logging
+import numpy as np
+from session import CameraSession
+from lores import y_plane
+
+logger = logging.getLogger(__name__)
+
+# --- Frame differencing ---
+
+def downscale(y, block=4):
+    """
+    Sum the luma plane over block x block tiles. Summing instead of sampling every
+    block-th pixel averages out sensor noise, and the sums of up to 16 8-bit
+    pixels still fit in uint16.
+    """
+
+    height, width = y.shape[0] // block * block, y.shape[1] // block * block
+    tiles = y[:height, :width].reshape(height // block, block, width // block, block)
+    return tiles.sum(axis=(1, 3), dtype=np.uint16)
+
+def changed_fraction(previous, current, delta: int) -> float:
+    """Return the share of tiles whose summed luma changed by more than delta between two frames."""
+
+    diff = np.abs(current.astype(np.int32) - previous)
+    return np.count_nonzero(diff > delta) / diff.size
+
+# --- Motion gate ---
+
+class MotionGate:
+    """
+    Drops the main stream to a keep-alive frame rate and bitrate while the scene
+    is static, and restores full quality as soon as something moves.
+
+    Subscribed to the lores reader, so every lores frame is compared with the one
+    before on a downscaled luma plane. A frame counts as motion when more than
+    threshold of its tiles changed by more than pixel_delta per pixel, and
+    trigger_frames motion frames in a row restore quality. Without motion for
+    hold seconds the stream is gated. profile() returns the fps and bitrate to
+    restore, normally the adaptive controller's current rung.
+    """
+
+    def __init__(self, session: CameraSession, profile, size: tuple, threshold=0.01, pixel_delta=12, hold=30,
+                 trigger_frames=2, keepalive_fps=2, keepalive_bitrate=150_000, block=4):
+
+        self.session = session
+        self.profile = profile
+        self.size = size
+        self.threshold = threshold
+        self.delta = pixel_delta * block * block
+        self.hold = hold
+        self.trigger_frames = trigger_frames
+        self.keepalive_fps = keepalive_fps
+        self.keepalive_bitrate = keepalive_bitrate
+        self.block = block
+
+        self.gated = False
+        self.score = None
+        self.gated_seconds = 0.0
+
+        self._previous = None
+        self._motion_frames = 0
+        self._last_motion = time.monotonic()
+        self._gated_at = None
+        self._lock = threading.Lock()
+
+    def __call__(self, frame, timestamp):
+
+        current = downscale(y_plane(frame, self.size), self.block)
+        previous, self._previous = self._previous, current
+
+        if previous is None:
+            return
+
+        self.score = changed_fraction(previous, current, self.delta)
+        self._motion_frames = self._motion_frames + 1 if self.score > self.threshold else 0
+        now = time.monotonic()
+
+        if self._motion_frames >= self.trigger_frames:
+            self._last_motion = now
+
+            if self.gated:
+                self.open(f"motion in {self.score:.1%} of the frame")
+
+        elif not self.gated and now - self._last_motion >= self.hold:
+            self.close(f"no motion for {now - self._last_motion:.0f}s")
+
+    def close(self, reason: str):
+        """Drop to the keep-alive rate. The frame rate goes first so the encoder restarts into it."""
+
+        with self._lock:
+            if self.gated:
+                return
+
+            logger.info(f"[Motion] Dropping to {self.keepalive_fps} fps at {self.keepalive_bitrate // 1000} kbit/s: {reason}")
+            self.session.set_controls({"FrameRate": self.keepalive_fps})
+            self.session.restart_encoder(self.keepalive_bitrate)
+
+            self.gated = True
+            self._gated_at = time.monotonic()
+
+    def open(self, reason: str):
+        """Restore the quality profile() asks for."""
+
+        with self._lock:
+            if not self.gated:
+                return
+
+            profile = self.profile()
+            logger.info(f"[Motion] Restoring {profile['fps']} fps at {profile['bitrate'] // 1000} kbit/s: {reason}")
+            self.session.restart_encoder(profile["bitrate"])
+            self.session.set_controls({"FrameRate": profile["fps"]})
+
+            self.gated = False
+            self.gated_seconds += time.monotonic() - self._gated_at
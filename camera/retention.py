@@ -0,0 +1,228 @@
+import os, time, threading, subprocess, logging
+from segment_store import SegmentStore
+from telemetry import extract_telemetry, pack_telemetry, tag_pictures
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_FILE = "transcode.tmp"
+
+# --- Transcode command ---
+
+def build_transcode_command(file_path: str, output_path: str, input_framerate, size: tuple, frame_rate, bitrate: int) -> list:
+    """
+    Build the ffmpeg command that re-encodes one buffered segment at the lower
+    tier. Like the backfill, the raw Annex-B input needs its frame rate passed
+    in. The output is raw H.264 again, with a keyframe every two seconds and no
+    B-frames, so the keyframe index, clips and backfill handle it like any
+    other segment. A single thread keeps the camera's own work ahead of it.
+    """
+
+    width, height = size
+
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-y",
+        "-framerate", str(input_framerate),
+        "-i", file_path,
+        "-vf", f"scale={width}:{height},fps={frame_rate}",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-b:v", str(bitrate),
+        "-maxrate", str(bitrate),
+        "-bufsize", str(bitrate * 2),
+        "-g", str(round(frame_rate * 2)),
+        "-bf", "0",
+        "-threads", "1",
+        "-f", "h264",
+        output_path
+    ]
+
+# --- Telemetry ---
+
+def carry_telemetry(source_path: str, output_path: str, input_framerate, frame_rate) -> int:
+    """
+    Tag every picture of a re-encoded segment with the SEI telemetry of the
+    source frame it was taken from, since ffmpeg drops our SEI. The fps filter
+    keeps the source frame nearest in time, which is the one picked here.
+    Returns the number of pictures tagged, 0 for a source without telemetry.
+    """
+
+    with open(source_path, "rb") as f:
+        records = extract_telemetry(f.read())
+
+    if not records:
+        return 0
+
+    with open(output_path, "rb") as f:
+        data = f.read()
+
+    tagged = []
+
+    def user_data(n):
+
+        record = records[min(round(n * input_framerate / frame_rate), len(records) - 1)]
+        tagged.append(n)
+        location = (record["lat"], record["lon"]) if record["lat"] is not None else None
+        return pack_telemetry(record["sequence"], record["capture_time"], location)
+
+    data = tag_pictures(data, user_data)
+
+    with open(output_path, "wb") as f:
+        f.write(data)
+
+    return len(tagged)
+
+# --- Tiered retention worker ---
+
+class TieredRetention(threading.Thread):
+    """
+    Keeps the newest full_seconds of buffered footage at full quality and
+    re-encodes older segments in the background, at nice priority, to a lower
+    size, frame rate and bitrate. Together with a byte budget on the store this
+    stretches how long an outage the disk can cover.
+
+    Segments are taken newest first from the edge of the full quality window,
+    away from the oldest segments the backfill uploads, and swapped in through
+    SegmentStore.replace(), so a segment uploaded, evicted or replaced in the
+    meantime is simply skipped. A re-encode that doesn't come out smaller is
+    thrown away. The SEI telemetry is carried over to the re-encoded pictures,
+    so the keyframe index rebuilt for them has capture times again.
+    """
+
+    def __init__(self, store: SegmentStore, full_seconds=300, size=(640, 360), frame_rate=10, bitrate=300_000, nice=19,
+                 poll_interval=10, max_backoff=300):
+
+        super().__init__(name="retention", daemon=True)
+        self.store = store
+        self.full_seconds = full_seconds
+        self.size = size
+        self.frame_rate = frame_rate
+        self.bitrate = bitrate
+        self.nice = nice
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self._stopped = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+        self._skipped = set()
+
+        self.transcoded_segments = 0
+        self.saved_bytes = 0
+        self.failures = 0
+
+    def stop(self):
+
+        self._stopped.set()
+
+        with self._lock:
+            if self._process is not None:
+                self._process.terminate()
+
+    def candidate(self):
+        """Return the newest full quality segment outside the full quality window, or None."""
+
+        recent = 0.0
+
+        for entry in reversed(self.store.entries()):
+
+            if recent >= self.full_seconds and entry.get("tier") != "low" and entry["name"] not in self._skipped:
+                return entry
+
+            recent += entry["duration"] or self.store.segment_seconds
+
+        return None
+
+    def run(self):
+
+        backoff = self.poll_interval
+
+        while not self._stopped.is_set():
+
+            entry = self.candidate()
+
+            if entry is None:
+                self._stopped.wait(self.poll_interval)
+                continue
+
+            try:
+                self.transcode(entry)
+                backoff = self.poll_interval
+
+            except OSError as e:
+                # ffmpeg missing or the disk full, nothing specific to this segment
+                self.failures += 1
+                backoff = min(backoff * 2, self.max_backoff)
+                logger.error(f"[Retention] Could not re-encode {entry['name']}: {e}. Retrying in {backoff}s")
+                self._stopped.wait(backoff)
+
+        self._remove_temporary()
+
+    def transcode(self, entry: dict) -> bool:
+
+        name = entry["name"]
+        duration = entry["duration"] or self.store.segment_seconds
+        input_framerate = round(entry["frames"] / duration) if entry["frames"] and duration else 30
+
+        # Never raise the frame rate of a segment recorded at the keep-alive rate
+        frame_rate = min(self.frame_rate, input_framerate)
+        output_path = self.store.path(TRANSCODE_FILE)
+        command = build_transcode_command(self.store.path(name), output_path, input_framerate, self.size, frame_rate, self.bitrate)
+
+        start = time.monotonic()
+
+        with self._lock:
+            if self._stopped.is_set():
+                return False
+            self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL, preexec_fn=lambda: os.nice(self.nice))
+
+        try:
+            returncode = self._process.wait()
+
+        finally:
+            with self._lock:
+                self._process = None
+
+        if self._stopped.is_set():
+            return False
+
+        if returncode != 0:
+            self.failures += 1
+            self._skipped.add(name)
+            logger.error(f"[Retention] Re-encoding {name} failed (exit code {returncode}), keeping it at full quality")
+            return False
+
+        try:
+            carry_telemetry(self.store.path(name), output_path, input_framerate, frame_rate)
+
+        except FileNotFoundError:
+            logger.info(f"[Retention] {name} was removed while being re-encoded")
+            return False
+
+        size = os.path.getsize(output_path)
+
+        if size >= entry["bytes"]:
+            self._skipped.add(name)
+            logger.info(f"[Retention] {name} is already {entry['bytes'] / 1024:.0f} KB, keeping it at full quality")
+            return False
+
+        if not self.store.replace(name, output_path, size, round(duration * frame_rate), tier="low"):
+            logger.info(f"[Retention] {name} was removed while being re-encoded")
+            return False
+
+        self.transcoded_segments += 1
+        self.saved_bytes += entry["bytes"] - size
+        logger.info(
+            f"[Retention] Re-encoded {name} from {entry['bytes'] / 1024:.0f} KB to {size / 1024:.0f} KB "
+            f"in {time.monotonic() - start:.1f}s"
+        )
+        return True
+
+    def _remove_temporary(self):
+
+        try:
+            os.remove(self.store.path(TRANSCODE_FILE))
+
+        except FileNotFoundError:
+            pass
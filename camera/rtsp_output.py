@@ -0,0 +1,210 @@
+import time, threading, logging
+from fractions import Fraction
+from picamera2.outputs import Output
+
+logger = logging.getLogger(__name__)
+
+# --- In-process RTSP output ---
+
+class PyavRtspOutput(Output):
+    """
+    Muxes the encoded stream and pushes it over RTSP from inside the camera
+    process with PyAV (libavformat), instead of piping every frame into an
+    ffmpeg child process.
+
+    The encoder describes its stream through _add_stream (forwarded by the
+    fanout). Connecting to the server happens on a thread of its own, since the
+    RTSP handshake can take seconds and must not hold up the encoder, and frames
+    are sent from the next keyframe after the connection is up. When sending
+    fails the output marks itself broken, calls error_callback and reconnects
+    by itself with a growing backoff. Encoder timestamps restart at zero with
+    the encoder, so they are shifted to keep the stream's timeline increasing.
+    """
+
+    def __init__(self, rtsp_url: str, transport="tcp", options=None, retry_interval=2, max_retry_interval=30):
+
+        # Fails here, before the output is used, when PyAV isn't installed
+        global av
+        import av
+
+        super().__init__()
+        self.rtsp_url = rtsp_url
+        self.options = {"rtsp_transport": transport, **(options or {})}
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.needs_add_stream = True
+        self.error_callback = None
+        self.output_broken = False
+
+        self.connects = 0
+        self.failures = 0
+
+        self._stream_info = None
+        self._container = None
+        self._stream = None
+        self._ready = None
+        self._connecting = False
+        self._generation = 0
+        self._backoff = retry_interval
+        self._retry_at = 0.0
+        self._offset = 0
+        self._last_pts = None
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+
+    def _add_stream(self, encoder_stream, codec_name, **kwargs):
+
+        info = {"codec": codec_name, "width": kwargs.get("width"), "height": kwargs.get("height")}
+
+        with self._lock:
+            if info == self._stream_info:
+                return
+
+            # A new stream size needs a new RTSP session, the SDP describes the stream
+            self._stream_info = info
+            self._disconnect()
+
+        self._connect_soon()
+
+    def start(self):
+
+        super().start()
+        self.output_broken = False
+        self._backoff, self._retry_at = self.retry_interval, 0.0
+        self._connect_soon()
+
+    def stop(self):
+
+        super().stop()
+
+        with self._lock:
+            self._disconnect()
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+
+        if not self.recording or audio:
+            return
+
+        with self._lock:
+
+            if self._container is None and self._ready is not None and keyframe:
+                self._container, self._stream = self._ready
+                self._ready = None
+
+            container, stream = self._container, self._stream
+
+        if container is None:
+            self._connect_soon()
+            return
+
+        try:
+            out = av.Packet(bytes(frame))
+            out.pts = out.dts = self._pts(timestamp)
+            out.time_base = Fraction(1, 1_000_000)
+            out.is_keyframe = keyframe
+            out.stream = stream
+            container.mux(out)
+
+        except Exception as e:
+            self._failed(e)
+
+    def _pts(self, timestamp) -> int:
+
+        if timestamp is None:
+            timestamp = time.monotonic_ns() // 1000
+
+        # Keep the spacing of the previous frames across an encoder restart
+        if self._last_pts is not None and timestamp + self._offset <= self._last_pts:
+            gap = timestamp - self._last_timestamp if self._last_timestamp is not None and timestamp > self._last_timestamp else 33_333
+            self._offset = self._last_pts + gap - timestamp
+
+        self._last_timestamp = timestamp
+        self._last_pts = timestamp + self._offset
+        return self._last_pts
+
+    # --- Connection ---
+
+    def _connect_soon(self):
+
+        with self._lock:
+            if (not self.recording or self._stream_info is None or self._connecting or self._container is not None
+                    or self._ready is not None or time.monotonic() < self._retry_at):
+                return
+
+            self._connecting = True
+            generation = self._generation
+
+        threading.Thread(target=self._connect, args=(generation,), name="rtsp-connect", daemon=True).start()
+
+    def _connect(self, generation: int):
+
+        container = None
+
+        try:
+            container = av.open(self.rtsp_url, "w", format="rtsp", options=self.options)
+            stream = container.add_stream(self._stream_info["codec"], width=self._stream_info["width"], height=self._stream_info["height"])
+            # Writing the header is what connects and sets up the RTSP session
+            container.start_encoding()
+
+        except Exception as e:
+            if container is not None:
+                close_quietly(container)
+
+            with self._lock:
+                self._connecting = False
+                if generation == self._generation:
+                    self._schedule_retry()
+
+            logger.warning(f"[RTSP] Could not connect to {self.rtsp_url}: {e}")
+            return
+
+        with self._lock:
+            self._connecting = False
+
+            # Stopped or restarted while connecting
+            if generation != self._generation or not self.recording:
+                close_quietly(container)
+                return
+
+            self._ready = (container, stream)
+            self._backoff = self.retry_interval
+            self.connects += 1
+            self.output_broken = False
+
+        logger.info(f"[RTSP] Connected to {self.rtsp_url}, streaming from the next keyframe")
+
+    def _failed(self, error):
+
+        with self._lock:
+            self._disconnect()
+            self._schedule_retry()
+            self.output_broken = True
+            self.failures += 1
+
+        logger.error(f"[RTSP] Sending to {self.rtsp_url} failed: {error}")
+
+        if self.error_callback:
+            self.error_callback(error)
+
+    def _schedule_retry(self):
+
+        self._retry_at = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_retry_interval)
+
+    def _disconnect(self):
+
+        self._generation += 1
+
+        for container in (self._container, self._ready[0] if self._ready else None):
+            if container is not None:
+                close_quietly(container)
+
+        self._container = self._stream = self._ready = None
+
+def close_quietly(container):
+
+    try:
+        container.close()
+
+    except Exception as e:
+        logger.debug(f"[RTSP] Error closing the RTSP session: {e}")
@@ -0,0 +1,531 @@
+import os, json, time, errno, threading, logging
+from picamera2.outputs import Output
+from keyframe_index import KeyframeIndexWriter, write_index, remove_index, frame_capture_time, load_index, window
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+QUARANTINE_DIR = "quarantine"
+SEGMENT_PREFIX = "seg_"
+SEGMENT_SUFFIX = ".h264"
+
+# --- Segment store ---
+
+class SegmentStore:
+    """
+    Bounded on-disk ring of fixed-duration H.264 segments.
+
+    Every segment starts on a keyframe, so each file can be replayed on its own.
+    A small JSON manifest lists the committed segments oldest first. When the ring
+    is full the oldest segment is dropped, so the newest max_segments * segment_seconds
+    of footage always survive an outage, however long it runs. With max_bytes the
+    ring is also bounded by size, so segments that were re-encoded smaller (see
+    replace()) leave room for more footage. Segments that can't be replayed are
+    moved aside to quarantine/, which keeps a manifest of its own (see quarantine()).
+    """
+
+    def __init__(self, directory: str, segment_seconds=10, max_segments=40, max_bytes=None):
+
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._load_manifest()
+        self._next_seq = self._find_next_seq()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def _load_manifest(self) -> list:
+        """
+        Load the manifest, dropping entries whose files have gone missing and
+        adopting segment files that were written but never committed (for example
+        when the process died mid-segment).
+        """
+
+        segments = []
+
+        try:
+            with open(self._manifest_path(), "r") as f:
+                segments = json.load(f)
+
+        except FileNotFoundError:
+            pass
+
+        except (OSError, ValueError) as e:
+            logger.error(f"[Segment store] Unreadable manifest, rebuilding from disk: {e}")
+
+        segments = [s for s in segments if os.path.exists(self.path(s["name"]))]
+        known = {s["name"] for s in segments}
+
+        for name in sorted(os.listdir(self.directory)):
+
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)) or name in known:
+                continue
+
+            stat = os.stat(self.path(name))
+            if stat.st_size == 0:
+                os.remove(self.path(name))
+                continue
+
+            logger.info(f"[Segment store] Adopting uncommitted segment {name}")
+            segments.append({
+                "name": name,
+                "start": stat.st_mtime,
+                "duration": None,
+                "bytes": stat.st_size,
+                "frames": None
+            })
+
+        segments.sort(key=lambda s: s["name"])
+        return segments
+
+    def _find_next_seq(self) -> int:
+
+        if not self._segments:
+            return 0
+
+        last = self._segments[-1]["name"]
+        return int(last[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1
+
+    def _write_manifest(self):
+        """Atomically replace the manifest. Only called when a segment is committed or removed."""
+        write_manifest(self._manifest_path(), self._segments)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def new_segment_name(self) -> str:
+
+        with self._lock:
+            name = f"{SEGMENT_PREFIX}{self._next_seq:08d}{SEGMENT_SUFFIX}"
+            self._next_seq += 1
+            return name
+
+    def commit(self, name: str, start: float, duration: float, size: int, frames: int):
+        """Record a finished segment, evicting the oldest segments once the ring is full."""
+
+        with self._lock:
+
+            segments = self._segments + [{
+                "name": name,
+                "start": start,
+                "duration": duration,
+                "bytes": size,
+                "frames": frames
+            }]
+
+            evicted = []
+            while len(segments) > self.max_segments or self._over_budget(segments):
+                evicted.append(segments.pop(0))
+
+            # Nothing changes unless the manifest could be written, a full disk
+            # leaves the ring as it was
+            write_manifest(self._manifest_path(), segments)
+            self._segments = segments
+
+            for oldest in evicted:
+                logger.info(f"[Segment store] Ring full, dropping oldest segment {oldest['name']}")
+                self._delete(oldest["name"])
+
+    def _over_budget(self, segments: list) -> bool:
+        return self.max_bytes is not None and len(segments) > 1 and sum(s["bytes"] for s in segments) > self.max_bytes
+
+    def replace(self, name: str, new_path: str, size: int, frames: int, **fields) -> bool:
+        """
+        Swap a segment's file for new_path, a re-encoded copy of the same footage,
+        and update its entry with the new size, frame count and any extra fields.
+        Returns False, leaving new_path alone, if the segment has been removed in
+        the meantime. A reader that already has the old file open keeps reading it.
+        """
+
+        with self._lock:
+
+            entry = next((s for s in self._segments if s["name"] == name), None)
+
+            if entry is None:
+                return False
+
+            os.replace(new_path, self.path(name))
+            remove_index(self.path(name))
+            entry.update(bytes=size, frames=frames, **fields)
+            self._write_manifest()
+            return True
+
+    def remove(self, name: str):
+        """Remove a segment from the ring, for example once it has been replayed."""
+
+        with self._lock:
+
+            self._segments = [s for s in self._segments if s["name"] != name]
+            self._delete(name)
+            self._write_manifest()
+
+    def quarantine(self, name: str, reason: str) -> bool:
+        """
+        Take a segment that can't be replayed out of the ring and move it to
+        quarantine/, where it is listed with the reason and time in that
+        directory's manifest for a closer look. Quarantined segments no longer
+        count towards the ring's limits and are never evicted. Returns False if
+        the segment has been removed in the meantime, or its file has gone
+        missing, in which case its entry is dropped.
+        """
+
+        with self._lock:
+
+            entry = next((s for s in self._segments if s["name"] == name), None)
+
+            if entry is None:
+                return False
+
+            directory = os.path.join(self.directory, QUARANTINE_DIR)
+            os.makedirs(directory, exist_ok=True)
+
+            try:
+                os.replace(self.path(name), os.path.join(directory, name))
+
+            except FileNotFoundError:
+                # Nothing left to quarantine, drop the entry like _load_manifest() would
+                logger.warning(f"[Segment store] {name} has gone missing, dropping it")
+                self._segments.remove(entry)
+                remove_index(self.path(name))
+                self._write_manifest()
+                return False
+
+            remove_index(self.path(name))
+
+            self._segments.remove(entry)
+            self._write_manifest()
+
+            manifest_path = os.path.join(directory, MANIFEST_FILE)
+            quarantined = []
+
+            try:
+                with open(manifest_path, "r") as f:
+                    quarantined = json.load(f)
+
+            except FileNotFoundError:
+                pass
+
+            except (OSError, ValueError) as e:
+                logger.error(f"[Segment store] Unreadable quarantine manifest, starting a new one: {e}")
+
+            quarantined.append(dict(entry, quarantined=time.time(), reason=reason))
+            write_manifest(manifest_path, quarantined)
+            return True
+
+    def _delete(self, name: str):
+
+        try:
+            os.remove(self.path(name))
+
+        except FileNotFoundError:
+            pass
+
+        remove_index(self.path(name))
+
+    def entries(self) -> list:
+        """Return a snapshot of the committed segments, oldest first."""
+
+        with self._lock:
+            return [dict(s) for s in self._segments]
+
+    def total_bytes(self) -> int:
+
+        with self._lock:
+            return sum(s["bytes"] for s in self._segments)
+
+    def window(self, start_time: float, end_time: float) -> list:
+        """
+        Return (path, start, end) byte ranges covering start_time to end_time across
+        the committed segments. Each range starts on a keyframe, so the footage of
+        any time window can be replayed, trimmed or uploaded with one seek per segment.
+        """
+
+        ranges = []
+
+        for entry in self.entries():
+
+            duration = entry["duration"] or self.segment_seconds
+            if entry["start"] + duration < start_time or entry["start"] > end_time:
+                continue
+
+            path = self.path(entry["name"])
+            start, end = window(load_index(path), entry["bytes"], start_time, end_time)
+            ranges.append((path, start, end))
+
+        return ranges
+
+    def retained_seconds(self) -> float:
+
+        with self._lock:
+            return sum(s["duration"] or self.segment_seconds for s in self._segments)
+
+def write_manifest(path: str, segments: list):
+
+    tmp_path = path + ".tmp"
+
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(segments, f)
+
+        os.replace(tmp_path, path)
+
+    except OSError:
+        # Don't leave a half written manifest taking up what space is left
+        try:
+            os.remove(tmp_path)
+
+        except FileNotFoundError:
+            pass
+
+        raise
+
+# --- Segmented encoder output ---
+
+class SegmentedOutput(Output):
+    """
+    Picamera2 output that writes encoded H.264 straight into a SegmentStore.
+
+    A new segment is opened on the first keyframe after segment_seconds have
+    elapsed, so segments never split a GOP. Frames arriving before the first
+    keyframe are dropped since they cannot be decoded on their own.
+
+    A keyframe index is written next to every segment as it is recorded, see
+    keyframe_index.py.
+
+    When the disk fills up (ENOSPC) frames are spilled into a RAM buffer of whole
+    GOPs, bounded by spill_bytes, instead of being lost. The storage governor
+    writes the spill back into the store with drain_spill() once it has freed space.
+    """
+
+    def __init__(self, store: SegmentStore, spill_bytes=16 * 1024 * 1024):
+
+        super().__init__()
+        self.store = store
+        self.spill_bytes = spill_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+        self._name = None
+        self._start = 0.0
+        self._bytes = 0
+        self._frames = 0
+
+        self._spill = []
+        self._spilled_bytes = 0
+        self.spilling = False
+        self.spill_dropped = 0
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+
+        if audio or not self.recording:
+            return
+
+        now = time.time()
+
+        with self._lock:
+
+            if self.spilling:
+                self._spill_frame(frame, keyframe, now)
+                return
+
+            try:
+                if keyframe and (self._file is None or now - self._start >= self.store.segment_seconds):
+                    self._close_segment(now)
+                    self._open_segment(now)
+
+                if self._file is None:
+                    return
+
+                if keyframe:
+                    self._index.add(self._bytes, self._frames, frame_capture_time(frame) or now)
+
+                self._file.write(frame)
+                self._bytes += len(frame)
+                self._frames += 1
+
+            except OSError as e:
+
+                if e.errno != errno.ENOSPC:
+                    raise
+
+                logger.warning(f"[Segmented output] Disk full, spilling frames to RAM (up to {self.spill_bytes // (1024 * 1024)} MB)")
+                self._abandon_segment(now)
+                self.spilling = True
+
+    # --- RAM spill ---
+
+    def _spill_frame(self, frame, keyframe: bool, now: float):
+
+        if keyframe:
+            self._spill.append({"start": now, "end": now, "frames": []})
+
+        # The spill starts on a keyframe like a segment does
+        if not self._spill:
+            return
+
+        gop = self._spill[-1]
+        gop["frames"].append(bytes(frame))
+        gop["end"] = now
+        self._spilled_bytes += len(frame)
+
+        # Keep the newest footage, like the ring does, but never drop the open GOP
+        while self._spilled_bytes > self.spill_bytes and len(self._spill) > 1:
+            oldest = self._spill.pop(0)
+            self._spilled_bytes -= sum(len(f) for f in oldest["frames"])
+            self.spill_dropped += len(oldest["frames"])
+
+    def spilled_bytes(self) -> int:
+        return self._spilled_bytes
+
+    def drain_spill(self) -> bool:
+        """
+        Write the spilled GOPs back into the store and resume writing to disk.
+        Complete GOPs are written without holding the lock, so the encoder thread
+        keeps spilling meanwhile. Returns False if the disk filled up again.
+        """
+
+        while True:
+
+            with self._lock:
+
+                if not self.spilling:
+                    return True
+
+                # Hand over the open GOP along with the last batch and keep writing
+                # to the same file, so the stream continues without a gap
+                if len(self._spill) <= 1:
+                    try:
+                        self._resume(self._spill[0] if self._spill else None)
+
+                    except OSError as e:
+                        logger.error(f"[Segmented output] Failed to resume writing to disk: {e}")
+                        self._abandon_segment(time.time())
+                        return False
+
+                    self.spilling = False
+                    logger.info("[Segmented output] Spill drained, writing to disk again")
+                    return True
+
+                batch, self._spill = self._spill[:-1], self._spill[-1:]
+                self._spilled_bytes = sum(len(f) for f in self._spill[0]["frames"])
+
+            try:
+                self._write_batch(batch)
+
+            except OSError as e:
+                logger.error(f"[Segmented output] Failed to write spilled frames: {e}")
+
+                # Put the batch back in front so nothing is reordered or lost
+                with self._lock:
+                    self._spill = batch + self._spill
+                    self._spilled_bytes = sum(len(f) for gop in self._spill for f in gop["frames"])
+
+                return False
+
+    def _write_batch(self, batch: list):
+
+        name = self.store.new_segment_name()
+        size = frames = 0
+        index = []
+
+        try:
+            with open(self.store.path(name), "wb") as f:
+                for gop in batch:
+                    index.append({"offset": size, "frame": frames, "time": frame_capture_time(gop["frames"][0]) or gop["start"]})
+
+                    for frame in gop["frames"]:
+                        f.write(frame)
+                        size += len(frame)
+                        frames += 1
+
+            write_index(self.store.path(name), index)
+
+        except OSError:
+            self._remove_file(name)
+            raise
+
+        self.store.commit(name, batch[0]["start"], batch[-1]["end"] - batch[0]["start"], size, frames)
+
+    def _resume(self, gop):
+
+        if gop is None:
+            self._spill, self._spilled_bytes = [], 0
+            return
+
+        self._open_segment(gop["start"])
+        self._index.add(0, 0, frame_capture_time(gop["frames"][0]) or gop["start"])
+
+        for frame in gop["frames"]:
+            self._file.write(frame)
+            self._bytes += len(frame)
+            self._frames += 1
+
+        self._spill, self._spilled_bytes = [], 0
+
+    # --- Segment files ---
+
+    def _open_segment(self, now: float):
+
+        self._name = self.store.new_segment_name()
+        self._file = open(self.store.path(self._name), "wb")
+        self._index = KeyframeIndexWriter(self.store.path(self._name))
+        self._start = now
+        self._bytes = 0
+        self._frames = 0
+
+    def _close_segment(self, now: float):
+
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._index.close()
+        self._file = None
+        self.store.commit(self._name, self._start, now - self._start, self._bytes, self._frames)
+
+    def _abandon_segment(self, now: float):
+        """Keep what made it to disk of a segment whose write failed, or drop the file if nothing did."""
+
+        if self._file is None:
+            return
+
+        for f in (self._file, self._index):
+            try:
+                f.close()
+
+            except (OSError, AttributeError):
+                pass
+
+        self._file = None
+
+        if self._frames:
+            try:
+                self.store.commit(self._name, self._start, now - self._start, self._bytes, self._frames)
+                return
+
+            except OSError as e:
+                logger.error(f"[Segmented output] Failed to commit partial segment {self._name}: {e}")
+
+        self._remove_file(self._name)
+
+    def _remove_file(self, name: str):
+
+        try:
+            os.remove(self.store.path(name))
+
+        except OSError:
+            pass
+
+        remove_index(self.store.path(name))
+
+    def stop(self):
+
+        super().stop()
+
+        with self._lock:
+            self._close_segment(time.time())
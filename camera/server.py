@@ -1,11 +1,17 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse
-import json
+from urllib.parse import urlparse, parse_qs
+from email.utils import formatdate
+import json, base64
+import control
 #import warning_lights
 
 # global route mapping
 routes = {}
 
+# latest snapshot per camera as (etag, jpeg), so a JPEG only crosses the control
+# socket when the camera has a new one
+snapshots = {}
+
 def route(method, path):
     def decorator(func):
         if method not in routes:
@@ -58,6 +64,9 @@ class ServerHandler(BaseHTTPRequestHandler):
         else:
             self.send_error(404)
 
+    def get_query(self):
+        return {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+
     def get_payload(self):
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
@@ -99,6 +108,30 @@ def validate_rate(rate):
         return False, "Rate must be a positive integer/float"
 
     return True, None
+
+def validate_post_roll(post_roll):
+
+    if not isinstance(post_roll, (int, float)) or post_roll < 0:
+        return False, "Post roll must be a non-negative number of seconds"
+
+    elif post_roll > 60:
+        return False, "Post roll is too long"
+
+    return True, None
+
+def validate_camera(camera):
+
+    if not isinstance(camera, int) or isinstance(camera, bool) or camera < 0:
+        return False, "Camera must be a non-negative camera index"
+
+    return True, None
+
+def send_json(handler, status, response):
+
+    handler.send_response(status)
+    handler.send_header('Content-type', 'application/json')
+    handler.end_headers()
+    handler.wfile.write(json.dumps(response).encode('utf-8'))
               
 # routes and methods defined here
 @route('POST', '/warning_light')
@@ -172,5 +205,184 @@ def warning_light(self):
         self.end_headers()
         self.wfile.write(json.dumps(response).encode('utf-8'))
 
+@route('POST', '/trigger_clip')
+def trigger_clip(self):
+
+    try:
+
+        payload = self.get_payload()
+        post_roll = payload.get('post_roll', 10) # seconds of footage to keep after the trigger
+        label = payload.get('label') # optional tag added to the clip file name
+        camera = payload.get('camera', 0) # camera index on installs with several sensors
+
+        valid_post_roll, post_roll_error = validate_post_roll(post_roll)
+        valid_camera, camera_error = validate_camera(camera)
+
+        if not (valid_post_roll and valid_camera):
+
+            response = {
+                "status" : "error",
+                "error" : "Bad Request",
+                "message" : [error for error in (post_roll_error, camera_error) if error]
+            }
+            send_json(self, 400, response)
+            return
+
+        # The pre-event buffer lives in the camera process, so the trigger is
+        # forwarded over the camera's control socket
+        try:
+            result = control.send_command("trigger_clip", {"post_seconds": post_roll, "label": label, "camera": camera})
+
+        except OSError:
+
+            response = {
+                "status" : "error",
+                "error" : "Service Unavailable",
+                "message" : "Camera process is not reachable",
+            }
+            send_json(self, 503, response)
+            return
+
+        if result.get("status") != "success":
+
+            response = {
+                "status" : "error",
+                "error" : "Internal Server Error",
+                "message" : result.get("message", "Clip could not be saved"),
+            }
+            send_json(self, 500, response)
+            return
+
+        response = {
+            "status" : "success",
+            "message" : "Clip triggered",
+            "clip" : result["result"]
+        }
+        send_json(self, 200, response)
+
+    except Exception as e:
+
+        response = {
+            "status" : "error",
+            "error" : "Internal Server Error",
+            "message" : "An unexpected error occured on the server.",
+        }
+        send_json(self, 500, response)
+
+@route('POST', '/reload_config')
+def reload_config(self):
+
+    # The camera process re-reads its config file and applies the changes
+    # through the cheapest path it can, the summary says which one
+    try:
+        result = control.send_command("reload_config", timeout=30)
+
+    except OSError:
+
+        response = {
+            "status" : "error",
+            "error" : "Service Unavailable",
+            "message" : "Camera process is not reachable",
+        }
+        send_json(self, 503, response)
+        return
+
+    if result.get("status") != "success":
+
+        response = {
+            "status" : "error",
+            "error" : "Internal Server Error",
+            "message" : result.get("message", "Config could not be reloaded"),
+        }
+        send_json(self, 500, response)
+        return
+
+    response = {
+        "status" : "success",
+        "message" : "Config reloaded",
+        "reload" : result["result"]
+    }
+    send_json(self, 200, response)
+
+@route('GET', '/metrics')
+def metrics(self):
+
+    # Metrics are collected inside the camera process and rendered there in
+    # the Prometheus text format, this route only relays them
+    try:
+        result = control.send_command("metrics")
+
+    except OSError:
+        self.send_error(503, "Camera process is not reachable")
+        return
+
+    if result.get("status") != "success":
+        self.send_error(500, "Metrics unavailable")
+        return
+
+    body = result["result"].encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-type', 'text/plain; version=0.0.4')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+@route('GET', '/snapshot')
+def snapshot(self):
+
+    # Stills are encoded in the camera process at most every few seconds and
+    # cached on both sides, polling clients only ever get the cached JPEG
+    try:
+        camera = int(self.get_query().get('camera', 0))
+
+    except ValueError:
+        camera = None
+
+    valid_camera, camera_error = validate_camera(camera)
+    if not valid_camera:
+        self.send_error(400, camera_error)
+        return
+
+    etag, jpeg = snapshots.get(camera, (None, None))
+
+    try:
+        result = control.send_command("snapshot", {"camera": camera, "etag": etag})
+
+    except OSError:
+        self.send_error(503, "Camera process is not reachable")
+        return
+
+    if result.get("status") != "success":
+        self.send_error(500, result.get("message", "Snapshot unavailable"))
+        return
+
+    snapshot = result["result"]
+
+    if "jpeg" in snapshot:
+        etag, jpeg = snapshot["etag"], base64.b64decode(snapshot["jpeg"])
+        snapshots[camera] = (etag, jpeg)
+
+    quoted = f'"{etag}"'
+    headers = {
+        'ETag': quoted,
+        'Cache-Control': 'no-cache',
+        'Last-Modified': formatdate(snapshot["timestamp"], usegmt=True),
+    }
+
+    if quoted in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+        self.send_response(304)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        return
+
+    self.send_response(200)
+    self.send_header('Content-type', 'image/jpeg')
+    self.send_header('Content-Length', str(len(jpeg)))
+    for name, value in headers.items():
+        self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(jpeg)
+
 if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -0,0 +1,390 @@
+import time, threading, collections, logging
+from picamera2 import Picamera2
+from picamera2.outputs import Output
+from picamera2.encoders import H264Encoder
+
+logger = logging.getLogger(__name__)
+
+# --- Output fan-out ---
+
+class OutputFanout(Output):
+    """
+    The single output the encoder writes to. It forwards every encoded frame to
+    whichever outputs are attached at the time, so outputs can be attached and
+    detached while the camera and encoder keep running.
+
+    A newly attached output only receives frames from the next keyframe on, since
+    anything before that cannot be decoded. The encoder is asked for one straight
+    away, so the output doesn't wait for the rest of the GOP.
+
+    annotate, if set, is called as annotate(frame, keyframe, timestamp) once per
+    frame before it is forwarded and returns the frame to send, so every output
+    receives the same in-band metadata.
+
+    Encoder timestamps count from the sensor timestamp of the first frame, which
+    Picamera2 takes from the monotonic clock, so the fanout knows how long each
+    frame took from the sensor to here. latency() summarises the recent frames.
+
+    Outputs that mux the stream themselves (needs_add_stream) are told about the
+    encoder's stream when they attach and whenever the encoder starts again.
+    """
+
+    def __init__(self):
+
+        super().__init__()
+        self.annotate = None
+        self.encoder = None
+        self.stream_info = None
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._writing = None
+        self._totals = {}
+
+        self.frames = 0
+        self.bytes = 0
+        self.last_frame_time = None
+        self.uncovered_frames = 0
+        self.latencies = collections.deque(maxlen=300)
+
+    def attach(self, output: Output, passive=False):
+        """
+        Attach an output. Passive outputs (local buffers rather than real destinations)
+        receive frames but don't count towards coverage in uncovered_frames.
+        """
+
+        output.start()
+
+        with self._lock:
+            self._routes[output] = {
+                "attached": time.monotonic(),
+                "synced": None,
+                "passive": passive,
+                "frames": 0,
+                "bytes": 0,
+                "write_time": 0.0,
+                "last_write": None
+            }
+            stream_info = self.stream_info
+
+        if stream_info is not None and getattr(output, "needs_add_stream", False):
+            output._add_stream("video", stream_info["codec"], **stream_info["kwargs"])
+
+        if self.encoder is not None and hasattr(self.encoder, "force_key_frame"):
+            self.encoder.force_key_frame()
+
+    def detach(self, output: Output):
+
+        with self._lock:
+            route = self._routes.pop(output, None)
+
+            if route is not None:
+                totals = self._totals.setdefault(output, {"frames": 0, "bytes": 0})
+                totals["frames"] += route["frames"]
+                totals["bytes"] += route["bytes"]
+
+        if route is not None:
+            output.stop()
+
+    def outputs(self) -> list:
+
+        with self._lock:
+            return list(self._routes)
+
+    def stats(self, output: Output) -> dict:
+        """
+        Return cumulative frames, bytes and seconds spent inside the output's write
+        for an attached output, or None. A write that blocks means the output
+        (for example ffmpeg pushing to a congested uplink) can't keep up.
+        """
+
+        with self._lock:
+            route = self._routes.get(output)
+            if route is None:
+                return None
+            return {"frames": route["frames"], "bytes": route["bytes"], "write_time": route["write_time"]}
+
+    def totals(self, output: Output) -> dict:
+        """Return the frames and bytes written to an output over every time it has been attached."""
+
+        with self._lock:
+            totals = dict(self._totals.get(output, {"frames": 0, "bytes": 0}))
+            route = self._routes.get(output)
+
+            if route is not None:
+                totals["frames"] += route["frames"]
+                totals["bytes"] += route["bytes"]
+
+            return totals
+
+    def write_progress(self, output: Output):
+        """
+        Return (last_write, blocked_for) for an attached output, or None: when it last
+        took a frame (when it was attached, before the first) and for how long the
+        write in progress to it has been blocked. Doesn't take the lock, which a
+        blocked write holds.
+        """
+
+        route = self._routes.get(output)
+
+        if route is None:
+            return None
+
+        writing = self._writing
+        blocked_for = time.monotonic() - writing[1] if writing is not None and writing[0] is output else 0.0
+        return route["last_write"] or route["attached"], blocked_for
+
+    def synced_at(self, output: Output):
+        """Return when the output received its first keyframe, or None if it is still waiting for one."""
+
+        with self._lock:
+            route = self._routes.get(output)
+            return route["synced"] if route else None
+
+    def latency(self) -> dict:
+        """Percentiles of the sensor to fanout latency over the recent frames in seconds, or None before any."""
+
+        with self._lock:
+            ordered = sorted(self.latencies)
+
+        if not ordered:
+            return None
+
+        return {f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in (50, 90, 99)} | {"max": ordered[-1]}
+
+    def _latency(self, timestamp):
+
+        first = getattr(self.encoder, "firsttimestamp", None)
+
+        if timestamp is None or first is None:
+            return None
+
+        return time.monotonic_ns() / 1e9 - (first + timestamp) / 1e6
+
+    def _add_stream(self, encoder_stream, codec_name, **kwargs):
+        """Called by the encoder as it starts, remembered for outputs that attach later."""
+
+        with self._lock:
+            self.stream_info = {"codec": codec_name, "kwargs": kwargs}
+            outputs = [output for output in self._routes if getattr(output, "needs_add_stream", False)]
+
+        for output in outputs:
+            output._add_stream("video", codec_name, **kwargs)
+
+    def start(self):
+
+        super().start()
+
+        # A restarted encoder begins a new stream, so every output has to
+        # resynchronise on its first keyframe
+        with self._lock:
+            for route in self._routes.values():
+                route["synced"] = None
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+
+        now = time.monotonic()
+        delivered = False
+        latency = None if audio else self._latency(timestamp)
+
+        if self.annotate is not None and not audio:
+            try:
+                frame = self.annotate(frame, keyframe, timestamp)
+
+            except Exception as e:
+                logger.error(f"[Session] Failed to annotate frame: {e}")
+
+        # The lock is held while writing so an output is never stopped halfway
+        # through a frame
+        with self._lock:
+
+            for output, route in self._routes.items():
+
+                if route["synced"] is None:
+                    if not keyframe:
+                        continue
+                    route["synced"] = now
+
+                try:
+                    write_start = time.monotonic()
+                    self._writing = (output, write_start)
+                    output.outputframe(frame, keyframe, timestamp, packet, audio)
+                    route["last_write"] = time.monotonic()
+                    route["write_time"] += route["last_write"] - write_start
+                    route["frames"] += 1
+                    route["bytes"] += len(frame)
+                    delivered = delivered or not route["passive"]
+
+                except Exception as e:
+                    logger.error(f"[Session] Output {type(output).__name__} failed to write frame: {e}")
+
+                finally:
+                    self._writing = None
+
+            self.frames += 1
+            self.bytes += len(frame)
+            self.last_frame_time = now
+
+            if latency is not None:
+                self.latencies.append(latency)
+
+            if not delivered:
+                self.uncovered_frames += 1
+
+# --- Camera session ---
+
+class CameraSession:
+    """
+    One long-lived Picamera2 and H.264 encoder pair. Mode changes swap the attached
+    outputs (RTSP, file segments or both) instead of tearing the camera down.
+    encoder_name picks the hardware encoder ("h264") or libav's software one ("libav").
+    profile is the H.264 profile, "baseline" rules out B-frames.
+    """
+
+    def __init__(self, picam: Picamera2, keyframe_interval=30, bitrate=None, switch_timeout=3, encoder_name="h264", profile=None):
+
+        self.picam = picam
+        self.keyframe_interval = keyframe_interval
+        self.bitrate = bitrate
+        self.encoder_name = encoder_name
+        self.profile = profile
+        self.switch_timeout = switch_timeout
+        self.fanout = OutputFanout()
+        self.encoder = None
+        self._pinned = []
+        self._lock = threading.RLock()
+
+    def _create_encoder(self):
+
+        if self.encoder_name == "libav":
+            # Only in newer picamera2 releases, and only needed when it is selected
+            from picamera2.encoders import LibavH264Encoder
+            encoder = LibavH264Encoder(bitrate=self.bitrate, iperiod=self.keyframe_interval, profile=self.profile)
+
+        else:
+            encoder = H264Encoder(bitrate=self.bitrate, iperiod=self.keyframe_interval, profile=self.profile)
+
+        self.fanout.encoder = encoder
+        return encoder
+
+    def start(self):
+
+        with self._lock:
+            self.encoder = self._create_encoder()
+            self.picam.start_recording(self.encoder, self.fanout)
+
+    def stop(self):
+
+        with self._lock:
+            self.picam.stop_recording()
+            self.picam.stop()
+
+    def restart(self, delay=2):
+        """Restart the camera and encoder, keeping the attached outputs running."""
+
+        with self._lock:
+            self.stop()
+            time.sleep(delay)
+            self.start()
+
+    def set_controls(self, controls: dict):
+        """Apply camera controls such as FrameRate on the fly. Costs no frames."""
+
+        self.picam.set_controls(controls)
+        logger.info(f"[Session] Applied controls {controls}")
+
+    def restart_encoder(self, bitrate=None, encoder_name=None, keyframe_interval=None) -> float:
+        """
+        Replace only the encoder, for settings the encoder fixes at start such as the
+        bitrate or keyframe interval. Settings left as None are kept. The camera keeps
+        running. Returns the measured downtime in seconds.
+        """
+
+        with self._lock:
+            start = time.monotonic()
+            self.picam.stop_encoder(self.encoder)
+            self.bitrate = bitrate or self.bitrate
+            self.encoder_name = encoder_name or self.encoder_name
+            self.keyframe_interval = keyframe_interval or self.keyframe_interval
+            self.encoder = self._create_encoder()
+            self.picam.start_encoder(self.encoder, self.fanout)
+            downtime = time.monotonic() - start
+
+        logger.info(
+            f"[Session] {self.encoder_name} encoder restarted with bitrate {self.bitrate}, "
+            f"keyframe interval {self.keyframe_interval} in {downtime * 1000:.0f} ms"
+        )
+        return downtime
+
+    def reconfigure(self, config: dict, bitrate=None) -> float:
+        """
+        Apply a new camera configuration (for example a different stream size). This
+        needs the camera stopped, but the attached outputs stay up. Returns the
+        measured downtime in seconds.
+        """
+
+        with self._lock:
+            start = time.monotonic()
+            self.stop()
+            self.picam.configure(config)
+            if bitrate is not None:
+                self.bitrate = bitrate
+            self.start()
+            downtime = time.monotonic() - start
+
+        logger.info(f"[Session] Camera reconfigured in {downtime * 1000:.0f} ms")
+        return downtime
+
+    def close(self):
+
+        for output in self.fanout.outputs():
+            self.fanout.detach(output)
+
+        self.stop()
+
+    def pin(self, output: Output):
+        """Attach an output that stays attached across mode switches, such as the pre-event buffer."""
+
+        self._pinned.append(output)
+        self.fanout.attach(output, passive=True)
+
+    def switch_to(self, *outputs: Output) -> float:
+        """
+        Make the given outputs the only attached ones, apart from pinned outputs.
+
+        New outputs are attached first and the old ones are only detached once the
+        new ones have received a keyframe (or switch_timeout expires), so every
+        encoded frame lands somewhere decodable during the transition. Returns the
+        measured switch time in seconds.
+        """
+
+        with self._lock:
+            return self._switch_to(outputs)
+
+    def _switch_to(self, outputs: tuple) -> float:
+
+        start = time.monotonic()
+        uncovered_before = self.fanout.uncovered_frames
+        current = [o for o in self.fanout.outputs() if o not in self._pinned]
+        new_outputs = [o for o in outputs if o not in current]
+
+        for output in new_outputs:
+            self.fanout.attach(output)
+
+        deadline = start + self.switch_timeout
+        while any(self.fanout.synced_at(o) is None for o in new_outputs) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        for output in current:
+            if output not in outputs:
+                self.fanout.detach(output)
+
+        elapsed = time.monotonic() - start
+        lost = self.fanout.uncovered_frames - uncovered_before
+        names = ", ".join(type(o).__name__ for o in outputs) or "no outputs"
+
+        if any(self.fanout.synced_at(o) is None for o in new_outputs):
+            logger.warning(f"[Session] Switched to {names} without a keyframe after {elapsed * 1000:.0f} ms")
+        else:
+            logger.info(f"[Session] Switched to {names} in {elapsed * 1000:.0f} ms, {lost} frames lost")
+
+        return elapsed
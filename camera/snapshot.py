@@ -0,0 +1,75 @@
+import time, base64, hashlib, threading, logging
+
+logger = logging.getLogger(__name__)
+
+# --- JPEG encoding ---
+# simplejpeg is what Picamera2's own JpegEncoder uses, so it comes with picamera2.
+# It is imported on first use to keep this module importable without it.
+
+def encode_yuv420(frame, size: tuple, stride=None, quality=80) -> bytes:
+    """
+    Encode a YUV420 lores frame straight from its planes, without converting to
+    RGB. Rows are stride bytes long (stride / 2 for U and V), which is often more
+    than the width, so each plane is cropped to the picture.
+    """
+
+    import simplejpeg
+
+    width, height = size
+    stride = stride or width
+    planes = frame.reshape(-1)
+    y = planes[:stride * height].reshape(height, stride)[:, :width]
+    u = planes[stride * height:stride * height * 5 // 4].reshape(height // 2, stride // 2)[:, :width // 2]
+    v = planes[stride * height * 5 // 4:stride * height * 3 // 2].reshape(height // 2, stride // 2)[:, :width // 2]
+    return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=quality)
+
+def encode_rgbx(frame, quality=80) -> bytes:
+    """Encode a main stream frame, which Picamera2 returns as XBGR8888, that is RGBX in memory."""
+
+    import simplejpeg
+    return simplejpeg.encode_jpeg(frame, quality=quality, colorspace="RGBX")
+
+# --- Snapshot cache ---
+
+class SnapshotCache:
+    """
+    Holds the latest still as an encoded JPEG so any number of clients can poll
+    it without extra encoding. capture() returns (jpeg, timestamp) and is called
+    at most once every max_age seconds, and only when someone asks for a snapshot.
+    The ETag is a hash of the JPEG, so it stays valid across restarts.
+    """
+
+    def __init__(self, capture, max_age=5):
+
+        self.capture = capture
+        self.max_age = max_age
+        self.encoded = 0
+
+        self._jpeg = None
+        self._etag = None
+        self._timestamp = None
+        self._captured_at = None
+        self._lock = threading.Lock()
+
+    def get(self, etag=None) -> dict:
+        """
+        Return the current snapshot as {"etag", "timestamp", "jpeg"} with the JPEG
+        in base64. The JPEG is left out when etag is still current.
+        """
+
+        # Requests that arrive while a capture is running wait for it and share it
+        with self._lock:
+            now = time.monotonic()
+
+            if self._captured_at is None or now - self._captured_at >= self.max_age:
+                jpeg, self._timestamp = self.capture()
+                self._jpeg, self._etag = jpeg, hashlib.blake2b(jpeg, digest_size=8).hexdigest()
+                self._captured_at = now
+                self.encoded += 1
+
+            snapshot = {"etag": self._etag, "timestamp": self._timestamp}
+
+            if etag != self._etag:
+                snapshot["jpeg"] = base64.b64encode(self._jpeg).decode("ascii")
+
+            return snapshot
@@ -0,0 +1,119 @@
+import os, glob, time, threading, logging
+from segment_store import SegmentStore, SegmentedOutput
+from keyframe_index import remove_index
+
+logger = logging.getLogger(__name__)
+
+# --- Disk readings ---
+
+def disk_free_bytes(path: str) -> int:
+    """Return the bytes available to unprivileged writers on the filesystem holding path."""
+
+    stats = os.statvfs(path)
+    return stats.f_bavail * stats.f_frsize
+
+# --- Storage governor ---
+
+class StorageGovernor(threading.Thread):
+    """
+    Keeps the recording filesystem from filling up.
+
+    Once free space drops below low_mb our own recordings are evicted, oldest
+    first across buffered segments and saved clips, until free space is back
+    above high_mb. Anything the segmented output spilled to RAM while the disk
+    was full is then written back. Clips modified within clip_grace seconds may
+    still be written and are left alone.
+    """
+
+    def __init__(self, path: str, store: SegmentStore, segment_output: SegmentedOutput = None, clips_dir=None,
+                 low_mb=200, high_mb=400, interval=5, clip_grace=60):
+
+        super().__init__(name="storage", daemon=True)
+        self.path = path
+        self.store = store
+        self.segment_output = segment_output
+        self.clips_dir = clips_dir
+        self.low_bytes = low_mb * 1024 * 1024
+        self.high_bytes = high_mb * 1024 * 1024
+        self.interval = interval
+        self.clip_grace = clip_grace
+
+        self.free_bytes = None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+
+        while True:
+
+            try:
+                self.step()
+
+            except Exception as e:
+                logger.error(f"[Storage] Failed to check disk space: {e}")
+
+            if self._stopped.wait(self.interval):
+                break
+
+    def step(self):
+
+        self.free_bytes = disk_free_bytes(self.path)
+
+        if self.free_bytes < self.low_bytes:
+            logger.warning(f"[Storage] {self.free_bytes / (1024 * 1024):.0f} MB free, evicting oldest recordings")
+            self.evict()
+
+        if self.segment_output is not None and self.segment_output.spilling and self.free_bytes >= self.low_bytes:
+            self.segment_output.drain_spill()
+
+    def recordings(self) -> list:
+        """Return (timestamp, kind, name, size) for every evictable recording, oldest first."""
+
+        recordings = [(e["start"], "segment", e["name"], e["bytes"]) for e in self.store.entries()]
+
+        if self.clips_dir:
+            cutoff = time.time() - self.clip_grace
+
+            for path in glob.glob(os.path.join(self.clips_dir, "*.h264")):
+                try:
+                    stats = os.stat(path)
+
+                except OSError:
+                    continue
+
+                if stats.st_mtime < cutoff:
+                    recordings.append((stats.st_mtime, "clip", path, stats.st_size))
+
+        return sorted(recordings)
+
+    def evict(self):
+
+        for _, kind, name, size in self.recordings():
+
+            if self.free_bytes >= self.high_bytes:
+                break
+
+            try:
+                if kind == "segment":
+                    self.store.remove(name)
+                else:
+                    os.remove(name)
+                    remove_index(name)
+
+            except OSError as e:
+                # Removing a segment also rewrites the manifest, which can itself
+                # fail on a full disk after the file is already gone
+                logger.error(f"[Storage] Error evicting {name}: {e}")
+
+            self.evicted_files += 1
+            self.evicted_bytes += size
+            logger.info(f"[Storage] Evicted {kind} {os.path.basename(name)} ({size / 1024:.0f} KB)")
+
+            self.free_bytes = disk_free_bytes(self.path)
+
+        if self.free_bytes < self.low_bytes:
+            logger.error(f"[Storage] Only {self.free_bytes / (1024 * 1024):.0f} MB free after evicting every recording")
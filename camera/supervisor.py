@@ -0,0 +1,234 @@
+import time, errno, random, logging, collections
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# --- Pipeline states ---
+INIT = "init"
+LIVE = "live"
+OFFLINE = "offline"
+BACKFILL = "backfill"
+RECOVERING = "recovering"
+FATAL = "fatal"
+
+RUNNING_STATES = (LIVE, OFFLINE, BACKFILL)
+
+# --- Recovery decisions ---
+RETRY = "retry"
+REINIT = "reinit"
+
+RECOVERY_SECONDS = registry.counter("eleeye_recovery_seconds_total", "Time spent recovering, by failure class")
+RECOVERED = registry.counter("eleeye_recovered_total", "Completed recoveries, by failure class")
+PIPELINE_STATE = registry.gauge("eleeye_pipeline_state", "1 for the current supervisor state, 0 for the others")
+
+# --- Failure classification ---
+
+# A missing camera can't be fixed from software, everything else gets a retry budget
+FATAL_CLASSES = ("device_missing",)
+
+def classify(error: BaseException) -> str:
+    """Map an exception raised by the camera pipeline to a failure class."""
+
+    if isinstance(error, MemoryError):
+        return "memory"
+
+    if isinstance(error, OSError):
+
+        classes = {
+            errno.ENODEV: "device_missing",
+            errno.EBUSY: "busy",
+            errno.ENOMEM: "memory",
+            errno.EPIPE: "pipe",
+            errno.ENOSPC: "disk",
+            errno.ENFILE: "fds",
+            errno.EMFILE: "fds",
+            errno.EIO: "io",
+        }
+
+        if error.errno in classes:
+            return classes[error.errno]
+
+        if isinstance(error, ConnectionError):
+            return "pipe"
+
+        return "other"
+
+    if isinstance(error, RuntimeError):
+
+        message = str(error).lower()
+
+        if "not found" in message:
+            return "device_missing"
+
+        if "buffer" in message or "mmal error" in message or "encoder" in message:
+            return "encoder"
+
+    return "other"
+
+# --- Retry budget ---
+
+class RetryBudget:
+    """
+    Allows a number of attempts per sliding time window, with exponential backoff
+    and jitter between them. The jitter keeps a fleet of nodes that lost the same
+    server from all retrying in lockstep.
+    """
+
+    def __init__(self, attempts=5, window=600, base_delay=1, max_delay=30, jitter=0.25):
+
+        self.attempts = attempts
+        self.window = window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._failures = collections.deque()
+
+    def _prune(self, now: float):
+
+        while self._failures and self._failures[0] <= now - self.window:
+            self._failures.popleft()
+
+    def exhausted(self, now: float) -> bool:
+
+        self._prune(now)
+        return len(self._failures) >= self.attempts
+
+    def record(self, now: float):
+        self._failures.append(now)
+
+    def delay(self, now: float) -> float:
+        """Backoff before the next attempt, growing with the failures already in the window."""
+
+        self._prune(now)
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, len(self._failures) - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+def default_budgets() -> dict:
+
+    return {
+        "busy": RetryBudget(attempts=3, window=300, base_delay=1, max_delay=10),
+        "memory": RetryBudget(attempts=3, window=600, base_delay=5, max_delay=60),
+        "pipe": RetryBudget(attempts=10, window=600, base_delay=1, max_delay=30),
+        "disk": RetryBudget(attempts=5, window=600, base_delay=5, max_delay=60),
+        "fds": RetryBudget(attempts=3, window=600, base_delay=2, max_delay=30),
+        "encoder": RetryBudget(attempts=5, window=600, base_delay=2, max_delay=30),
+        "io": RetryBudget(attempts=5, window=600, base_delay=2, max_delay=30),
+        "other": RetryBudget(attempts=5, window=600, base_delay=2, max_delay=30),
+        # Cold restarts of the whole camera session, the last step before giving up
+        REINIT: RetryBudget(attempts=3, window=1800, base_delay=5, max_delay=120),
+    }
+
+# --- Supervisor ---
+
+class Supervisor:
+    """
+    Explicit state machine for the camera pipeline.
+
+    Every failure is classified and charged against that class's retry budget.
+    While the budget lasts the class specific remediation runs after a jittered
+    backoff. Once it is spent the supervisor escalates to an in-process cold
+    restart of the camera session, and only when those are spent too does the
+    pipeline go fatal. Time to recover is measured from the first failure until
+    the pipeline is back in a running state. With several cameras each one has
+    its own supervisor, named after the camera in logs and metric labels.
+    """
+
+    def __init__(self, budgets=None, sleep=time.sleep, camera=None):
+
+        self.budgets = budgets or default_budgets()
+        self.sleep = sleep
+        self.labels = {"camera": camera} if camera else {}
+        self.tag = f"[Supervisor {camera}]" if camera else "[Supervisor]"
+        self.state = INIT
+        PIPELINE_STATE.set(1, state=INIT, **self.labels)
+        self.history = collections.deque(maxlen=100)
+        self.recovery_times = collections.defaultdict(list)
+
+        self._failed_at = None
+        self._failure_class = None
+
+    def transition(self, state: str, reason=None):
+
+        if state == self.state:
+            return
+
+        now = time.monotonic()
+        self.history.append((now, self.state, state, reason))
+        logger.info(f"{self.tag} {self.state} -> {state}" + (f" ({reason})" if reason else ""))
+
+        if state in RUNNING_STATES and self._failed_at is not None:
+            self._record_recovery(now - self._failed_at)
+
+        PIPELINE_STATE.set(0, state=self.state, **self.labels)
+        PIPELINE_STATE.set(1, state=state, **self.labels)
+        self.state = state
+
+    def _record_recovery(self, elapsed: float):
+
+        failure_class = self._failure_class
+        times = self.recovery_times[failure_class]
+        times.append(elapsed)
+
+        RECOVERY_SECONDS.inc(elapsed, failure=failure_class, **self.labels)
+        RECOVERED.inc(failure=failure_class, **self.labels)
+        logger.info(f"{self.tag} Recovered from {failure_class} in {elapsed:.1f}s (mean {sum(times) / len(times):.1f}s over {len(times)})")
+
+        self._failed_at = None
+        self._failure_class = None
+
+    def mttr(self, failure_class=None):
+        """Mean time to recover in seconds for one failure class, or over all of them."""
+
+        times = self.recovery_times[failure_class] if failure_class else [t for ts in self.recovery_times.values() for t in ts]
+        return sum(times) / len(times) if times else None
+
+    def recover(self, error: BaseException, action) -> str:
+        """
+        Handle a pipeline failure. Runs action(failure_class) after the backoff while
+        the class budget lasts and returns RETRY. Returns REINIT when the caller should
+        tear down and rebuild the camera session, or FATAL when nothing is left to try.
+        """
+
+        failure_class = classify(error)
+        now = time.monotonic()
+
+        if self._failed_at is None:
+            self._failed_at = now
+            self._failure_class = failure_class
+
+        self.transition(RECOVERING, f"{failure_class}: {error}")
+
+        if failure_class in FATAL_CLASSES:
+            self.transition(FATAL, f"unrecoverable {failure_class}")
+            return FATAL
+
+        budget = self.budgets.get(failure_class, self.budgets["other"])
+        decision = RETRY
+
+        if budget.exhausted(now):
+
+            budget = self.budgets[REINIT]
+
+            if budget.exhausted(now):
+                self.transition(FATAL, f"retry budget for {failure_class} and cold restarts exhausted")
+                return FATAL
+
+            logger.warning(f"{self.tag} Retry budget for {failure_class} exhausted, escalating to a camera cold restart")
+            decision = REINIT
+
+        delay = budget.delay(now)
+        budget.record(now)
+        logger.info(f"{self.tag} Recovering from {failure_class} in {delay:.1f}s")
+        self.sleep(delay)
+
+        if decision == REINIT:
+            return REINIT
+
+        try:
+            action(failure_class)
+
+        except Exception as e:
+            # The next failure of the pipeline will be charged to the budget again
+            logger.error(f"{self.tag} Recovery action for {failure_class} failed: {e}")
+
+        return RETRY
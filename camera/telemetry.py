@@ -0,0 +1,298 @@
+import os, math, time, uuid, struct, threading, logging
+
+logger = logging.getLogger(__name__)
+
+# Identifies our SEI messages among any other user_data_unregistered payloads
+TELEMETRY_UUID = uuid.UUID("6c1b2f4e-9a53-4d2e-8f0c-3e5a7b1d9c42")
+
+# version, sequence number, capture time in microseconds since the epoch, latitude, longitude
+TELEMETRY_FORMAT = ">BQqdd"
+TELEMETRY_VERSION = 1
+
+NAL_SEI = 6
+SEI_USER_DATA_UNREGISTERED = 5
+START_CODE = b"\x00\x00\x00\x01"
+
+# --- Location ---
+
+def read_location_metadata(file_path: str):
+    """
+    Read latitude and longitude from the configuration file.
+    The file should contain latitude on the first line and longitude on the second.
+    """
+    try:
+        with open(file_path, 'r') as f:
+
+            lines = f.readlines()
+
+            if len(lines) != 2:
+                raise ValueError("Configuration file must contain exactly two lines (latitude and longitude)")
+
+            latitude = float(lines[0].strip())
+            longitude = float(lines[1].strip())
+            logger.info(f"Location metadata read: latitude={latitude}, longitude={longitude}")
+
+            return latitude, longitude
+
+    except Exception as e:
+        logger.error(f"Failed to read configuration file: {e}")
+        return None
+
+class LocationSource:
+    """
+    The camera location from location.txt, re-read whenever the file's mtime
+    changes. The mtime is checked at most once per check_interval, so calling
+    get() for every frame costs a clock read.
+    """
+
+    def __init__(self, path: str, check_interval=1.0):
+
+        self.path = path
+        self.check_interval = check_interval
+        self.location = None
+
+        self._mtime = None
+        self._checked = None
+
+    def get(self):
+        """Return (latitude, longitude), or None if no valid location has been read."""
+
+        now = time.monotonic()
+
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return self.location
+
+        self._checked = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+
+        except OSError:
+            return self.location
+
+        if mtime != self._mtime:
+            self._mtime = mtime
+            location = read_location_metadata(self.path)
+
+            # Keep the last good location if the file is caught halfway through an edit
+            if location is not None:
+                self.location = location
+
+        return self.location
+
+# --- SEI encoding ---
+
+def escape_rbsp(data: bytes) -> bytes:
+    """Insert emulation prevention bytes so the payload never contains a start code."""
+
+    out = bytearray()
+    zeros = 0
+
+    for byte in data:
+        if zeros >= 2 and byte <= 3:
+            out.append(3)
+            zeros = 0
+
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+
+    return bytes(out)
+
+def unescape_rbsp(data: bytes) -> bytes:
+
+    out = bytearray()
+    zeros = 0
+
+    for byte in data:
+        if zeros >= 2 and byte == 3:
+            zeros = 0
+            continue
+
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+
+    return bytes(out)
+
+def build_sei(user_data: bytes, uuid_=TELEMETRY_UUID) -> bytes:
+    """Build an Annex-B SEI NAL unit carrying one user_data_unregistered message."""
+
+    payload = uuid_.bytes + user_data
+    size = len(payload)
+    rbsp = bytes([SEI_USER_DATA_UNREGISTERED]) + b"\xff" * (size // 255) + bytes([size % 255]) + payload + b"\x80"
+
+    return START_CODE + bytes([NAL_SEI]) + escape_rbsp(rbsp)
+
+def parse_sei(nal: bytes) -> list:
+    """Return (uuid, user_data) for every user_data_unregistered message in an SEI NAL unit (without start code)."""
+
+    rbsp = unescape_rbsp(nal[1:])
+    messages = []
+    pos = 0
+
+    # Stop at the rbsp trailing bits
+    while pos < len(rbsp) and rbsp[pos] != 0x80:
+
+        payload_type = payload_size = 0
+
+        while rbsp[pos] == 0xff:
+            payload_type += 255
+            pos += 1
+        payload_type += rbsp[pos]
+        pos += 1
+
+        while rbsp[pos] == 0xff:
+            payload_size += 255
+            pos += 1
+        payload_size += rbsp[pos]
+        pos += 1
+
+        payload = rbsp[pos:pos + payload_size]
+        pos += payload_size
+
+        if payload_type == SEI_USER_DATA_UNREGISTERED and len(payload) >= 16:
+            messages.append((uuid.UUID(bytes=payload[:16]), payload[16:]))
+
+    return messages
+
+def nal_units(data: bytes):
+    """Yield (offset of the start code, NAL unit without start code) for an Annex-B byte stream."""
+
+    pos = data.find(b"\x00\x00\x01")
+
+    while pos != -1:
+
+        following = data.find(b"\x00\x00\x01", pos + 3)
+        end = len(data) if following == -1 else following
+
+        # A four byte start code leaves its leading zero at the end of the previous unit
+        if following != -1 and data[end - 1] == 0:
+            end -= 1
+
+        yield (pos - 1 if pos > 0 and data[pos - 1] == 0 else pos), data[pos + 3:end]
+        pos = following
+
+def insert_sei(frame: bytes, sei: bytes) -> bytes:
+    """
+    Insert an SEI NAL unit before the first slice of an access unit, after any
+    AUD/SPS/PPS. Only the NAL headers up to the first slice are looked at, so the
+    slice data itself is never scanned.
+    """
+
+    pos = frame.find(b"\x00\x00\x01")
+
+    while pos != -1 and pos + 3 < len(frame):
+
+        if 1 <= frame[pos + 3] & 0x1f <= 5:
+            offset = pos - 1 if pos > 0 and frame[pos - 1] == 0 else pos
+            return frame[:offset] + sei + frame[offset:]
+
+        pos = frame.find(b"\x00\x00\x01", pos + 3)
+
+    # Parameter sets only, there is no picture to tag
+    return frame
+
+def tag_pictures(data: bytes, user_data) -> bytes:
+    """
+    Insert an SEI NAL unit in front of the first slice of every picture in an
+    Annex-B stream, for footage re-encoded outside the camera. user_data(n)
+    returns the payload for the n-th picture.
+    """
+
+    out = bytearray()
+    pictures = last = 0
+
+    for offset, nal in nal_units(data):
+
+        # first_mb_in_slice == 0 (a leading 1 bit) marks the first slice of a picture
+        if len(nal) > 1 and 1 <= nal[0] & 0x1f <= 5 and nal[1] & 0x80:
+            out += data[last:offset]
+            out += build_sei(user_data(pictures))
+            last = offset
+            pictures += 1
+
+    out += data[last:]
+    return bytes(out)
+
+# --- Telemetry payload ---
+
+def pack_telemetry(sequence: int, capture_time: float, location=None) -> bytes:
+
+    lat, lon = location if location else (math.nan, math.nan)
+    return struct.pack(TELEMETRY_FORMAT, TELEMETRY_VERSION, sequence, int(capture_time * 1_000_000), lat, lon)
+
+def unpack_telemetry(user_data: bytes) -> dict:
+
+    version, sequence, capture_us, lat, lon = struct.unpack(TELEMETRY_FORMAT, user_data[:struct.calcsize(TELEMETRY_FORMAT)])
+
+    return {
+        "version": version,
+        "sequence": sequence,
+        "capture_time": capture_us / 1_000_000,
+        "lat": None if math.isnan(lat) else lat,
+        "lon": None if math.isnan(lon) else lon
+    }
+
+def extract_telemetry(data: bytes) -> list:
+    """Return the telemetry of every frame in an H.264 byte stream, for example a backfilled segment."""
+
+    records = []
+
+    for _, nal in nal_units(data):
+        if nal and nal[0] & 0x1f == NAL_SEI:
+            for message_uuid, user_data in parse_sei(nal):
+                if message_uuid == TELEMETRY_UUID:
+                    records.append(unpack_telemetry(user_data))
+
+    return records
+
+# --- Frame annotation ---
+
+class FrameTelemetry:
+    """
+    Tags every encoded frame with an SEI message carrying its capture time, a
+    sequence number and the camera location. The metadata travels with the video
+    through RTSP, offline segments and clips, so a location change needs no new
+    ffmpeg process and backfilled footage keeps its original capture time.
+
+    Encoder timestamps count microseconds from the first frame of the recording.
+    They are anchored to the wall clock on that first frame and re-anchored if the
+    two drift apart by more than max_drift, so frame spacing follows the sensor.
+    """
+
+    def __init__(self, location: LocationSource = None, max_drift=1.0):
+
+        self.location = location
+        self.max_drift = max_drift
+        self.sequence = 0
+
+        self._anchor = None
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+
+    def capture_time(self, timestamp) -> float:
+
+        now = time.time()
+
+        if timestamp is None:
+            return now
+
+        # A restarted encoder counts from zero again
+        if self._anchor is None or timestamp < self._last_timestamp:
+            self._anchor = now - timestamp / 1_000_000
+
+        self._last_timestamp = timestamp
+        capture_time = self._anchor + timestamp / 1_000_000
+
+        if abs(capture_time - now) > self.max_drift:
+            self._anchor = now - timestamp / 1_000_000
+            capture_time = now
+
+        return capture_time
+
+    def __call__(self, frame, keyframe=True, timestamp=None) -> bytes:
+
+        with self._lock:
+            self.sequence += 1
+            user_data = pack_telemetry(self.sequence, self.capture_time(timestamp), self.location.get() if self.location else None)
+
+        return insert_sei(bytes(frame), build_sei(user_data))
@@ -0,0 +1,161 @@
+import os, tempfile, unittest
+from unittest.mock import patch, MagicMock
+from adaptive import AdaptiveController, read_cpu_temperature, read_throttle_state
+
+LADDER = [
+    {"size": (1280, 720), "fps": 30, "bitrate": 2_000_000},
+    {"size": (1280, 720), "fps": 20, "bitrate": 1_000_000},
+    {"size": (640, 360), "fps": 15, "bitrate": 500_000},
+]
+
+
+class TestThermalReadings(unittest.TestCase):
+
+    def _cooling_device(self, directory, number, kind, state):
+
+        device = os.path.join(directory, f"cooling_device{number}")
+        os.mkdir(device)
+
+        for name, value in (("type", kind + "\n"), ("cur_state", state + "\n")):
+            with open(os.path.join(device, name), "w") as f:
+                f.write(value)
+
+    def test_read_temperature(self):
+
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("81234\n")
+        self.assertAlmostEqual(read_cpu_temperature(f.name), 81.234)
+        os.remove(f.name)
+
+    def test_missing_thermal_zone(self):
+        self.assertIsNone(read_cpu_temperature("/nonexistent/temp"))
+
+    def test_throttle_state(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, (kind, state) in enumerate([("cpufreq-cpu0", "0"), ("cpufreq-cpu2", "2")]):
+                self._cooling_device(tmp, i, kind, state)
+            self.assertEqual(read_throttle_state(os.path.join(tmp, "cooling_device*")), 2)
+
+    def test_fan_is_not_throttling(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self._cooling_device(tmp, 0, "cpufreq-cpu0", "0")
+            self._cooling_device(tmp, 1, "pwm-fan", "3")
+            self.assertEqual(read_throttle_state(os.path.join(tmp, "cooling_device*")), 0)
+
+
+@patch("adaptive.read_throttle_state", return_value=0)
+@patch("adaptive.read_cpu_temperature", return_value=50.0)
+class TestAdaptiveController(unittest.TestCase):
+
+    def setUp(self):
+
+        self.session = MagicMock()
+        self.output = MagicMock()
+        self.config_factory = MagicMock(return_value={"config": True})
+        self.now = 1000.0
+        self.stats = {"frames": 0, "bytes": 0, "write_time": 0.0}
+        self.session.fanout.stats.side_effect = lambda output: dict(self.stats)
+
+        self.time_patch = patch("adaptive.time.monotonic", side_effect=lambda: self.now)
+        self.time_patch.start()
+        self.controller = AdaptiveController(self.session, self.output, self.config_factory, ladder=LADDER,
+                                             min_dwell=10, upgrade_after=30, stall_threshold=0.25)
+
+    def tearDown(self):
+        self.time_patch.stop()
+
+    def _tick(self, seconds, bytes_sent, write_time):
+
+        self.now += seconds
+        self.stats["bytes"] += bytes_sent
+        self.stats["write_time"] += write_time
+        self.controller.step()
+
+    def test_stalled_output_steps_down_cheaply(self, mock_temp, mock_throttle):
+
+        self._tick(0, 0, 0)
+        self._tick(15, 1_000_000, 8.0)
+
+        self.assertEqual(self.controller.rung, 1)
+        self.session.restart_encoder.assert_called_with(1_000_000)
+        self.session.set_controls.assert_called_with({"FrameRate": 20})
+        self.session.reconfigure.assert_not_called()
+
+    def test_size_change_reconfigures(self, mock_temp, mock_throttle):
+
+        self.controller.rung = 1
+        self._tick(0, 0, 0)
+        self._tick(15, 1_000_000, 8.0)
+
+        self.config_factory.assert_called_with((640, 360), 15)
+        self.session.reconfigure.assert_called_with({"config": True}, bitrate=500_000)
+
+    def test_dwell_time_limits_changes(self, mock_temp, mock_throttle):
+
+        self._tick(0, 0, 0)
+        self._tick(15, 1_000_000, 8.0)
+        self._tick(5, 100_000, 4.0)
+
+        self.assertEqual(self.controller.rung, 1)
+
+    def test_upgrade_needs_sustained_health(self, mock_temp, mock_throttle):
+
+        self.controller.rung = 1
+        self._tick(20, 0, 0)
+        self._tick(20, 1_000_000, 0.1)
+        self.assertEqual(self.controller.rung, 1)
+
+        self._tick(20, 1_000_000, 0.1)
+        self._tick(20, 1_000_000, 0.1)
+        self.assertEqual(self.controller.rung, 0)
+
+    def test_overheating_steps_down_without_output(self, mock_temp, mock_throttle):
+
+        mock_temp.return_value = 85.0
+        self.session.fanout.stats.side_effect = lambda output: None
+        self._tick(15, 0, 0)
+
+        self.assertEqual(self.controller.rung, 1)
+
+    def test_rtt_rise_counts_as_congestion(self, mock_temp, mock_throttle):
+
+        self.controller.connectivity = MagicMock()
+        self.controller.connectivity.rtt = 0.05
+        self._tick(0, 0, 0)
+        self._tick(15, 1_000_000, 0.1)
+        self.assertEqual(self.controller.rung, 0)
+
+        self.controller.connectivity.rtt = 0.4
+        self._tick(15, 1_000_000, 0.1)
+        self.assertEqual(self.controller.rung, 1)
+
+    def test_memory_pressure_steps_down_and_holds(self, mock_temp, mock_throttle):
+
+        self.controller.pressure = MagicMock()
+        self.controller.pressure.reason.return_value = "only 40 MB available"
+        self.controller.pressure.healthy.return_value = False
+        self._tick(15, 0, 0)
+        self.assertEqual(self.controller.rung, 1)
+
+        # Cleared but not yet healthy, so no upgrade however long it lasts
+        self.controller.pressure.reason.return_value = None
+
+        for _ in range(5):
+            self._tick(20, 1_000_000, 0.1)
+
+        self.assertEqual(self.controller.rung, 1)
+
+    def test_motion_gate_holds_quality(self, mock_temp, mock_throttle):
+
+        self.controller.motion = MagicMock(gated=True)
+        self._tick(0, 0, 0)
+        self._tick(15, 1_000_000, 8.0)
+
+        self.assertEqual(self.controller.rung, 0)
+        self.session.restart_encoder.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os, tempfile, threading, unittest
+from unittest.mock import patch, MagicMock
+from segment_store import SegmentStore
+import backfill
+
+
+class TestBuildBackfillCommand(unittest.TestCase):
+
+    def test_command_is_rate_capped(self):
+
+        command = backfill.build_backfill_command("seg.h264", "rtsp://127.0.0.1:8554/stream", rate=2.5, framerate=25)
+
+        self.assertNotIn("-re", command)
+        self.assertEqual(command[command.index("-readrate") + 1], "2.5")
+        self.assertEqual(command[command.index("-framerate") + 1], "25")
+        self.assertEqual(command[command.index("-i") + 1], "seg.h264")
+        self.assertEqual(command[-1], "rtsp://127.0.0.1:8554/stream")
+
+
+class TestBackfillUploader(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=10)
+
+        for _ in range(2):
+            name = self.store.new_segment_name()
+            with open(self.store.path(name), "wb") as f:
+                f.write(b"data")
+            self.store.commit(name, 0.0, 10.0, 4, 300)
+
+        self.uploader = backfill.BackfillUploader(self.store, "rtsp://127.0.0.1:8554/stream", rate=3.0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("backfill.subprocess.Popen")
+    def test_successful_upload_removes_segment(self, mock_popen):
+
+        mock_popen.return_value.wait.return_value = 0
+        entry = self.store.entries()[0]
+
+        self.assertTrue(self.uploader.upload_segment(entry))
+
+        command = mock_popen.call_args[0][0]
+        self.assertEqual(command[command.index("-framerate") + 1], "30")
+        self.assertNotIn(entry["name"], [e["name"] for e in self.store.entries()])
+        self.assertEqual(self.uploader.progress()["pending_segments"], 1)
+        self.assertEqual(self.uploader.progress()["uploaded_seconds"], 10.0)
+
+    @patch("backfill.subprocess.Popen")
+    def test_interrupted_upload_keeps_segment(self, mock_popen):
+
+        mock_popen.return_value.wait.return_value = 255
+        entry = self.store.entries()[0]
+
+        self.assertFalse(self.uploader.upload_segment(entry))
+        self.assertEqual(self.store.entries()[0]["name"], entry["name"])
+        self.assertEqual(self.uploader.progress()["failures"], 1)
+
+    @patch("backfill.subprocess.Popen")
+    def test_worker_drains_backlog(self, mock_popen):
+
+        mock_popen.return_value.wait.return_value = 0
+        self.uploader.poll_interval = 0.01
+        self.uploader.start()
+
+        for _ in range(200):
+            if not self.store.entries():
+                break
+            self.uploader._stopped.wait(0.01)
+
+        self.uploader.stop()
+        self.uploader.join(timeout=1)
+        self.assertEqual(self.store.entries(), [])
+        self.assertEqual(mock_popen.call_count, 2)
+
+    @patch("backfill.subprocess.Popen")
+    def test_corrupt_segment_is_quarantined(self, mock_popen):
+
+        bad = self.store.entries()[0]["name"]
+        mock_popen.side_effect = lambda command, **kwargs: MagicMock(**{"wait.return_value": 1 if bad in command[command.index("-i") + 1] else 0})
+        self.uploader.poll_interval = self.uploader.max_backoff = 0.01
+        self.uploader.max_attempts = 3
+        self.uploader.start()
+
+        for _ in range(200):
+            if not self.store.entries():
+                break
+            self.uploader._stopped.wait(0.01)
+
+        self.uploader.stop()
+        self.uploader.join(timeout=1)
+        self.assertEqual(self.store.entries(), [])
+        self.assertEqual(mock_popen.call_count, 4)
+        self.assertEqual(self.uploader.progress()["quarantined_segments"], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "quarantine", bad)))
+
+    def _drain(self):
+
+        self.uploader.poll_interval = self.uploader.max_backoff = 0.01
+        self.uploader.max_attempts = 2
+        self.uploader.start()
+
+        for _ in range(200):
+            if not self.store.entries():
+                break
+            self.uploader._stopped.wait(0.01)
+
+        self.uploader.stop()
+        self.uploader.join(timeout=1)
+
+    @patch("backfill.subprocess.Popen")
+    def test_missing_segment_file_is_dropped(self, mock_popen):
+
+        missing, present = [e["name"] for e in self.store.entries()]
+        os.remove(self.store.path(missing))
+        mock_popen.side_effect = lambda command, **kwargs: MagicMock(**{"wait.return_value": 0 if os.path.exists(command[command.index("-i") + 1]) else 1})
+
+        self._drain()
+
+        self.assertEqual(self.store.entries(), [])
+        self.assertEqual(self.uploader.uploaded_segments, 1)
+        self.assertEqual(self.uploader.quarantined_segments, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "quarantine", missing)))
+
+    @patch("backfill.subprocess.Popen")
+    def test_worker_survives_store_errors(self, mock_popen):
+
+        mock_popen.return_value.wait.return_value = 0
+        entries = self.store.entries
+        errors = [OSError("I/O error")]
+
+        def flaky_entries():
+            if errors and threading.current_thread() is self.uploader:
+                raise errors.pop()
+            return entries()
+
+        self.store.entries = flaky_entries
+        self._drain()
+
+        self.assertEqual(self.uploader.uploaded_segments, 2)
+        self.assertEqual(self.uploader.failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
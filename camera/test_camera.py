@@ -1,7 +1,7 @@
 import sys
 from unittest.mock import MagicMock
-import socket, re, errno, os, time, gc, subprocess, socket, psutil, logging, unittest, camera
-from unittest.mock import patch, MagicMock, mock_open, call
+import socket, re, errno, os, time, gc, subprocess, socket, psutil, tempfile, logging, unittest, camera
+from unittest.mock import patch, MagicMock, PropertyMock, mock_open, call
 from urllib.parse import urlparse
 
 
@@ -37,19 +37,6 @@ class TestFfmpegErrorHandler(unittest.TestCase):
         self.assertIn("Unhandled exception type", "".join(log.output))
 
 
-class TestCheckConnection(unittest.TestCase):
-
-    @patch("socket.create_connection")
-    def test_connection_success(self, mock_create):
-        mock_create.return_value = True
-        self.assertTrue(camera.check_connection("127.0.0.1", 80, timeout=1))
-        mock_create.assert_called_with(("127.0.0.1", 80), timeout=1)
-
-    @patch("socket.create_connection", side_effect=OSError)
-    def test_connection_failure(self, mock_create):
-        self.assertFalse(camera.check_connection("127.0.0.1", 80, timeout=1))
-
-
 class TestKillConflictingProcesses(unittest.TestCase):
 
     @patch("camera.subprocess.check_output")
@@ -75,65 +62,81 @@ class TestFreeMemory(unittest.TestCase):
 
     @patch("camera.gc.collect", return_value=5)
     @patch("camera.os.system")
-    @patch("camera.psutil.virtual_memory")
-    @patch("camera.time.sleep", return_value=None)
-    def test_memory(self, mock_sleep, mock_virtual_memory, mock_os_system, mock_gc):
-
-        fake_mem = MagicMock()
-        fake_mem.percent = 50
-        fake_mem.available = 200 * 1024 * 1024  # 200 MB available
-        mock_virtual_memory.return_value = fake_mem
+    @patch("camera.read_meminfo", return_value={"MemAvailable": 204800, "CmaFree": 16384})
+    def test_memory(self, mock_meminfo, mock_os_system, mock_gc):
 
         with self.assertLogs(camera.logger, level="INFO") as log:
             camera.free_memory()
 
-        self.assertTrue(mock_os_system.called)
+        # The page cache must be left alone
+        mock_os_system.assert_not_called()
         self.assertIn("Garbage collection complete", "".join(log.output))
-
-
-class TestReadLocationMetadata(unittest.TestCase):
-
-    def test_valid_file(self):
-        fake_file = "10.123\n20.456\n"
-        with patch("builtins.open", mock_open(read_data=fake_file)):
-            result = camera.read_location_metadata("dummy.txt")
-            self.assertEqual(result, (10.123, 20.456))
-
-    def test_invalid_line_count(self):
-        fake_file = "10.123\n"
-        with patch("builtins.open", mock_open(read_data=fake_file)):
-            result = camera.read_location_metadata("dummy.txt")
-            self.assertIsNone(result)
-
-    def test_invalid_numbers(self):
-        fake_file = "abc\ndef\n"
-        with patch("builtins.open", mock_open(read_data=fake_file)):
-            result = camera.read_location_metadata("dummy.txt")
-            self.assertIsNone(result)
+        self.assertIn("200.00 MB", "".join(log.output))
 
 
 class TestCreateFfmpegOutput(unittest.TestCase):
 
-    @patch("camera.read_location_metadata", return_value=(0.00000, 180.00000))
     @patch("camera.FfmpegOutput")
-    def test_create_ffmpeg_output_with_location(self, mock_ffmpeg_output, mock_read_meta):
+    def test_create_ffmpeg_output(self, mock_ffmpeg_output):
 
         dummy_output = MagicMock()
         mock_ffmpeg_output.return_value = dummy_output
         output = camera.create_ffmpeg_output()
 
-        self.assertIn("lat=0.00000", mock_ffmpeg_output.call_args[0][0])
-        self.assertIn("lon=180.00000", mock_ffmpeg_output.call_args[0][0])
+        # Location travels in the stream, the URL carries no query parameters
+        self.assertTrue(mock_ffmpeg_output.call_args[0][0].endswith("rtsp://192.168.1.8:8554/test"))
         self.assertEqual(dummy_output.error_callback, camera.ffmpeg_error_handler)
+        self.assertNotIsInstance(output, camera.LowLatencyFfmpegOutput)
 
-    @patch("camera.read_location_metadata", return_value=None)
-    @patch("camera.FfmpegOutput")
-    def test_create_ffmpeg_output_without_location(self, mock_ffmpeg_output, mock_read_meta):
+    @patch("camera.subprocess.Popen")
+    @patch.dict(camera.settings, latency_profile="low_latency", keyframe_interval=10)
+    def test_low_latency_output_skips_probing(self, mock_popen):
 
-        dummy_output = MagicMock()
-        mock_ffmpeg_output.return_value = dummy_output
-        output = camera.create_ffmpeg_output()
-        self.assertIn("rtsp://192.168.1.8:8554/test", mock_ffmpeg_output.call_args[0][0])
+        output = camera.create_ffmpeg_output("rtsp://example.com/live")
+
+        with patch.dict(sys.modules, {"prctl": MagicMock()}):
+            output.start()
+
+        command = mock_popen.call_args.args[0]
+        self.assertLess(command.index("nobuffer"), command.index("-i"))
+        self.assertLess(command.index("-i"), command.index("-flush_packets"))
+        self.assertEqual(command[-1], "rtsp://example.com/live")
+        self.assertEqual(camera.encoder_settings(), {"keyframe_interval": 10, "profile": "baseline"})
+
+    @patch.dict(camera.settings, rtsp_backend="pyav")
+    def test_pyav_backend_falls_back_to_ffmpeg(self):
+
+        with patch.dict(sys.modules, {"av": MagicMock()}):
+            self.assertIsInstance(camera.create_ffmpeg_output(), camera.PyavRtspOutput)
+
+        # None in sys.modules makes the import fail
+        with patch.dict(sys.modules, {"av": None}):
+            output = camera.create_ffmpeg_output()
+
+        self.assertNotIsInstance(output, camera.PyavRtspOutput)
+        self.assertEqual(output.error_callback, camera.ffmpeg_error_handler)
+
+
+class TestCreateCameraConfiguration(unittest.TestCase):
+
+    def test_dual_stream(self):
+
+        picamera = MagicMock()
+        camera.create_camera_configuration(picamera, stream_mode="dual")
+        kwargs = picamera.create_video_configuration.call_args.kwargs
+
+        self.assertEqual(kwargs["main"]["size"], camera.MAIN_SIZE)
+        self.assertEqual(kwargs["lores"], {"size": camera.LORES_SIZE, "format": "YUV420"})
+        self.assertEqual(kwargs["encode"], "main")
+
+    def test_single_stream(self):
+
+        picamera = MagicMock()
+        camera.create_camera_configuration(picamera, stream_mode="single")
+        kwargs = picamera.create_video_configuration.call_args.kwargs
+
+        self.assertEqual(kwargs["main"]["size"], (640, 640))
+        self.assertNotIn("lores", kwargs)
 
 
 class TestStartCamera(unittest.TestCase):
@@ -169,127 +172,350 @@ class TestStartCamera(unittest.TestCase):
 
     def test_start_camera_success(self):
 
-        cam, ffmpeg = camera.start_camera(max_tries=3)
+        cam, ffmpeg = camera.start_camera()
         self.assertEqual(cam, self.dummy_camera)
         self.assertEqual(ffmpeg, self.dummy_ffmpeg)
         self.dummy_camera.configure.assert_called_once()
 
     def test_start_camera_oserror_ebusy(self):
 
-        self.dummy_camera.create_video_configuration.return_value = {}
-        self.dummy_camera.configure.side_effect = [OSError(errno.EBUSY, "busy"), None]
-        cam, ffmpeg = camera.start_camera(max_tries=2)
-        self.mock_kill.assert_called()
-        self.assertEqual(cam, self.dummy_camera)
-        self.assertEqual(ffmpeg, self.dummy_ffmpeg)
+        self.dummy_camera.configure.side_effect = OSError(errno.EBUSY, "busy")
 
-    def test_start_camera_oserror_enomem(self):
+        with self.assertRaises(OSError) as cm:
+            camera.start_camera()
 
-        self.dummy_camera.create_video_configuration.return_value = {}
-        self.dummy_camera.configure.side_effect = [OSError(errno.ENOMEM, "out of memory"), None]
-        cam, ffmpeg = camera.start_camera(max_tries=2)
-        self.mock_free.assert_called()
+        # Left to the supervisor, but the camera must be released for the next attempt
+        self.assertEqual(cm.exception.errno, errno.EBUSY)
+        self.dummy_camera.close.assert_called_once()
+        self.mock_kill.assert_not_called()
+
+    def test_start_camera_oserror_einval(self):
+
+        self.dummy_camera.configure.side_effect = [OSError(errno.EINVAL, "invalid"), None]
+        cam, ffmpeg = camera.start_camera()
         self.assertEqual(cam, self.dummy_camera)
-        self.assertEqual(ffmpeg, self.dummy_ffmpeg)
+        self.assertEqual(self.dummy_camera.configure.call_count, 2)
+        self.dummy_camera.close.assert_not_called()
 
-    def test_start_camera_oserror_enodev(self):
+    def test_start_camera_camera_missing(self):
 
-        self.dummy_camera.create_video_configuration.return_value = {}
-        self.dummy_camera.configure.side_effect = OSError(errno.ENODEV, "device not found")
+        self.mock_Picamera2.side_effect = IndexError("list index out of range")
 
-        with self.assertRaises(SystemExit) as cm:
-            camera.start_camera(max_tries=3)
+        with self.assertRaises(OSError) as cm:
+            camera.start_camera()
 
-        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(cm.exception.errno, errno.ENODEV)
 
     def test_start_camera_runtime_error_buffer(self):
 
         config = {"main": {"size": (640, 640)}, "controls": {"FrameRate": 30}}
         self.dummy_camera.create_video_configuration.return_value = config
         self.dummy_camera.configure.side_effect = [RuntimeError("Buffer overflow Error"), None]
-        cam, ffmpeg = camera.start_camera(max_tries=2)
+        cam, ffmpeg = camera.start_camera()
         self.mock_free.assert_called()
+        self.assertEqual(config["controls"]["FrameRate"], 15)
         self.assertEqual(cam, self.dummy_camera)
         self.assertEqual(ffmpeg, self.dummy_ffmpeg)
 
 
-class TestStartFileRecording(unittest.TestCase):
+class TestCameraPipeline(unittest.TestCase):
 
     def setUp(self):
 
-        self.picam_patch = patch("camera.Picamera2")
-        self.mock_Picamera2 = self.picam_patch.start()
-        self.dummy_camera = MagicMock()
-        self.mock_Picamera2.return_value = self.dummy_camera
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patches = [
+            patch("camera.CAMERAS", [0, 1]),
+            patch("camera.OFFLINE_BUFFER_DIR", os.path.join(self.tmp.name, "offline_buffer")),
+            patch("camera.CLIPS_DIR", os.path.join(self.tmp.name, "clips")),
+            patch("camera.LOCATION_FILE", os.path.join(self.tmp.name, "location.txt")),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_per_camera_names(self):
+
+        self.assertEqual(camera.per_camera("rtsp://192.168.1.8:8554/test", 1), "rtsp://192.168.1.8:8554/test_cam1")
+        self.assertEqual(camera.per_camera("location.txt", 0), "location_cam0.txt")
+
+        self.assertEqual(camera.per_camera("rtsp://10.0.0.5:8554", 1), "rtsp://10.0.0.5:8554/cam1")
+        self.assertEqual(camera.per_camera("rtsp://cam.example.com:8554/live/", 0), "rtsp://cam.example.com:8554/live_cam0")
+
+        with patch("camera.CAMERAS", [0]):
+            self.assertEqual(camera.per_camera("offline_buffer", 0), "offline_buffer")
+
+    @patch("camera.open_session")
+    def test_fatal_camera_stops_only_its_pipeline(self, mock_open_session):
+
+        # Camera 0 is missing, camera 1 streams
+        session = MagicMock()
+        mock_open_session.side_effect = lambda *args: (_ for _ in ()).throw(OSError(errno.ENODEV, "missing")) if args[3] == 0 else (session, MagicMock(), [])
+
+        connectivity = MagicMock()
+        connectivity.online = True
+        pipelines = [camera.CameraPipeline(n, connectivity) for n in (0, 1)]
+
+        with patch("camera.live_mode") as mock_live:
+            mock_live.side_effect = lambda *args, **kwargs: time.sleep(0.05)
+
+            for pipeline in pipelines:
+                pipeline.start()
+
+            pipelines[0].join(5)
+            time.sleep(0.1)
+
+            self.assertTrue(pipelines[0].fatal)
+            self.assertFalse(pipelines[0].is_alive())
+            self.assertTrue(pipelines[1].is_alive())
+            self.assertEqual(pipelines[1].supervisor.state, camera.LIVE)
+            self.assertEqual(pipelines[1].store.directory, os.path.join(self.tmp.name, "offline_buffer_cam1"))
+
+            pipelines[1].stop()
+            pipelines[1].join(5)
+            session.close.assert_called_once()
+
+    @patch("camera.open_session", side_effect=AttributeError("'NoneType' object has no attribute 'ladder'"))
+    def test_unexpected_error_goes_to_supervisor(self, mock_open_session):
+
+        pipeline = camera.CameraPipeline(0, MagicMock(online=True))
+        pipeline.supervisor = MagicMock(**{"recover.return_value": camera.FATAL})
+
+        pipeline.run()
+
+        error = pipeline.supervisor.recover.call_args[0][0]
+        self.assertIsInstance(error, AttributeError)
+        self.assertTrue(pipeline.fatal)
+
+
+class TestOpenSession(unittest.TestCase):
 
-        self.ffmpeg_file_patch = patch("camera.create_ffmpeg_output_file")
-        self.mock_create_ffmpeg_file = self.ffmpeg_file_patch.start()
-        self.dummy_ffmpeg_file = MagicMock()
-        self.mock_create_ffmpeg_file.return_value = self.dummy_ffmpeg_file
+    @patch("camera.register_memory_metrics")
+    @patch("camera.start_camera")
+    def test_failed_start_closes_camera(self, mock_start_camera, mock_metrics):
+
+        picam = MagicMock()
+        picam.start_recording.side_effect = OSError(errno.ENOMEM, "Cannot allocate memory")
+        mock_start_camera.return_value = (picam, MagicMock())
+
+        with self.assertRaises(OSError):
+            camera.open_session(MagicMock(), MagicMock(), MagicMock())
+
+        picam.close.assert_called_once()
+
+    @patch("camera.register_memory_metrics")
+    @patch("camera.start_camera")
+    def test_failed_worker_stops_started_ones(self, mock_start_camera, mock_metrics):
+
+        picam = MagicMock()
+        mock_start_camera.return_value = (picam, MagicMock())
+
+        with patch("camera.LoresReader") as mock_lores, patch("camera.MemoryGovernor") as mock_governor, \
+                patch("camera.settings", dict(camera.settings, stream_mode="dual")):
+            mock_lores.return_value.start.side_effect = RuntimeError("lores failed")
+
+            with self.assertRaises(RuntimeError):
+                camera.open_session(MagicMock(), MagicMock(), MagicMock())
+
+        mock_governor.return_value.stop.assert_called_once()
+        mock_lores.return_value.stop.assert_not_called()
+        picam.close.assert_called_once()
+
+
+class TestRecover(unittest.TestCase):
+
+    def setUp(self):
+
+        self.session = MagicMock()
+        self.ffmpeg_output = MagicMock()
+
+    @patch("camera.restart_recording")
+    @patch("camera.kill_conflicting_processes")
+    def test_busy_without_session(self, mock_kill, mock_restart):
+
+        camera.recover("busy", OSError(errno.EBUSY, "busy"), None, None)
+        mock_kill.assert_called_once()
+        mock_restart.assert_not_called()
+
+    @patch("camera.restart_recording")
+    @patch("camera.kill_conflicting_processes")
+    def test_busy_without_device_kills_nothing(self, mock_kill, mock_restart):
+
+        camera.recover("busy", OSError(errno.EBUSY, "busy"), self.session, self.ffmpeg_output, device=None)
+        mock_kill.assert_not_called()
+        mock_restart.assert_called_once_with(self.session)
+
+    @patch("camera.restart_ffmpeg_output")
+    def test_pipe(self, mock_restart_ffmpeg):
+
+        camera.recover("pipe", BrokenPipeError(), self.session, self.ffmpeg_output)
+        mock_restart_ffmpeg.assert_called_once_with(self.session, self.ffmpeg_output)
+
+    @patch("camera.restart_recording")
+    @patch("camera.free_memory")
+    def test_memory(self, mock_free, mock_restart):
+
+        camera.recover("memory", MemoryError(), self.session, self.ffmpeg_output)
+        mock_free.assert_called_once()
+        mock_restart.assert_called_once_with(self.session)
+
+    def test_error_name(self):
+
+        self.assertEqual(camera.error_name(OSError(errno.EPIPE, "broken")), "EPIPE")
+        self.assertEqual(camera.error_name(MemoryError()), "MemoryError")
+
+
+class TestApplySettings(unittest.TestCase):
+
+    def setUp(self):
+
+        self.saved = dict(camera.settings)
+        self.session = MagicMock()
+        self.session.reconfigure.return_value = 0.5
+        self.session.restart_encoder.return_value = 0.04
+        self.governor = MagicMock(spec=camera.MemoryGovernor)
+        self.governor.config_factory = MagicMock()
+        self.adaptive = MagicMock(spec=camera.AdaptiveController)
+        self.adaptive.rung = 0
+        self.workers = [self.governor, self.adaptive]
+        self.backfill = MagicMock()
 
     def tearDown(self):
 
-        self.picam_patch.stop()
-        self.ffmpeg_file_patch.stop()
+        camera.settings.clear()
+        camera.settings.update(self.saved)
 
-    def test_start_file_recording_success(self):
+    def _apply(self, changed, **new):
 
-        cam, ffmpeg = camera.start_file_recording("dummy.h264", max_tries=3)
-        self.assertEqual(cam, self.dummy_camera)
-        self.assertEqual(ffmpeg, self.dummy_ffmpeg_file)
-        self.dummy_camera.configure.assert_called_once()
+        camera.settings.update(new)
+        return camera.apply_settings(changed, self.session, "output", self.workers, self.backfill)
 
+    def test_frame_rate_uses_controls(self):
 
-class TestStreamBufferToRTSP(unittest.TestCase):
+        summary, _ = self._apply({"frame_rate"}, frame_rate=20)
 
-    @patch("camera.subprocess.run")
-    def test_stream_buffer_success(self, mock_run):
+        self.session.set_controls.assert_called_once_with({"FrameRate": 20})
+        self.session.restart_encoder.assert_not_called()
+        self.assertEqual(summary, {"path": "controls", "downtime_ms": 0})
+        self.assertEqual(self.adaptive.ladder[0]["fps"], 20)
 
-        camera.stream_buffer_to_rtsp("dummy.h264")
-        expected_command = [
-            "ffmpeg",
-            "-re",
-            "-i", "dummy.h264",
-            "-c", "copy",
-            "-rtsp_transport", "tcp",
-            "-f", "rtsp",
-            "rtsp://192.168.1.8:8554/stream"
-        ]
-        mock_run.assert_called_with(expected_command, check=True)
+    def test_bitrate_restarts_only_encoder(self):
+
+        summary, _ = self._apply({"bitrate"}, bitrate=2_000_000)
+
+        self.session.restart_encoder.assert_called_once_with(2_000_000, "h264", camera.settings["keyframe_interval"])
+        self.session.reconfigure.assert_not_called()
+        self.assertEqual(summary, {"path": "encoder", "downtime_ms": 40})
+
+    def test_size_reconfigures(self):
+
+        summary, _ = self._apply({"main_size", "bitrate"}, main_size=(1280, 720), bitrate=2_000_000)
+
+        self.session.reconfigure.assert_called_once_with(self.governor.config_factory.return_value, bitrate=2_000_000)
+        self.session.restart_encoder.assert_not_called()
+        self.assertEqual(summary["path"], "reconfigure")
+
+    def test_quality_waits_while_stepped_down(self):
+
+        self.adaptive.rung = 2
+        summary, _ = self._apply({"bitrate", "frame_rate"}, bitrate=2_000_000, frame_rate=20)
 
-    @patch("camera.subprocess.run", side_effect=Exception("ffmpeg error"))
-    @patch("camera.logger")
-    def test_stream_buffer_failure(self, mock_logger, mock_run):
+        self.session.restart_encoder.assert_not_called()
+        self.session.set_controls.assert_not_called()
+        self.assertIsNone(summary["path"])
+        self.assertEqual(self.adaptive.ladder[0]["bitrate"], 2_000_000)
 
-        camera.stream_buffer_to_rtsp("dummy.h264")
-        mock_logger.error.assert_called()
+    @patch("camera.create_ffmpeg_output")
+    def test_live_url_swaps_output(self, mock_create):
+
+        self.session.fanout.outputs.return_value = ["output"]
+        _, output = self._apply({"live_rtsp_url"}, live_rtsp_url="rtsp://example.com/live")
+
+        self.assertEqual(output, mock_create.return_value)
+        self.session.switch_to.assert_called_once_with(output)
+        mock_create.assert_called_once_with("rtsp://example.com/live")
+        self.assertEqual(self.adaptive.output, output)
+
+    @patch("camera.create_ffmpeg_output")
+    def test_low_latency_profile_rebuilds_encoder_and_output(self, mock_create):
+
+        self.session.fanout.outputs.return_value = ["output"]
+        summary, output = self._apply({"latency_profile"}, latency_profile="low_latency", keyframe_interval=30)
+
+        self.assertEqual(output, mock_create.return_value)
+        self.assertEqual(self.session.profile, "baseline")
+        self.session.restart_encoder.assert_called_once_with(None, "h264", camera.LOW_LATENCY_KEYFRAME_INTERVAL)
+        self.assertEqual(summary["path"], "encoder")
 
 
 class TestRestartFunctions(unittest.TestCase):
 
     def setUp(self):
 
-        self.dummy_picam = MagicMock()
+        self.dummy_session = MagicMock()
         self.dummy_ffmpeg = MagicMock()
 
-    @patch("camera.time.sleep", return_value=None)
-    def test_restart_recording(self, mock_sleep):
+    def test_restart_recording(self):
 
-        camera.restart_recording(self.dummy_picam, self.dummy_ffmpeg)
-        self.dummy_picam.stop_recording.assert_called()
-        self.dummy_picam.stop.assert_called()
-        self.dummy_picam.start_recording.assert_called()
+        restarts = camera.PIPELINE_RESTARTS.value()
+        camera.restart_recording(self.dummy_session)
+        self.dummy_session.restart.assert_called()
+        self.assertEqual(camera.PIPELINE_RESTARTS.value(), restarts + 1)
 
     @patch("camera.time.sleep", return_value=None)
     def test_restart_ffmpeg_output(self, mock_sleep):
 
-        camera.restart_ffmpeg_output(self.dummy_picam, self.dummy_ffmpeg)
-        self.dummy_picam.stop_recording.assert_called()
-        self.dummy_picam.stop.assert_called()
-        self.dummy_ffmpeg.stop.assert_called()
-        self.dummy_ffmpeg.start.assert_called()
-        self.dummy_picam.start_recording.assert_called()
-        self.dummy_picam.start.assert_called()
+        self.dummy_ffmpeg.output_broken = True
+        camera.restart_ffmpeg_output(self.dummy_session, self.dummy_ffmpeg)
+        self.dummy_session.fanout.detach.assert_called_with(self.dummy_ffmpeg)
+        self.dummy_session.fanout.attach.assert_called_with(self.dummy_ffmpeg)
+        self.dummy_session.restart.assert_not_called()
+        self.assertFalse(self.dummy_ffmpeg.output_broken)
+
+class TestPipelineMetrics(unittest.TestCase):
+
+    def test_count_transition(self):
+
+        before = camera.MODE_TRANSITIONS.value(to="offline")
+        mode = camera.count_transition(None, "live")
+        mode = camera.count_transition(mode, "live")
+        mode = camera.count_transition(mode, "offline")
+        self.assertEqual(camera.MODE_TRANSITIONS.value(to="offline"), before + 1)
+        self.assertEqual(mode, "offline")
+
+    def test_register_pipeline_metrics(self):
+
+        session = MagicMock()
+        session.fanout.frames = 42
+        session.fanout.uncovered_frames = 3
+        session.fanout.totals.return_value = {"frames": 40, "bytes": 1000}
+        store = MagicMock()
+        store.total_bytes.return_value = 2048
+        store.retained_seconds.return_value = 30.0
+        connectivity = MagicMock(online=True, rtt=0.05, loss=0.0)
+
+        camera.register_pipeline_metrics(lambda: session, lambda: MagicMock(), store, MagicMock(uploaded_bytes=10))
+        camera.register_link_metrics(connectivity)
+        text = camera.registry.render()
+
+        self.assertIn("eleeye_frames_encoded_total 42", text)
+        self.assertIn("eleeye_frames_dropped_total 3", text)
+        self.assertIn("eleeye_live_bytes_sent_total 1000", text)
+        self.assertIn("eleeye_offline_buffer_bytes 2048", text)
+        self.assertIn("eleeye_backfill_backlog_seconds 30.0", text)
+        self.assertIn("eleeye_link_rtt_seconds 0.05", text)
+
+    def test_camera_labels(self):
+
+        session = MagicMock()
+        session.fanout.frames = 7
+        camera.register_pipeline_metrics(lambda: session, lambda: None, MagicMock(), MagicMock(), "cam1")
+
+        self.assertIn('eleeye_frames_encoded_total{camera="cam1"} 7', camera.registry.render())
 
 # fake time function used for patching the tests
 def fake_time():
@@ -301,27 +527,43 @@ class TestModes(unittest.TestCase):
 
     def setUp(self):
 
-        self.dummy_picam = MagicMock()
+        self.dummy_session = MagicMock()
         self.dummy_ffmpeg = MagicMock()
-        self.encoder = MagicMock()
 
-    @patch("camera.check_connection", side_effect=[False])
     @patch("camera.time.sleep", return_value=None)
-    def test_live_mode(self, mock_sleep, mock_check):
+    def test_live_mode(self, mock_sleep):
 
-        camera.live_mode(self.dummy_picam, self.dummy_ffmpeg)
-        self.dummy_picam.stop_recording.assert_called()
-        self.dummy_picam.stop.assert_called()
+        connectivity = MagicMock()
+        type(connectivity).online = PropertyMock(side_effect=[True, False])
+        camera.live_mode(self.dummy_session, self.dummy_ffmpeg, connectivity)
+        self.dummy_session.switch_to.assert_called_with(self.dummy_ffmpeg)
+        self.dummy_session.stop.assert_not_called()
 
-    @patch("camera.time.time", side_effect=lambda: fake_time())
-    @patch("camera.check_connection", side_effect=[False, False, True])
     @patch("camera.time.sleep", return_value=None)
-    @patch("os.remove")
-    def test_offline_mode(self, mock_remove, mock_sleep, mock_check):
+    def test_live_mode_stops_on_watchdog(self, mock_sleep):
+
+        connectivity = MagicMock()
+        connectivity.online = True
+        watchdog = MagicMock()
+        watchdog.check.side_effect = BrokenPipeError(errno.EPIPE, "Live output took no frames")
+
+        with self.assertRaises(BrokenPipeError):
+            camera.live_mode(self.dummy_session, self.dummy_ffmpeg, connectivity, watchdog=watchdog)
 
-        camera.offline_mode(self.dummy_picam, self.dummy_ffmpeg, "dummy.h264", offline_timeout=1)
-        self.dummy_picam.stop_recording.assert_called()
-        self.dummy_picam.stop.assert_called()
+        watchdog.arm.assert_called_once()
+
+    @patch("camera.time.time", side_effect=lambda: fake_time())
+    @patch("camera.time.sleep", return_value=None)
+    def test_offline_mode(self, mock_sleep, mock_time):
+
+        store = MagicMock()
+        store.retained_seconds.return_value = 20
+        connectivity = MagicMock()
+        type(connectivity).online = PropertyMock(side_effect=[False, False, True])
+        camera.offline_mode(self.dummy_session, self.dummy_ffmpeg, store, connectivity)
+        self.dummy_session.switch_to.assert_called_with(self.dummy_ffmpeg)
+        self.dummy_session.stop.assert_not_called()
+        store.remove.assert_not_called()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+import os, json, tempfile, unittest
+from unittest.mock import MagicMock
+from config import validate, load_config, ConfigReloader
+
+DEFAULTS = {
+    "live_rtsp_url": "rtsp://localhost:8554/live",
+    "main_size": (1920, 1080),
+    "frame_rate": 30,
+    "bitrate": 4_000_000,
+}
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_normalises_sizes(self):
+
+        self.assertEqual(validate({"main_size": [1280, 720]}), {"main_size": (1280, 720)})
+
+    def test_rejects_bad_settings(self):
+
+        with self.assertRaises(ValueError) as cm:
+            validate({"bitrate": -1, "encoder": "vp8", "colour": "red"})
+
+        message = str(cm.exception)
+        self.assertIn("bitrate", message)
+        self.assertIn("encoder", message)
+        self.assertIn("unknown setting colour", message)
+
+
+class TestConfigReloader(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "camera_config.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, settings):
+
+        with open(self.path, "w") as f:
+            json.dump(settings, f)
+
+    def test_missing_file_uses_defaults(self):
+
+        self.assertEqual(load_config(self.path, DEFAULTS), DEFAULTS)
+
+    def test_reload_applies_only_changes(self):
+
+        self._write({"bitrate": 2_000_000})
+        apply = MagicMock(return_value={"path": "encoder", "downtime_ms": 40})
+        reloader = ConfigReloader(self.path, DEFAULTS, apply=apply)
+
+        self.assertEqual(reloader.settings["bitrate"], 2_000_000)
+        self.assertEqual(reloader.reload(), {"changed": []})
+        apply.assert_not_called()
+
+        self._write({"bitrate": 2_000_000, "frame_rate": 20, "main_size": [1920, 1080]})
+        summary = reloader.reload()
+
+        self.assertEqual(summary, {"changed": ["frame_rate"], "path": "encoder", "downtime_ms": 40})
+        apply.assert_called_once_with({"frame_rate"}, reloader.settings)
+
+    def test_failed_apply_is_retried(self):
+
+        apply = MagicMock(side_effect=[RuntimeError("encoder failed"), {"path": "controls"}])
+        reloader = ConfigReloader(self.path, DEFAULTS, apply=apply)
+
+        self._write({"frame_rate": 15})
+
+        with self.assertRaises(RuntimeError):
+            reloader.reload()
+
+        self.assertEqual(reloader.settings["frame_rate"], DEFAULTS["frame_rate"])
+        self.assertEqual(reloader.reload()["changed"], ["frame_rate"])
+
+    def test_invalid_file_keeps_settings(self):
+
+        reloader = ConfigReloader(self.path, DEFAULTS)
+        self._write({"frame_rate": 0})
+
+        with self.assertRaises(ValueError):
+            reloader.reload()
+
+        self.assertEqual(reloader.settings, DEFAULTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import socket, threading, unittest
+from unittest.mock import patch, MagicMock
+from connectivity import RtspProbe, ConnectivityMonitor
+
+
+class FakeRtspServer(threading.Thread):
+    """Answers every RTSP request on a connection with a minimal 200 OK."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                while conn.recv(4096):
+                    conn.sendall(b"RTSP/1.0 200 OK\r\nCSeq: 1\r\n\r\n")
+
+
+class TestRtspProbe(unittest.TestCase):
+
+    def test_probe_reuses_connection(self):
+
+        server = FakeRtspServer()
+        server.start()
+        probe = RtspProbe(f"rtsp://127.0.0.1:{server.port}/test", timeout=1)
+
+        for _ in range(3):
+            self.assertGreaterEqual(probe.probe(), 0)
+
+        probe.close()
+        server.sock.close()
+        self.assertEqual(server.connections, 1)
+
+    @patch("connectivity.socket.create_connection", side_effect=OSError("unreachable"))
+    def test_probe_failure_raises(self, mock_create):
+
+        probe = RtspProbe("rtsp://192.0.2.1:8554/test", timeout=1)
+        with self.assertRaises(OSError):
+            probe.probe()
+
+    def test_bad_response_closes_socket(self):
+
+        sock = MagicMock()
+        sock.recv.return_value = b"HTTP/1.1 400 Bad Request"
+        probe = RtspProbe("rtsp://127.0.0.1:8554/test")
+        probe._sock = sock
+
+        with self.assertRaises(OSError):
+            probe.probe()
+
+        sock.close.assert_called()
+        self.assertIsNone(probe._sock)
+
+    def test_response_split_across_reads(self):
+
+        sock = MagicMock()
+        sock.recv.side_effect = [b"RTSP/1.0 200 OK\r\nCSeq: 1\r\n", b"Public: OPTIONS, DESCRIBE\r\n", b"\r\n"]
+        probe = RtspProbe("rtsp://127.0.0.1:8554/test")
+        probe._sock = sock
+
+        self.assertGreaterEqual(probe.probe(), 0)
+        self.assertEqual(sock.recv.call_count, 3)
+        self.assertIs(probe._sock, sock)
+
+    def test_closed_connection_raises(self):
+
+        sock = MagicMock()
+        sock.recv.side_effect = [b"RTSP/1.0 200", b""]
+        probe = RtspProbe("rtsp://127.0.0.1:8554/test")
+        probe._sock = sock
+
+        with self.assertRaises(OSError):
+            probe.probe()
+
+        self.assertIsNone(probe._sock)
+
+
+class TestConnectivityMonitor(unittest.TestCase):
+
+    def _run(self, monitor, results):
+
+        monitor.probe = MagicMock()
+        monitor.probe.probe.side_effect = [0.05 if ok else OSError() for ok in results]
+        monitor._stopped = MagicMock()
+        monitor._stopped.wait.side_effect = [False] * len(results) + [True]
+        monitor.run()
+        return [c.args[0] for c in monitor._stopped.wait.call_args_list]
+
+    def test_hysteresis_ignores_single_failures(self):
+
+        monitor = ConnectivityMonitor("rtsp://127.0.0.1:8554/test", down_after=3)
+        monitor.online = True
+        self._run(monitor, [True, False, True, False, False, True])
+
+        self.assertTrue(monitor.online)
+        self.assertEqual(monitor.transitions, 0)
+        self.assertAlmostEqual(monitor.loss, 0.5)
+
+    def test_goes_offline_and_backs_off(self):
+
+        monitor = ConnectivityMonitor("rtsp://127.0.0.1:8554/test", interval=1, max_interval=4, down_after=2)
+        monitor.online = True
+        delays = self._run(monitor, [False, False, False, False])
+
+        self.assertFalse(monitor.online)
+        self.assertEqual(delays, [1, 1, 2, 4, 4])
+
+    def test_comes_back_online_after_streak(self):
+
+        monitor = ConnectivityMonitor("rtsp://127.0.0.1:8554/test", up_after=3)
+        self._run(monitor, [True, True])
+        self.assertFalse(monitor.online)
+
+        self._run(monitor, [True])
+        self.assertTrue(monitor.online)
+        self.assertIsNotNone(monitor.rtt)
+
+
+if __name__ == "__main__":
+    unittest.main()
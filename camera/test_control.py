@@ -0,0 +1,43 @@
+import os, tempfile, unittest
+from control import ControlServer, send_command
+
+
+class TestControlChannel(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "control.sock")
+        self.server = ControlServer(self.path)
+        self.server.register("echo", lambda **payload: payload)
+        self.server.register("fail", lambda: 1 / 0)
+        self.server.start()
+
+    def tearDown(self):
+
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_command_round_trip(self):
+
+        response = send_command("echo", {"post_seconds": 5}, path=self.path)
+        self.assertEqual(response, {"status": "success", "result": {"post_seconds": 5}})
+
+    def test_unknown_command(self):
+
+        response = send_command("missing", path=self.path)
+        self.assertEqual(response["status"], "error")
+
+    def test_failing_command(self):
+
+        response = send_command("fail", path=self.path)
+        self.assertEqual(response["status"], "error")
+
+    def test_camera_not_running(self):
+
+        with self.assertRaises(OSError):
+            send_command("echo", path=os.path.join(self.tmp.name, "missing.sock"))
+
+
+if __name__ == "__main__":
+    unittest.main()
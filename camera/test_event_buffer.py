@@ -0,0 +1,96 @@
+import os, tempfile, threading, unittest
+from unittest.mock import patch
+from event_buffer import PreEventBuffer
+
+
+class TestPreEventBuffer(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.buffer = PreEventBuffer(self.tmp.name, pre_seconds=2, post_seconds=1)
+        self.now = 0.0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _feed(self, frames):
+
+        with patch("event_buffer.time.monotonic", side_effect=lambda: self.now):
+            for data, keyframe in frames:
+                self.buffer.outputframe(data, keyframe)
+                self.now += 0.5
+
+    def join_clip_writers(self):
+
+        for thread in threading.enumerate():
+            if thread.name == "clip-writer":
+                thread.join(timeout=2)
+
+    def test_buffer_starts_on_keyframe_and_drops_old_gops(self):
+
+        # one keyframe per second, 2 frames per second
+        self._feed([(b"p", False), (b"I1", True), (b"p1", False), (b"I2", True), (b"p2", False), (b"I3", True), (b"p3", False), (b"I4", True)])
+
+        frames = [f for gop in self.buffer._gops for f in gop["frames"]]
+        self.assertEqual(frames[0], b"I2")
+        self.assertEqual(self.buffer._bytes, sum(len(f) for f in frames))
+
+    def test_memory_cap(self):
+
+        self.buffer.max_bytes = 10
+        self._feed([(b"I" * 8, True), (b"I" * 8, True), (b"I" * 8, True)])
+        self.assertEqual(len(self.buffer._gops), 1)
+
+    def test_trigger_writes_pre_and_post_roll(self):
+
+        self._feed([(b"I1", True), (b"p1", False)])
+
+        with patch("event_buffer.time.monotonic", return_value=self.now):
+            info = self.buffer.trigger(post_seconds=1, label="../elephant")
+
+        self.assertEqual(os.path.dirname(info["path"]), self.tmp.name)
+        self.assertTrue(info["path"].endswith("_elephant.h264"))
+
+        # post-roll runs for one second, the last frame arrives after the deadline and closes the clip
+        self._feed([(b"p2", False), (b"p3", False), (b"I2", True)])
+
+        self.join_clip_writers()
+
+        with open(info["path"], "rb") as f:
+            self.assertEqual(f.read(), b"I1p1p2p3")
+
+    def test_trigger_during_clip_extends(self):
+
+        self._feed([(b"I1", True)])
+
+        with patch("event_buffer.time.monotonic", return_value=self.now):
+            first = self.buffer.trigger(post_seconds=1)
+            second = self.buffer.trigger(post_seconds=5)
+
+        self.assertTrue(second["extended"])
+        self.assertEqual(first["path"], second["path"])
+        self.assertEqual(self.buffer._clip["deadline"], self.now + 5)
+        self.buffer._clip["queue"].put(None)
+
+    @patch("event_buffer.time.time", return_value=1_700_000_000.25)
+    def test_clips_in_the_same_second_get_their_own_file(self, mock_time):
+
+        paths = []
+
+        for _ in range(2):
+            self._feed([(b"I1", True)])
+
+            with patch("event_buffer.time.monotonic", return_value=self.now):
+                paths.append(self.buffer.trigger(post_seconds=0)["path"])
+
+            self._feed([(b"I2", True)])
+            self.join_clip_writers()
+
+        self.assertTrue(paths[0].endswith("-250.h264"))
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
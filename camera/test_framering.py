@@ -0,0 +1,63 @@
+import os, unittest
+import numpy as np
+from framering import FrameRing, FrameRingReader, FrameOverrun
+
+SHAPE = (360, 320)
+
+
+def frame(value):
+    return np.full(SHAPE, value, np.uint8)
+
+
+class TestFrameRing(unittest.TestCase):
+
+    def setUp(self):
+
+        self.name = f"eleeye_test_{os.getpid()}"
+        self.ring = FrameRing(self.name, slots=4)
+        self.ring.publish(frame(0), 100.0)
+        self.reader = FrameRingReader(self.name, poll=0.001)
+
+    def tearDown(self):
+
+        self.reader.close()
+        self.ring.close()
+
+    def test_frames_are_read_in_order_without_copying(self):
+
+        for i in range(1, 4):
+            self.ring.publish(frame(i), 100.0 + i)
+
+        for i in range(1, 4):
+            f = self.reader.read(timeout=1)
+            self.assertEqual((f.seq, f.timestamp, int(f.array[0, 0])), (i + 1, 100.0 + i, i))
+            self.assertEqual(f.array.shape, SHAPE)
+            self.assertFalse(f.array.flags.owndata)
+
+        self.assertIsNone(self.reader.read(timeout=0.01))
+
+    def test_lagging_reader_gets_an_overrun(self):
+
+        for i in range(1, 7):
+            self.ring.publish(frame(i), 100.0 + i)
+
+        with self.assertRaises(FrameOverrun) as cm:
+            self.reader.read(timeout=1)
+
+        self.assertEqual(cm.exception.missed, 5)
+        self.assertEqual(int(self.reader.read(timeout=1).array[0, 0]), 6)
+
+    def test_frame_overwritten_while_in_use(self):
+
+        f = self.reader.latest()
+        self.assertTrue(f.valid())
+
+        for i in range(1, 5):
+            self.ring.publish(frame(i), 100.0 + i)
+
+        self.assertFalse(f.valid())
+        self.assertEqual(self.reader.latest().seq, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os, tempfile, unittest
+from keyframe_index import (KeyframeIndexWriter, read_index, load_index, scan_keyframes, frame_capture_time,
+                            window, read_window, index_path)
+from telemetry import build_sei, pack_telemetry
+
+SPS = b"\x00\x00\x00\x01\x67\x64\x00\x28"
+PPS = b"\x00\x00\x00\x01\x68\xee\x3c\x80"
+
+
+def idr(capture_time):
+    return SPS + PPS + build_sei(pack_telemetry(1, capture_time)) + b"\x00\x00\x00\x01\x65\x88\x84\x21"
+
+def slice_(capture_time):
+    return build_sei(pack_telemetry(1, capture_time)) + b"\x00\x00\x00\x01\x41\x9a\x02\x10"
+
+
+class TestKeyframeIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "seg_00000000.h264")
+
+        # Three one second GOPs of three frames each
+        self.frames = []
+        for gop in range(3):
+            self.frames.append(idr(100.0 + gop))
+            self.frames.extend(slice_(100.0 + gop + i / 3) for i in (1, 2))
+
+        with open(self.path, "wb") as f:
+            f.write(b"".join(self.frames))
+
+        self.offsets = [sum(len(f) for f in self.frames[:i]) for i in (0, 3, 6)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scanner_finds_access_unit_starts(self):
+
+        entries = scan_keyframes(self.path)
+
+        self.assertEqual([e["offset"] for e in entries], self.offsets)
+        self.assertEqual([e["frame"] for e in entries], [0, 3, 6])
+        self.assertEqual([e["time"] for e in entries], [100.0, 101.0, 102.0])
+
+    def test_incremental_writer_survives_torn_line(self):
+
+        writer = KeyframeIndexWriter(self.path)
+        writer.add(0, 0, 100.0)
+        writer.add(self.offsets[1], 3, 101.0)
+        writer.close()
+
+        with open(index_path(self.path), "a") as f:
+            f.write('{"offset": 12')
+
+        self.assertEqual(len(read_index(self.path)), 2)
+
+    def test_load_index_scans_once(self):
+
+        self.assertIsNone(read_index(self.path))
+        self.assertEqual(len(load_index(self.path)), 3)
+        self.assertTrue(os.path.exists(index_path(self.path)))
+
+    def test_window(self):
+
+        entries = scan_keyframes(self.path)
+        size = os.path.getsize(self.path)
+
+        self.assertEqual(window(entries, size, 101.5, 101.9), (self.offsets[1], self.offsets[2]))
+        self.assertEqual(window(entries, size, 99.0, None), (0, size))
+        self.assertEqual(window(entries, size, 102.2, 110.0), (self.offsets[2], size))
+
+    def test_read_window_decodes_from_keyframe(self):
+
+        data = read_window(self.path, 101.2, 101.8)
+        self.assertEqual(data, b"".join(self.frames[3:6]))
+
+    def test_frame_capture_time(self):
+
+        self.assertEqual(frame_capture_time(self.frames[3]), 101.0)
+        self.assertIsNone(frame_capture_time(SPS + b"\x00\x00\x00\x01\x65\x88"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import io, os, tempfile, logging, unittest
+from unittest.mock import patch
+from logbuffer import LogLimiter, BatchingHandler, BufferedLogging
+
+
+def record(message, level=logging.ERROR, name="camera", created=100.0):
+    return logging.makeLogRecord({"name": name, "levelno": level, "levelname": logging.getLevelName(level), "msg": message, "created": created})
+
+
+class TestLogLimiter(unittest.TestCase):
+
+    def test_repeats_are_counted_once(self):
+
+        limiter = LogLimiter(repeat_window=30)
+        written = []
+
+        for second in range(5):
+            written += limiter.filter(record("[Recovery] Restarting FFmpeg process", created=100.0 + second))
+
+        written += limiter.filter(record("[Recovery] FFmpeg restarted successfully", created=106.0))
+
+        self.assertEqual([r.getMessage() for r in written], [
+            "[Recovery] Restarting FFmpeg process",
+            "[Log] Previous message repeated 4 times",
+            "[Recovery] FFmpeg restarted successfully"
+        ])
+        self.assertEqual(limiter.suppressed, 4)
+
+    def test_repeat_is_written_again_after_window(self):
+
+        limiter = LogLimiter(repeat_window=30)
+        limiter.filter(record("stalled", created=100.0))
+
+        self.assertEqual(len(limiter.filter(record("stalled", created=131.0))), 1)
+
+    def test_rate_limit_per_logger(self):
+
+        limiter = LogLimiter(rate=1, burst=3)
+        written = [r for n in range(10) for r in limiter.filter(record(f"attempt {n}", created=100.0))]
+        other = limiter.filter(record("fine", name="storage", created=100.0))
+
+        self.assertEqual(len(written), 3)
+        self.assertEqual(len(other), 1)
+
+        later = limiter.filter(record("attempt 10", created=102.0))
+        self.assertEqual([r.getMessage() for r in later], ["[Log] Dropped 7 messages from camera", "attempt 10"])
+
+    def test_critical_is_never_dropped(self):
+
+        limiter = LogLimiter(rate=1, burst=1)
+        limiter.filter(record("first", created=100.0))
+
+        self.assertEqual(len(limiter.filter(record("giving up", level=logging.CRITICAL, created=100.0))), 1)
+
+
+class TestBatchingHandler(unittest.TestCase):
+
+    def test_writes_in_batches(self):
+
+        handler = BatchingHandler(capacity=3, interval=60)
+        handler._stream = stream = io.StringIO()
+        self.addCleanup(handler.close)
+
+        for n in range(2):
+            handler.handle(record(f"line {n}"))
+
+        self.assertEqual(stream.getvalue(), "")
+
+        handler.handle(record("line 2"))
+        self.assertEqual(stream.getvalue(), "line 0\nline 1\nline 2\n")
+        self.assertEqual(handler.batches, 1)
+
+    def test_critical_flushes_straight_away(self):
+
+        handler = BatchingHandler(capacity=100, interval=60)
+        handler._stream = stream = io.StringIO()
+        self.addCleanup(handler.close)
+
+        handler.handle(record("queued"))
+        handler.handle(record("giving up", level=logging.CRITICAL))
+
+        self.assertEqual(stream.getvalue(), "queued\ngiving up\n")
+
+
+class TestBufferedLogging(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        self.logger = logging.getLogger("test_logbuffer")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+        self.buffer = BufferedLogging(ring_size=5, dump_dir=self.tmp.name, limiter=LogLimiter(rate=1, burst=2), flush_interval=60)
+        self.buffer.handler._stream = self.stream = io.StringIO()
+
+        # Installed on a logger of its own rather than the root logger the test runner uses
+        with patch("logbuffer.logging.getLogger", return_value=self.logger):
+            self.buffer.install(logging.Formatter("%(levelname)s %(message)s"))
+            self.addCleanup(self.buffer.uninstall)
+
+    def test_ring_keeps_what_the_limiter_holds_back(self):
+
+        for n in range(8):
+            self.logger.error(f"[Recovery] attempt {n}")
+
+        self.buffer.stop()
+
+        self.assertEqual(self.buffer.records(), [f"ERROR [Recovery] attempt {n}" for n in range(3, 8)])
+        self.assertEqual(self.stream.getvalue(), "ERROR [Recovery] attempt 0\nERROR [Recovery] attempt 1\n")
+
+    def test_dump_writes_the_ring(self):
+
+        self.logger.warning("[Watchdog] No progress from the encoder for 5.2s")
+        result = self.buffer.dump("request")
+
+        with open(result["path"]) as f:
+            self.assertIn("WARNING [Watchdog] No progress from the encoder for 5.2s", f.read())
+
+        self.assertEqual(os.path.dirname(result["path"]), self.tmp.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from unittest.mock import MagicMock
+from lores import LoresReader, y_plane
+
+
+class TestYPlane(unittest.TestCase):
+
+    def test_y_plane_is_a_view(self):
+
+        frame = np.zeros((240 * 3 // 2, 320), dtype=np.uint8)
+        y = y_plane(frame, (320, 240))
+
+        self.assertEqual(y.shape, (240, 320))
+        self.assertTrue(np.shares_memory(y, frame))
+
+
+class TestLoresReader(unittest.TestCase):
+
+    def test_subscribers_receive_frames(self):
+
+        picam = MagicMock()
+        frame = np.zeros((360, 320), dtype=np.uint8)
+        picam.capture_array.return_value = frame
+        reader = LoresReader(picam, rate=200)
+
+        received = []
+
+        def subscriber(f, t):
+            received.append(f)
+            if len(received) == 3:
+                reader.stop()
+
+        failing = MagicMock(side_effect=ValueError("bad consumer"))
+        reader.subscribe(failing)
+        reader.subscribe(subscriber)
+        reader.start()
+        reader.join(timeout=2)
+
+        self.assertEqual(len(received), 3)
+        self.assertIs(reader.latest()[0], frame)
+        picam.capture_array.assert_called_with("lores")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os, tempfile, unittest
+from unittest.mock import patch, MagicMock
+from memory import MemoryGovernor, MemoryPressure, read_psi, read_meminfo
+
+PSI_CALM = (
+    "some avg10=0.50 avg60=0.20 avg300=0.10 total=12345\n"
+    "full avg10=0.00 avg60=0.00 avg300=0.00 total=100\n"
+)
+PSI_STALLING = (
+    "some avg10=25.00 avg60=8.00 avg300=2.00 total=9912345\n"
+    "full avg10=0.40 avg60=0.10 avg300=0.00 total=100\n"
+)
+MEMINFO = (
+    "MemTotal:         949448 kB\n"
+    "MemFree:           51200 kB\n"
+    "MemAvailable:     409600 kB\n"
+    "CmaTotal:         262144 kB\n"
+    "CmaFree:          131072 kB\n"
+)
+
+
+class TestMemoryReadings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, text):
+
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_read_psi(self):
+
+        psi = read_psi(self._write("memory", PSI_STALLING))
+        self.assertEqual(psi["some"]["avg10"], 25.0)
+        self.assertEqual(psi["full"]["total"], 100)
+
+    def test_psi_disabled(self):
+        self.assertIsNone(read_psi("/nonexistent/pressure/memory"))
+
+    def test_read_meminfo(self):
+
+        meminfo = read_meminfo(self._write("meminfo", MEMINFO))
+        self.assertEqual(meminfo["MemAvailable"], 409600)
+        self.assertEqual(meminfo["CmaFree"], 131072)
+
+    def test_pressure(self):
+
+        pressure = MemoryPressure(psi_path=self._write("calm", PSI_CALM), meminfo_path=self._write("meminfo", MEMINFO))
+        pressure.sample()
+        self.assertIsNone(pressure.reason())
+        self.assertTrue(pressure.healthy())
+
+        pressure.psi_path = self._write("stalling", PSI_STALLING)
+        pressure.sample()
+        self.assertIn("stalled on memory", pressure.reason())
+        self.assertFalse(pressure.healthy())
+
+    def test_low_cma_without_psi(self):
+
+        meminfo = MEMINFO.replace("131072", "4096")
+        pressure = MemoryPressure(psi_path="/nonexistent", meminfo_path=self._write("meminfo", meminfo))
+        pressure.sample()
+        self.assertIn("CMA", pressure.reason())
+
+
+class TestMemoryGovernor(unittest.TestCase):
+
+    def setUp(self):
+
+        self.session = MagicMock()
+        self.pressure = MagicMock()
+        self.pressure.reason.return_value = None
+        self.pressure.healthy.return_value = True
+        self.now = 1000.0
+
+        self.time_patch = patch("memory.time.monotonic", side_effect=lambda: self.now)
+        self.time_patch.start()
+        self.governor = MemoryGovernor(self.session, lambda: {"buffer_count": self.governor.buffer_count},
+                                       pressure=self.pressure, min_dwell=10, recover_after=30)
+
+    def tearDown(self):
+        self.time_patch.stop()
+
+    def _tick(self, seconds):
+
+        self.now += seconds
+        self.governor.step()
+
+    def test_sheds_buffers_before_handing_over(self):
+
+        self.pressure.reason.return_value = "only 40 MB available"
+        self.pressure.healthy.return_value = False
+
+        self._tick(10)
+        self.session.reconfigure.assert_called_with({"buffer_count": 4})
+        self.assertIsNone(self.governor.reason())
+
+        self._tick(10)
+        self.session.reconfigure.assert_called_with({"buffer_count": 3})
+
+        # Nothing left to shed, the adaptive controller takes it from here
+        self._tick(10)
+        self.assertEqual(self.session.reconfigure.call_count, 2)
+        self.assertEqual(self.governor.reason(), "only 40 MB available")
+
+    def test_restores_buffers_after_sustained_health(self):
+
+        self.governor.level = 2
+        self._tick(10)
+        self._tick(20)
+        self.session.reconfigure.assert_not_called()
+
+        self._tick(15)
+        self.session.reconfigure.assert_called_once_with({"buffer_count": 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
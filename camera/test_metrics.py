@@ -0,0 +1,55 @@
+import unittest
+from metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_with_labels(self):
+
+        recoveries = self.registry.counter("eleeye_recoveries_total", "Recoveries by error")
+        recoveries.inc(error="EPIPE")
+        recoveries.inc(error="EPIPE")
+        recoveries.inc(error="ENOSPC")
+
+        text = self.registry.render()
+        self.assertIn("# TYPE eleeye_recoveries_total counter", text)
+        self.assertIn('eleeye_recoveries_total{error="EPIPE"} 2', text)
+        self.assertIn('eleeye_recoveries_total{error="ENOSPC"} 1', text)
+        self.assertEqual(recoveries.value(error="EPIPE"), 2)
+
+    def test_callable_gauge(self):
+
+        size = [100]
+        self.registry.gauge("eleeye_offline_buffer_bytes", "Buffer size", fn=lambda: size[0])
+        size[0] = 250
+
+        self.assertIn("eleeye_offline_buffer_bytes 250", self.registry.render())
+
+    def test_callable_gauges_per_label_set(self):
+
+        self.registry.gauge("eleeye_spill_bytes", "Spill", fn=lambda: 1, camera="cam0")
+        self.registry.gauge("eleeye_spill_bytes", "Spill", fn=lambda: 2, camera="cam1")
+        self.registry.gauge("eleeye_spill_bytes", "Spill", fn=lambda: 3, camera="cam0")
+
+        text = self.registry.render()
+        self.assertIn('eleeye_spill_bytes{camera="cam0"} 3', text)
+        self.assertIn('eleeye_spill_bytes{camera="cam1"} 2', text)
+        self.assertEqual(text.count("# TYPE eleeye_spill_bytes"), 1)
+
+    def test_unavailable_metric_does_not_break_render(self):
+
+        self.registry.gauge("eleeye_broken", "Broken", fn=lambda: 1 / 0)
+        self.registry.gauge("eleeye_missing", "Not available yet", fn=lambda: None)
+        self.registry.counter("eleeye_ok_total", "Ok").inc()
+
+        text = self.registry.render()
+        self.assertIn("# eleeye_broken unavailable", text)
+        self.assertNotIn("\neleeye_missing ", text)
+        self.assertIn("eleeye_ok_total 1", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
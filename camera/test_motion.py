@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from motion import MotionGate, downscale, changed_fraction
+
+SIZE = (64, 48)
+
+
+def frame(y):
+    """A YUV420 frame with the given luma plane and flat chroma."""
+    return np.concatenate([y.astype(np.uint8), np.full((SIZE[1] // 2, SIZE[0]), 128, np.uint8)])
+
+
+class TestDifferencing(unittest.TestCase):
+
+    def test_downscale_sums_tiles(self):
+
+        y = np.arange(16, dtype=np.uint8).reshape(4, 4)
+        self.assertEqual(downscale(y, 2).tolist(), [[10, 18], [42, 50]])
+
+    def test_noise_is_not_motion(self):
+
+        rng = np.random.default_rng(0)
+        base = rng.integers(50, 200, (SIZE[1], SIZE[0]))
+        noisy = base + rng.integers(-4, 5, base.shape)
+
+        self.assertEqual(changed_fraction(downscale(base.astype(np.uint8)), downscale(noisy.astype(np.uint8)), 12 * 16), 0)
+
+    def test_moving_block_is_motion(self):
+
+        before = np.full((SIZE[1], SIZE[0]), 60, np.uint8)
+        after = before.copy()
+        after[8:24, 16:32] = 200
+
+        self.assertAlmostEqual(changed_fraction(downscale(before), downscale(after), 12 * 16), 16 / 192)
+
+
+class TestMotionGate(unittest.TestCase):
+
+    def setUp(self):
+
+        self.now = 1000.0
+        self.time_patch = patch("motion.time.monotonic", side_effect=lambda: self.now)
+        self.time_patch.start()
+
+        self.session = MagicMock()
+        self.gate = MotionGate(self.session, lambda: {"fps": 30, "bitrate": 2_000_000}, SIZE,
+                               hold=30, trigger_frames=2, keepalive_fps=2, keepalive_bitrate=150_000)
+        self.static = np.full((SIZE[1], SIZE[0]), 60, np.uint8)
+
+    def tearDown(self):
+        self.time_patch.stop()
+
+    def _feed(self, y, seconds=1):
+
+        self.now += seconds
+        self.gate(frame(y), self.now)
+
+    def test_static_scene_drops_to_keepalive(self):
+
+        self._feed(self.static)
+        self._feed(self.static, 20)
+        self.assertFalse(self.gate.gated)
+
+        self._feed(self.static, 15)
+        self.assertTrue(self.gate.gated)
+        self.session.set_controls.assert_called_once_with({"FrameRate": 2})
+        self.session.restart_encoder.assert_called_once_with(150_000)
+
+    def test_motion_restores_quality(self):
+
+        self._feed(self.static)
+        self._feed(self.static, 40)
+        self.session.reset_mock()
+
+        moved = self.static.copy()
+        moved[:, :32] = 200
+
+        # A single changed frame could be noise or a light flicker
+        self._feed(moved)
+        self.assertTrue(self.gate.gated)
+
+        self._feed(self.static)
+        self.assertFalse(self.gate.gated)
+        self.session.restart_encoder.assert_called_once_with(2_000_000)
+        self.session.set_controls.assert_called_once_with({"FrameRate": 30})
+        self.assertEqual(self.gate.gated_seconds, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
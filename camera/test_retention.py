@@ -0,0 +1,127 @@
+import tempfile, unittest
+from unittest.mock import patch, MagicMock
+from segment_store import SegmentStore
+from telemetry import build_sei, insert_sei, pack_telemetry, extract_telemetry
+from keyframe_index import load_index
+import retention
+
+SPS, PPS = b"\x00\x00\x00\x01\x67\x42", b"\x00\x00\x00\x01\x68\xce"
+
+
+def picture(keyframe, payload=b"\x88" * 20):
+    """One access unit, with a slice whose first_mb_in_slice is 0."""
+    return (SPS + PPS + b"\x00\x00\x00\x01\x65\x88" if keyframe else b"\x00\x00\x00\x01\x41\x88") + payload
+
+
+class TestBuildTranscodeCommand(unittest.TestCase):
+
+    def test_command_downscales_without_b_frames(self):
+
+        command = retention.build_transcode_command("seg.h264", "transcode.tmp", 30, (640, 360), 10, 300_000)
+
+        self.assertEqual(command[command.index("-framerate") + 1], "30")
+        self.assertEqual(command[command.index("-vf") + 1], "scale=640:360,fps=10")
+        self.assertEqual(command[command.index("-b:v") + 1], "300000")
+        self.assertEqual(command[command.index("-bf") + 1], "0")
+        self.assertEqual(command[-1], "transcode.tmp")
+
+
+class TestTieredRetention(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=10)
+
+        for n in range(4):
+            name = self.store.new_segment_name()
+            with open(self.store.path(name), "wb") as f:
+                f.write(b"x" * 1000)
+            self.store.commit(name, n * 10.0, 10.0, 1000, 300)
+
+        self.names = [e["name"] for e in self.store.entries()]
+        self.retention = retention.TieredRetention(self.store, full_seconds=20, frame_rate=10)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def encode_to(self, size, returncode=0):
+
+        def popen(command, **kwargs):
+            with open(command[-1], "wb") as f:
+                f.write(b"y" * size)
+            return MagicMock(**{"wait.return_value": returncode})
+
+        return popen
+
+    def test_newest_footage_stays_full_quality(self):
+
+        self.assertEqual(self.retention.candidate()["name"], self.names[1])
+
+    @patch("retention.subprocess.Popen")
+    def test_transcode_replaces_segment(self, mock_popen):
+
+        mock_popen.side_effect = self.encode_to(100)
+        self.assertTrue(self.retention.transcode(self.retention.candidate()))
+
+        entry = self.store.entries()[1]
+        self.assertEqual((entry["bytes"], entry["frames"], entry["tier"]), (100, 100, "low"))
+        self.assertEqual(self.retention.saved_bytes, 900)
+        self.assertEqual(self.retention.candidate()["name"], self.names[0])
+
+    @patch("retention.subprocess.Popen")
+    def test_larger_result_is_discarded(self, mock_popen):
+
+        mock_popen.side_effect = self.encode_to(2000)
+        self.assertFalse(self.retention.transcode(self.retention.candidate()))
+
+        self.assertEqual(self.store.entries()[1]["bytes"], 1000)
+        self.assertEqual(self.retention.candidate()["name"], self.names[0])
+
+    @patch("retention.subprocess.Popen")
+    def test_segment_uploaded_meanwhile_is_skipped(self, mock_popen):
+
+        mock_popen.side_effect = self.encode_to(100)
+        entry = self.retention.candidate()
+        self.store.remove(entry["name"])
+
+        self.assertFalse(self.retention.transcode(entry))
+        self.assertEqual(self.retention.transcoded_segments, 0)
+
+    @patch("retention.subprocess.Popen")
+    def test_transcoded_segment_keeps_telemetry(self, mock_popen):
+
+        # 30 fps source with capture times and location in its SEI
+        name = self.names[1]
+        source = b"".join(
+            insert_sei(picture(n % 30 == 0, b"\x88" * 200), build_sei(pack_telemetry(1000 + n, 1_700_000_000 + n / 30, (7.29, 80.63))))
+            for n in range(300)
+        )
+        with open(self.store.path(name), "wb") as f:
+            f.write(source)
+
+        # ffmpeg's 10 fps output carries no SEI of ours
+        def popen(command, **kwargs):
+            with open(command[-1], "wb") as f:
+                f.write(b"".join(picture(n % 20 == 0) for n in range(100)))
+            return MagicMock(**{"wait.return_value": 0})
+
+        mock_popen.side_effect = popen
+        entry = dict(self.store.entries()[1], bytes=len(source))
+        self.assertTrue(self.retention.transcode(entry))
+
+        with open(self.store.path(name), "rb") as f:
+            records = extract_telemetry(f.read())
+
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records[1]["sequence"], 1003)
+        self.assertAlmostEqual(records[10]["capture_time"], 1_700_000_001.0, places=3)
+        self.assertEqual((records[0]["lat"], records[0]["lon"]), (7.29, 80.63))
+
+        times = [e["time"] for e in load_index(self.store.path(name))]
+        self.assertEqual(len(times), 5)
+        self.assertAlmostEqual(times[1], 1_700_000_002.0, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
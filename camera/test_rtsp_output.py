@@ -0,0 +1,136 @@
+import sys, time, unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from session import OutputFanout
+
+
+class FakeContainer:
+
+    def __init__(self, fail_connect=False):
+
+        self.fail_connect = fail_connect
+        self.packets = []
+        self.closed = False
+        self.fail_mux = False
+
+    def add_stream(self, codec, **kwargs):
+        return SimpleNamespace(codec=codec, **kwargs)
+
+    def start_encoding(self):
+        if self.fail_connect:
+            raise OSError("Connection refused")
+
+    def mux(self, packet):
+        if self.fail_mux:
+            raise OSError("Broken pipe")
+        self.packets.append(packet)
+
+    def close(self):
+        self.closed = True
+
+
+class FakePacket:
+
+    def __init__(self, data):
+        self.data = data
+
+
+class TestPyavRtspOutput(unittest.TestCase):
+
+    def setUp(self):
+
+        self.containers = []
+        self.av = MagicMock()
+        self.av.Packet = FakePacket
+        self.av.open.side_effect = lambda *args, **kwargs: self._container()
+
+        self.modules = patch.dict(sys.modules, {"av": self.av})
+        self.modules.start()
+
+        from rtsp_output import PyavRtspOutput
+        self.output = PyavRtspOutput("rtsp://example.com/live", retry_interval=0)
+        self.output.error_callback = MagicMock()
+
+    def tearDown(self):
+
+        self.output.stop()
+        self.modules.stop()
+
+    def _container(self):
+
+        container = FakeContainer()
+        self.containers.append(container)
+        return container
+
+    def _connected(self):
+
+        deadline = time.monotonic() + 2
+        while self.output._ready is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _start(self):
+
+        self.output.start()
+        self.output._add_stream("video", "h264", width=1280, height=720)
+        self._connected()
+
+    def test_connects_and_starts_on_a_keyframe(self):
+
+        self._start()
+        self.av.open.assert_called_once_with("rtsp://example.com/live", "w", format="rtsp", options={"rtsp_transport": "tcp"})
+
+        self.output.outputframe(b"P0", keyframe=False, timestamp=0)
+        self.output.outputframe(b"I1", keyframe=True, timestamp=33_333)
+        self.output.outputframe(b"P2", keyframe=False, timestamp=66_666)
+
+        packets = self.containers[0].packets
+        self.assertEqual([p.data for p in packets], [b"I1", b"P2"])
+        self.assertEqual(packets[0].stream.width, 1280)
+
+    def test_timeline_continues_across_encoder_restart(self):
+
+        self._start()
+
+        for timestamp in (0, 33_333, 66_666):
+            self.output.outputframe(b"I", keyframe=True, timestamp=timestamp)
+
+        # A restarted encoder with the same stream keeps the RTSP session
+        self.output._add_stream("video", "h264", width=1280, height=720)
+        self.output.outputframe(b"I", keyframe=True, timestamp=0)
+        self.output.outputframe(b"P", keyframe=False, timestamp=40_000)
+
+        pts = [p.pts for p in self.containers[0].packets]
+        self.assertEqual(pts, [0, 33_333, 66_666, 99_999, 139_999])
+        self.assertEqual(len(self.containers), 1)
+
+    def test_failed_send_reconnects(self):
+
+        self._start()
+        self.output.outputframe(b"I", keyframe=True, timestamp=0)
+
+        self.containers[0].fail_mux = True
+        self.output.outputframe(b"P", keyframe=False, timestamp=33_333)
+
+        self.assertTrue(self.output.output_broken)
+        self.assertTrue(self.containers[0].closed)
+        self.output.error_callback.assert_called_once()
+
+        self.output.outputframe(b"P", keyframe=False, timestamp=66_666)
+        self._connected()
+        self.output.outputframe(b"I", keyframe=True, timestamp=99_999)
+
+        self.assertFalse(self.output.output_broken)
+        self.assertEqual([p.data for p in self.containers[1].packets], [b"I"])
+
+    def test_fanout_describes_the_stream(self):
+
+        fanout = OutputFanout()
+        fanout._add_stream("video", "h264", width=640, height=360)
+        fanout.attach(self.output)
+        self._connected()
+
+        self.assertEqual(self.output._stream_info, {"codec": "h264", "width": 640, "height": 360})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import os, json, errno, tempfile, unittest
+from unittest.mock import patch, MagicMock
+from segment_store import SegmentStore, SegmentedOutput, MANIFEST_FILE
+from keyframe_index import read_index, index_path, write_index
+
+
+class TestSegmentStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _add_segment(self, data=b"frame", start=0.0):
+
+        name = self.store.new_segment_name()
+        with open(self.store.path(name), "wb") as f:
+            f.write(data)
+        write_index(self.store.path(name), [{"offset": 0, "frame": 0, "time": start}])
+        self.store.commit(name, start, 10.0, len(data), 1)
+        return name
+
+    def test_ring_drops_oldest(self):
+
+        names = [self._add_segment() for _ in range(5)]
+        entries = [e["name"] for e in self.store.entries()]
+
+        self.assertEqual(entries, names[-3:])
+        self.assertFalse(os.path.exists(self.store.path(names[0])))
+        self.assertFalse(os.path.exists(index_path(self.store.path(names[0]))))
+        self.assertTrue(os.path.exists(self.store.path(names[-1])))
+
+    def test_manifest_survives_reload(self):
+
+        names = [self._add_segment() for _ in range(2)]
+        reloaded = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=3)
+
+        self.assertEqual([e["name"] for e in reloaded.entries()], names)
+        self.assertNotIn(reloaded.new_segment_name(), names)
+
+    def test_reload_adopts_uncommitted_segment(self):
+
+        self._add_segment()
+        orphan = self.store.new_segment_name()
+        with open(self.store.path(orphan), "wb") as f:
+            f.write(b"partial")
+
+        reloaded = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=3)
+        self.assertEqual(reloaded.entries()[-1]["name"], orphan)
+
+    def test_window_spans_segments(self):
+
+        names = [self._add_segment(b"IpIp", start) for start in (0.0, 10.0, 20.0)]
+        for name, start in zip(names, (0.0, 10.0, 20.0)):
+            write_index(self.store.path(name), [{"offset": 0, "frame": 0, "time": start}, {"offset": 2, "frame": 1, "time": start + 5}])
+
+        ranges = self.store.window(16.0, 22.0)
+
+        self.assertEqual(ranges, [(self.store.path(names[1]), 2, 4), (self.store.path(names[2]), 0, 2)])
+
+    def test_remove(self):
+
+        name = self._add_segment()
+        self.store.remove(name)
+
+        self.assertEqual(self.store.entries(), [])
+        with open(os.path.join(self.tmp.name, "manifest.json")) as f:
+            self.assertEqual(json.load(f), [])
+
+    def test_byte_budget_drops_oldest(self):
+
+        self.store.max_segments = 10
+        self.store.max_bytes = 25
+        names = [self._add_segment(b"x" * 10) for _ in range(4)]
+
+        self.assertEqual([e["name"] for e in self.store.entries()], names[-2:])
+
+    def test_replace_swaps_file_and_entry(self):
+
+        name = self._add_segment(b"full quality")
+        new_path = os.path.join(self.tmp.name, "transcode.tmp")
+        with open(new_path, "wb") as f:
+            f.write(b"low")
+
+        self.assertTrue(self.store.replace(name, new_path, 3, 5, tier="low"))
+
+        with open(self.store.path(name), "rb") as f:
+            self.assertEqual(f.read(), b"low")
+        self.assertIsNone(read_index(self.store.path(name)))
+        self.assertEqual(self.store.entries(), [{"name": name, "start": 0.0, "duration": 10.0, "bytes": 3, "frames": 5, "tier": "low"}])
+
+        self.store.remove(name)
+        with open(new_path, "wb") as f:
+            f.write(b"low")
+        self.assertFalse(self.store.replace(name, new_path, 3, 5))
+        self.assertTrue(os.path.exists(new_path))
+
+    def test_quarantine_moves_segment_aside(self):
+
+        bad, good = self._add_segment(b"corrupt"), self._add_segment()
+
+        self.assertTrue(self.store.quarantine(bad, "upload failed 5 times"))
+
+        quarantine = os.path.join(self.tmp.name, "quarantine")
+        with open(os.path.join(quarantine, bad), "rb") as f:
+            self.assertEqual(f.read(), b"corrupt")
+        with open(os.path.join(quarantine, "manifest.json")) as f:
+            self.assertEqual([(e["name"], e["reason"]) for e in json.load(f)], [(bad, "upload failed 5 times")])
+
+        self.assertFalse(os.path.exists(index_path(self.store.path(bad))))
+        self.assertEqual([e["name"] for e in SegmentStore(self.tmp.name).entries()], [good])
+        self.assertFalse(self.store.quarantine(bad, "again"))
+
+    def test_commit_on_full_disk_changes_nothing(self):
+
+        names = [self._add_segment() for _ in range(3)]
+        name = self.store.new_segment_name()
+        with open(self.store.path(name), "wb") as f:
+            f.write(b"frame")
+
+        with patch("segment_store.json.dump", side_effect=OSError(errno.ENOSPC, "No space left on device")):
+            with self.assertRaises(OSError):
+                self.store.commit(name, 0.0, 10.0, 5, 1)
+
+        self.assertEqual([e["name"] for e in self.store.entries()], names)
+        self.assertTrue(os.path.exists(self.store.path(names[0])))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, MANIFEST_FILE + ".tmp")))
+
+    def test_quarantine_drops_entry_without_file(self):
+
+        missing, present = self._add_segment(), self._add_segment()
+        os.remove(self.store.path(missing))
+
+        self.assertFalse(self.store.quarantine(missing, "upload failed 5 times"))
+
+        self.assertEqual([e["name"] for e in self.store.entries()], [present])
+        self.assertEqual([e["name"] for e in SegmentStore(self.tmp.name).entries()], [present])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "quarantine", MANIFEST_FILE)))
+
+
+class TestSegmentedOutput(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentStore(self.tmp.name, segment_seconds=10, max_segments=10)
+        self.output = SegmentedOutput(self.store)
+        self.output.start()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("segment_store.time.time")
+    def test_segments_start_on_keyframes(self, mock_time):
+
+        # frames before the first keyframe are not decodable and are dropped
+        frames = [(0, b"p", False), (1, b"I1", True), (5, b"p", False), (12, b"p", False), (13, b"I2", True), (14, b"p", False)]
+
+        for now, data, keyframe in frames:
+            mock_time.return_value = now
+            self.output.outputframe(data, keyframe)
+
+        self.output.stop()
+        entries = self.store.entries()
+
+        self.assertEqual(len(entries), 2)
+        with open(self.store.path(entries[0]["name"]), "rb") as f:
+            self.assertEqual(f.read(), b"I1pp")
+        with open(self.store.path(entries[1]["name"]), "rb") as f:
+            self.assertEqual(f.read(), b"I2p")
+        self.assertEqual(entries[0]["frames"], 3)
+
+        # Keyframe offsets are indexed as the segment is written
+        self.assertEqual([(e["offset"], e["frame"], e["time"]) for e in read_index(self.store.path(entries[0]["name"]))], [(0, 0, 1)])
+
+    def _fill_disk(self):
+
+        self.output._file.close()
+        self.output._file = MagicMock()
+        self.output._file.write.side_effect = OSError(errno.ENOSPC, "No space left on device")
+
+    @patch("segment_store.time.time")
+    def test_disk_full_spills_to_ram(self, mock_time):
+
+        mock_time.return_value = 0
+        self.output.outputframe(b"I1", True)
+        self._fill_disk()
+
+        for now, data, keyframe in [(1, b"p", False), (2, b"p", False), (3, b"I2", True), (4, b"p", False), (5, b"I3", True), (6, b"p", False)]:
+            mock_time.return_value = now
+            self.output.outputframe(data, keyframe)
+
+        self.assertTrue(self.output.spilling)
+        self.assertTrue(self.output.drain_spill())
+        self.assertFalse(self.output.spilling)
+
+        # The open GOP continues in the same file after the drain
+        mock_time.return_value = 7
+        self.output.outputframe(b"p", False)
+        self.output.stop()
+
+        contents = []
+        for entry in self.store.entries():
+            with open(self.store.path(entry["name"]), "rb") as f:
+                contents.append(f.read())
+
+        self.assertEqual(contents, [b"I1", b"I2p", b"I3pp"])
+        self.assertEqual([len(read_index(self.store.path(e["name"]))) for e in self.store.entries()], [1, 1, 1])
+
+    @patch("segment_store.time.time", return_value=0)
+    def test_spill_is_bounded(self, mock_time):
+
+        self.output.spill_bytes = 6
+        self.output.outputframe(b"I1", True)
+        self._fill_disk()
+        self.output.outputframe(b"p", False)
+
+        for data in (b"I2", b"pp", b"I3", b"pp"):
+            self.output.outputframe(data, data.startswith(b"I"))
+
+        self.assertEqual(self.output.spilled_bytes(), 4)
+        self.assertEqual(self.output.spill_dropped, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
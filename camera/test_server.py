@@ -68,4 +68,26 @@ def test_missing_payload_warning_light_post_request(default_payload):
 
 def test_invalid_endpoint():
     response = requests.get(f"{BASE_SERVER_URL}/invalid")
-    assert response.status_code == 404, "Invalid endpoint should return 404"
\ No newline at end of file
+    assert response.status_code == 404, "Invalid endpoint should return 404"
+
+@pytest.mark.parametrize(
+        "payload, error_message",
+        [
+            ({"post_roll" : -1}, "Post roll must be a non-negative number of seconds"),
+            ({"post_roll" : "long"}, "Post roll must be a non-negative number of seconds"),
+            ({"post_roll" : 61}, "Post roll is too long"),
+        ],
+)
+
+def test_invalid_trigger_clip_post_request(payload, error_message):
+
+    response = requests.post(f"{BASE_SERVER_URL}/trigger_clip", json=payload)
+    assert response.status_code == 400
+    data = response.json()
+    assert data["status"] == "error"
+    assert error_message in "".join(data["message"])
+
+def test_invalid_snapshot_camera():
+
+    response = requests.get(f"{BASE_SERVER_URL}/snapshot?camera=-1")
+    assert response.status_code == 400
@@ -0,0 +1,233 @@
+import time, threading, unittest
+from unittest.mock import MagicMock, patch
+from picamera2.outputs import Output
+from session import OutputFanout, CameraSession
+
+
+class RecordingOutput(Output):
+
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+        self.started = 0
+        self.stopped = 0
+
+    def start(self):
+        super().start()
+        self.started += 1
+
+    def stop(self):
+        super().stop()
+        self.stopped += 1
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        self.frames.append(frame)
+
+
+class TestOutputFanout(unittest.TestCase):
+
+    def test_attached_output_waits_for_keyframe(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+        fanout.attach(output)
+
+        fanout.outputframe(b"p1", keyframe=False)
+        fanout.outputframe(b"I", keyframe=True)
+        fanout.outputframe(b"p2", keyframe=False)
+
+        self.assertEqual(output.frames, [b"I", b"p2"])
+        self.assertEqual(fanout.uncovered_frames, 1)
+        self.assertEqual(fanout.frames, 3)
+
+    def test_detach_stops_output(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+        fanout.attach(output)
+        fanout.detach(output)
+        fanout.outputframe(b"I", keyframe=True)
+
+        self.assertEqual(output.started, 1)
+        self.assertEqual(output.stopped, 1)
+        self.assertEqual(output.frames, [])
+
+    def test_failing_output_does_not_block_others(self):
+
+        fanout = OutputFanout()
+        broken = MagicMock()
+        broken.outputframe.side_effect = BrokenPipeError()
+        healthy = RecordingOutput()
+        fanout.attach(broken)
+        fanout.attach(healthy)
+
+        fanout.outputframe(b"I", keyframe=True)
+        self.assertEqual(healthy.frames, [b"I"])
+
+    def test_encoder_restart_resyncs_outputs(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+        fanout.attach(output)
+        fanout.outputframe(b"I", keyframe=True)
+
+        fanout.start()
+        fanout.outputframe(b"p", keyframe=False)
+        self.assertEqual(output.frames, [b"I"])
+
+    def test_annotate_applies_to_every_output(self):
+
+        fanout = OutputFanout()
+        fanout.annotate = lambda frame, keyframe, timestamp: b"sei" + frame
+        first, second = RecordingOutput(), RecordingOutput()
+        fanout.attach(first)
+        fanout.attach(second)
+
+        fanout.outputframe(b"I", keyframe=True, timestamp=0)
+
+        self.assertEqual(first.frames, [b"seiI"])
+        self.assertEqual(second.frames, [b"seiI"])
+        self.assertEqual(fanout.bytes, 4)
+
+    def test_attach_requests_a_keyframe(self):
+
+        fanout = OutputFanout()
+        fanout.encoder = MagicMock()
+        fanout.attach(RecordingOutput())
+
+        fanout.encoder.force_key_frame.assert_called_once()
+
+    @patch("session.time.monotonic_ns", return_value=10_150_000_000)
+    def test_latency_from_sensor_timestamps(self, mock_clock):
+
+        fanout = OutputFanout()
+        fanout.encoder = MagicMock(firsttimestamp=9_000_000)
+        fanout.outputframe(b"I", keyframe=True, timestamp=None)
+        self.assertIsNone(fanout.latency())
+
+        # Sensor time 10.1s and 10.05s, both reaching the fanout at 10.15s
+        fanout.outputframe(b"P", keyframe=False, timestamp=1_100_000)
+        fanout.outputframe(b"P", keyframe=False, timestamp=1_050_000)
+
+        latency = fanout.latency()
+        self.assertAlmostEqual(latency["p50"], 0.1)
+        self.assertAlmostEqual(latency["max"], 0.1)
+        self.assertAlmostEqual(sorted(fanout.latencies)[0], 0.05)
+
+
+class TestCameraSession(unittest.TestCase):
+
+    def test_switch_to_loses_no_frames(self):
+
+        session = CameraSession(MagicMock(), switch_timeout=2)
+        live, offline = RecordingOutput(), RecordingOutput()
+        session.fanout.attach(live)
+
+        stop = threading.Event()
+
+        def feed():
+            count = 0
+            while not stop.is_set():
+                session.fanout.outputframe(b"f", keyframe=(count % 5 == 0))
+                count += 1
+                stop.wait(0.001)
+
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+
+        try:
+            session.switch_to(offline)
+        finally:
+            stop.set()
+            feeder.join()
+
+        self.assertEqual(session.fanout.outputs(), [offline])
+        self.assertEqual(live.stopped, 1)
+        self.assertEqual(session.fanout.uncovered_frames, 0)
+        self.assertTrue(offline.frames)
+
+    def test_restart_keeps_outputs(self):
+
+        picam = MagicMock()
+        session = CameraSession(picam)
+        output = RecordingOutput()
+        session.fanout.attach(output)
+
+        session.restart(delay=0)
+
+        picam.stop_recording.assert_called()
+        picam.start_recording.assert_called_with(session.encoder, session.fanout)
+        self.assertEqual(output.stopped, 0)
+
+    def test_restart_encoder_keeps_camera_running(self):
+
+        picam = MagicMock()
+        session = CameraSession(picam, bitrate=2_000_000)
+        session.start()
+        old_encoder = session.encoder
+
+        session.restart_encoder(1_000_000)
+
+        picam.stop_encoder.assert_called_with(old_encoder)
+        picam.start_encoder.assert_called_with(session.encoder, session.fanout)
+        picam.stop.assert_not_called()
+        self.assertEqual(session.encoder.bitrate, 1_000_000)
+
+    def test_restart_encoder_switches_encoder_and_keeps_settings(self):
+
+        picam = MagicMock()
+        session = CameraSession(picam, keyframe_interval=30, bitrate=2_000_000)
+        session.start()
+
+        with patch("picamera2.encoders.LibavH264Encoder", create=True) as mock_libav:
+            session.restart_encoder(encoder_name="libav")
+
+        mock_libav.assert_called_once_with(bitrate=2_000_000, iperiod=30, profile=None)
+        self.assertEqual(session.encoder, mock_libav.return_value)
+        self.assertEqual(session.encoder_name, "libav")
+
+    def test_output_stats_track_write_time(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+        fanout.attach(output)
+        fanout.outputframe(b"I" * 10, keyframe=True)
+
+        stats = fanout.stats(output)
+        self.assertEqual(stats["bytes"], 10)
+        self.assertEqual(stats["frames"], 1)
+        self.assertIsNone(fanout.stats(RecordingOutput()))
+
+    def test_write_progress_reports_blocked_write(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+        fanout.attach(output)
+        progress = []
+
+        def slow_write(*args):
+            time.sleep(0.02)
+            progress.append(fanout.write_progress(output))
+
+        output.outputframe = slow_write
+        fanout.outputframe(b"I", keyframe=True)
+
+        self.assertGreaterEqual(progress[0][1], 0.02)
+        self.assertEqual(fanout.write_progress(output)[1], 0.0)
+        self.assertIsNone(fanout.write_progress(RecordingOutput()))
+
+    def test_totals_survive_detach(self):
+
+        fanout = OutputFanout()
+        output = RecordingOutput()
+
+        for _ in range(2):
+            fanout.attach(output)
+            fanout.outputframe(b"I" * 10, keyframe=True)
+            fanout.detach(output)
+
+        self.assertEqual(fanout.totals(output), {"frames": 2, "bytes": 20})
+
+
+if __name__ == "__main__":
+    unittest.main()
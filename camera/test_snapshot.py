@@ -0,0 +1,88 @@
+import sys, base64, unittest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from snapshot import SnapshotCache, encode_yuv420
+
+
+class TestEncoding(unittest.TestCase):
+
+    def encode(self, frame, size, stride=None):
+
+        simplejpeg = MagicMock()
+        simplejpeg.encode_jpeg_yuv_planes.return_value = b"jpeg"
+
+        with patch.dict(sys.modules, {"simplejpeg": simplejpeg}):
+            self.assertEqual(encode_yuv420(frame, size, stride, quality=70), b"jpeg")
+
+        return simplejpeg.encode_jpeg_yuv_planes.call_args.args
+
+    def test_yuv420_planes(self):
+
+        width, height = 8, 4
+        frame = np.concatenate([np.full((height, width), 1, np.uint8), np.full((height // 4, width), 2, np.uint8),
+                                np.full((height // 4, width), 3, np.uint8)])
+
+        y, u, v = self.encode(frame, (width, height))
+        self.assertEqual((y.shape, u.shape, v.shape), ((4, 8), (2, 4), (2, 4)))
+        self.assertEqual((y.max(), u.max(), v.max()), (1, 2, 3))
+
+    def test_yuv420_padded_rows_are_cropped(self):
+
+        # 6 pixel wide rows padded to a stride of 8, the padding filled with 9
+        width, height, stride = 6, 4, 8
+        y = np.full((height, stride), 9, np.uint8)
+        y[:, :width] = 1
+        uv = np.full((height, stride // 2), 9, np.uint8)
+        uv[:height // 2, :width // 2] = 2
+        uv[height // 2:, :width // 2] = 3
+        frame = np.concatenate([y, uv.reshape(height // 2, stride)])
+
+        y, u, v = self.encode(frame, (width, height), stride)
+        self.assertEqual((y.shape, u.shape, v.shape), ((4, 6), (2, 3), (2, 3)))
+        self.assertEqual((y.max(), u.max(), v.max()), (1, 2, 3))
+
+
+class TestSnapshotCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.now = 1000.0
+        self.time_patch = patch("snapshot.time.monotonic", side_effect=lambda: self.now)
+        self.time_patch.start()
+
+        self.jpegs = iter([b"first", b"second"])
+        self.cache = SnapshotCache(lambda: (next(self.jpegs), 1700000000.0), max_age=5)
+
+    def tearDown(self):
+        self.time_patch.stop()
+
+    def test_encodes_once_per_interval(self):
+
+        first = self.cache.get()
+        self.now += 4
+        self.assertEqual(self.cache.get(), first)
+        self.assertEqual(base64.b64decode(first["jpeg"]), b"first")
+        self.assertEqual(self.cache.encoded, 1)
+
+        self.now += 1
+        second = self.cache.get()
+        self.assertEqual(base64.b64decode(second["jpeg"]), b"second")
+        self.assertNotEqual(second["etag"], first["etag"])
+
+    def test_current_etag_skips_the_jpeg(self):
+
+        etag = self.cache.get()["etag"]
+        self.assertEqual(self.cache.get(etag), {"etag": etag, "timestamp": 1700000000.0})
+
+    def test_failed_capture_is_retried(self):
+
+        self.cache.capture = MagicMock(side_effect=[RuntimeError("cam0 is not running"), (b"jpeg", 1.0)])
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get()
+
+        self.assertIn("jpeg", self.cache.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
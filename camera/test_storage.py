@@ -0,0 +1,95 @@
+import os, time, tempfile, unittest
+from unittest.mock import patch, MagicMock
+from segment_store import SegmentStore
+from storage import StorageGovernor, disk_free_bytes
+
+MB = 1024 * 1024
+
+
+class TestStorageGovernor(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentStore(os.path.join(self.tmp.name, "buffer"), segment_seconds=10, max_segments=10)
+        self.clips_dir = os.path.join(self.tmp.name, "clips")
+        os.makedirs(self.clips_dir)
+
+        self.segment_output = MagicMock()
+        self.segment_output.spilling = False
+        self.governor = StorageGovernor(self.tmp.name, self.store, self.segment_output, self.clips_dir, low_mb=100, high_mb=200)
+
+        # Every recording takes up 60 MB of a disk that has 50 MB free with four of them on it
+        self.free = None
+        self.disk_patch = patch("storage.disk_free_bytes", side_effect=lambda path: self._free())
+        self.disk_patch.start()
+
+    def tearDown(self):
+
+        self.disk_patch.stop()
+        self.tmp.cleanup()
+
+    def _add_segment(self, start):
+
+        name = self.store.new_segment_name()
+        with open(self.store.path(name), "wb") as f:
+            f.write(b"segment")
+        self.store.commit(name, start, 10.0, 7, 1)
+        return name
+
+    def _add_clip(self, name, mtime):
+
+        path = os.path.join(self.clips_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"clip")
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _free(self):
+
+        if self.free is not None:
+            return self.free
+
+        recordings = len(self.store.entries()) + len(os.listdir(self.clips_dir))
+        return 50 * MB + (4 - recordings) * 60 * MB
+
+    def test_disk_free_bytes(self):
+        self.assertGreater(disk_free_bytes(self.tmp.name), 0)
+
+    def test_evicts_oldest_recordings_until_high_watermark(self):
+
+        now = time.time()
+        old_clip = self._add_clip("clip_old.h264", now - 3600)
+        self._add_segment(now - 1800)
+        self._add_segment(now - 600)
+        third = self._add_segment(now - 300)
+
+        self.governor.step()
+
+        # 50 MB + 3 * 60 MB crosses the 200 MB high watermark
+        self.assertFalse(os.path.exists(old_clip))
+        self.assertEqual([e["name"] for e in self.store.entries()], [third])
+        self.assertEqual(self.governor.evicted_files, 3)
+
+    def test_clips_being_written_are_kept(self):
+
+        self.free = 50 * MB
+        clip = self._add_clip("clip_new.h264", time.time())
+        self.governor.step()
+
+        self.assertTrue(os.path.exists(clip))
+
+    def test_drains_spill_once_space_is_back(self):
+
+        self.free = 50 * MB
+        self.segment_output.spilling = True
+        self.governor.step()
+        self.segment_output.drain_spill.assert_not_called()
+
+        self.free = 150 * MB
+        self.governor.step()
+        self.segment_output.drain_spill.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import errno, unittest
+from unittest.mock import patch, MagicMock
+import supervisor
+from supervisor import Supervisor, RetryBudget, classify
+
+
+def budgets(attempts=2, reinit_attempts=1):
+    return {
+        "pipe": RetryBudget(attempts=attempts, window=60, base_delay=1, max_delay=4, jitter=0),
+        "other": RetryBudget(attempts=attempts, window=60, base_delay=1, max_delay=4, jitter=0),
+        supervisor.REINIT: RetryBudget(attempts=reinit_attempts, window=60, base_delay=5, max_delay=5, jitter=0),
+    }
+
+
+class TestClassify(unittest.TestCase):
+
+    def test_os_errors(self):
+
+        self.assertEqual(classify(OSError(errno.ENODEV, "gone")), "device_missing")
+        self.assertEqual(classify(OSError(errno.EBUSY, "busy")), "busy")
+        self.assertEqual(classify(BrokenPipeError(errno.EPIPE, "pipe")), "pipe")
+        self.assertEqual(classify(ConnectionResetError()), "pipe")
+        self.assertEqual(classify(OSError(errno.EMFILE, "fds")), "fds")
+
+    def test_runtime_errors(self):
+
+        self.assertEqual(classify(RuntimeError("Camera not found")), "device_missing")
+        self.assertEqual(classify(RuntimeError("failed to allocate buffers")), "encoder")
+        self.assertEqual(classify(RuntimeError("something else")), "other")
+        self.assertEqual(classify(MemoryError()), "memory")
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_window(self):
+
+        budget = RetryBudget(attempts=2, window=10)
+        budget.record(0)
+        budget.record(1)
+        self.assertTrue(budget.exhausted(5))
+        self.assertFalse(budget.exhausted(10.5))
+
+    def test_backoff_and_jitter(self):
+
+        budget = RetryBudget(base_delay=1, max_delay=8, jitter=0.5)
+        self.assertTrue(0.5 <= budget.delay(0) <= 1.5)
+
+        for i in range(5):
+            budget.record(i)
+
+        self.assertTrue(4 <= budget.delay(5) <= 12)
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+
+        self.sleep = MagicMock()
+        self.supervisor = Supervisor(budgets(), sleep=self.sleep)
+
+    def test_retry_runs_action(self):
+
+        action = MagicMock()
+        decision = self.supervisor.recover(BrokenPipeError(errno.EPIPE, "pipe"), action)
+
+        self.assertEqual(decision, supervisor.RETRY)
+        action.assert_called_once_with("pipe")
+        self.sleep.assert_called_once_with(1)
+        self.assertEqual(self.supervisor.state, supervisor.RECOVERING)
+
+    def test_escalates_then_fatal(self):
+
+        error = BrokenPipeError(errno.EPIPE, "pipe")
+        action = MagicMock()
+
+        self.assertEqual(self.supervisor.recover(error, action), supervisor.RETRY)
+        self.assertEqual(self.supervisor.recover(error, action), supervisor.RETRY)
+        self.assertEqual(self.supervisor.recover(error, action), supervisor.REINIT)
+        self.assertEqual(self.supervisor.recover(error, action), supervisor.FATAL)
+
+        self.assertEqual(action.call_count, 2)
+        self.assertEqual(self.supervisor.state, supervisor.FATAL)
+
+    def test_device_missing_is_fatal(self):
+
+        action = MagicMock()
+        self.assertEqual(self.supervisor.recover(OSError(errno.ENODEV, "gone"), action), supervisor.FATAL)
+        action.assert_not_called()
+
+    def test_failed_action_still_retries(self):
+
+        action = MagicMock(side_effect=RuntimeError("still broken"))
+        self.assertEqual(self.supervisor.recover(RuntimeError("odd"), action), supervisor.RETRY)
+
+    @patch("supervisor.time.monotonic")
+    def test_records_time_to_recover(self, mock_monotonic):
+
+        mock_monotonic.side_effect = [100.0, 100.0, 101.0, 104.5]
+
+        self.supervisor.recover(BrokenPipeError(errno.EPIPE, "pipe"), MagicMock())
+        self.supervisor.recover(BrokenPipeError(errno.EPIPE, "pipe"), MagicMock())
+        self.supervisor.transition(supervisor.LIVE)
+
+        self.assertEqual(self.supervisor.recovery_times["pipe"], [4.5])
+        self.assertEqual(self.supervisor.mttr(), 4.5)
+        self.assertEqual(supervisor.PIPELINE_STATE.value(state=supervisor.LIVE), 1)
+        self.assertEqual(supervisor.PIPELINE_STATE.value(state=supervisor.RECOVERING), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os, tempfile, unittest
+from unittest.mock import patch, mock_open
+from telemetry import (FrameTelemetry, LocationSource, build_sei, parse_sei, insert_sei, extract_telemetry,
+                       escape_rbsp, unescape_rbsp, pack_telemetry, unpack_telemetry, read_location_metadata, TELEMETRY_UUID)
+
+SPS = b"\x00\x00\x00\x01\x67\x64\x00\x28"
+PPS = b"\x00\x00\x00\x01\x68\xee\x3c\x80"
+IDR = b"\x00\x00\x00\x01\x65\x88\x84\x00\x00\x03\x01"
+SLICE = b"\x00\x00\x00\x01\x41\x9a\x02"
+
+
+class TestReadLocationMetadata(unittest.TestCase):
+
+    def test_valid_file(self):
+        fake_file = "10.123\n20.456\n"
+        with patch("builtins.open", mock_open(read_data=fake_file)):
+            result = read_location_metadata("dummy.txt")
+            self.assertEqual(result, (10.123, 20.456))
+
+    def test_invalid_line_count(self):
+        fake_file = "10.123\n"
+        with patch("builtins.open", mock_open(read_data=fake_file)):
+            result = read_location_metadata("dummy.txt")
+            self.assertIsNone(result)
+
+    def test_invalid_numbers(self):
+        fake_file = "abc\ndef\n"
+        with patch("builtins.open", mock_open(read_data=fake_file)):
+            result = read_location_metadata("dummy.txt")
+            self.assertIsNone(result)
+
+
+class TestLocationSource(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "location.txt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, text, mtime):
+
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_reloads_on_mtime_change(self):
+
+        source = LocationSource(self.path, check_interval=0)
+        self.assertIsNone(source.get())
+
+        # Zero is a valid coordinate
+        self._write("0.0\n180.0\n", 1000)
+        self.assertEqual(source.get(), (0.0, 180.0))
+
+        self._write("7.5\n80.9\n", 2000)
+        self.assertEqual(source.get(), (7.5, 80.9))
+
+        # A half written file keeps the last good location
+        self._write("7.6\n", 3000)
+        self.assertEqual(source.get(), (7.5, 80.9))
+
+
+class TestSei(unittest.TestCase):
+
+    def test_emulation_prevention_round_trip(self):
+
+        data = b"\x00\x00\x00\x00\x01\x00\x00\x02\x05"
+        escaped = escape_rbsp(data)
+
+        self.assertNotIn(b"\x00\x00\x01", escaped)
+        self.assertEqual(unescape_rbsp(escaped), data)
+
+    def test_build_and_parse(self):
+
+        user_data = pack_telemetry(42, 1700000000.25, (0.0, -180.0))
+        sei = build_sei(user_data)
+
+        self.assertTrue(sei.startswith(b"\x00\x00\x00\x01\x06\x05"))
+        [(message_uuid, parsed)] = parse_sei(sei[4:])
+        self.assertEqual(message_uuid, TELEMETRY_UUID)
+        self.assertEqual(unpack_telemetry(parsed), {
+            "version": 1, "sequence": 42, "capture_time": 1700000000.25, "lat": 0.0, "lon": -180.0
+        })
+
+    def test_inserted_before_first_slice(self):
+
+        sei = build_sei(pack_telemetry(1, 0.0))
+        self.assertEqual(insert_sei(SPS + PPS + IDR, sei), SPS + PPS + sei + IDR)
+        self.assertEqual(insert_sei(SLICE, sei), sei + SLICE)
+        self.assertEqual(insert_sei(SPS + PPS, sei), SPS + PPS)
+
+
+class TestFrameTelemetry(unittest.TestCase):
+
+    @patch("telemetry.time.time")
+    def test_frames_carry_sequence_time_and_location(self, mock_time):
+
+        mock_time.return_value = 1000.0
+        source = LocationSource("/nonexistent")
+        source.location = (7.5, 80.9)
+        annotate = FrameTelemetry(source)
+
+        stream = annotate(SPS + PPS + IDR, True, 0)
+        mock_time.return_value = 1000.05
+        stream += annotate(SLICE, False, 33333)
+
+        records = extract_telemetry(stream)
+        self.assertEqual([r["sequence"] for r in records], [1, 2])
+        self.assertEqual([r["capture_time"] for r in records], [1000.0, 1000.033333])
+        self.assertEqual((records[1]["lat"], records[1]["lon"]), (7.5, 80.9))
+
+    @patch("telemetry.time.time")
+    def test_reanchors_after_encoder_restart_and_drift(self, mock_time):
+
+        annotate = FrameTelemetry(max_drift=1.0)
+
+        mock_time.return_value = 1000.0
+        annotate.capture_time(0)
+
+        # Restarted encoder counts from zero again
+        mock_time.return_value = 2000.0
+        self.assertEqual(annotate.capture_time(0), 2000.0)
+
+        # Sensor clock and wall clock drifted apart
+        mock_time.return_value = 2010.0
+        self.assertEqual(annotate.capture_time(5_000_000), 2010.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
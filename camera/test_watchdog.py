@@ -0,0 +1,133 @@
+import os, socket, tempfile, unittest
+from unittest.mock import MagicMock, patch
+from session import OutputFanout
+from supervisor import classify
+from watchdog import FrameWatchdog, sd_notify
+
+
+class TestFrameWatchdog(unittest.TestCase):
+
+    def setUp(self):
+
+        self.clock = [100.0]
+        patcher = patch("watchdog.time.monotonic", side_effect=lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.session = MagicMock()
+        self.session.fanout = MagicMock(spec=OutputFanout)
+        self.session.fanout.last_frame_time = 100.0
+        self.session.fanout.write_progress.return_value = (100.0, 0.0)
+        self.output = MagicMock(output_broken=False)
+
+        self.watchdog = FrameWatchdog(self.session, self.output, frame_deadline=5, output_deadline=10)
+        self.watchdog.start()
+
+    def frames(self, at):
+
+        self.clock[0] = at
+        self.session.picam.post_callback(MagicMock())
+        self.session.fanout.last_frame_time = at
+        self.session.fanout.write_progress.return_value = (at, 0.0)
+
+    def test_flowing_frames_pass(self):
+
+        self.frames(120.0)
+        self.watchdog.check()
+        self.assertTrue(self.watchdog.flowing())
+
+    def test_request_callback_chains_previous_one(self):
+
+        previous = MagicMock()
+        self.session.picam.post_callback = previous
+        watchdog = FrameWatchdog(self.session)
+        watchdog.start()
+
+        self.session.picam.post_callback("request")
+        previous.assert_called_once_with("request")
+
+        watchdog.stop()
+        self.assertIs(self.session.picam.post_callback, previous)
+
+    def test_camera_stall_restarts_pipeline(self):
+
+        self.clock[0] = 106.0
+
+        with self.assertRaises(RuntimeError) as raised:
+            self.watchdog.check()
+
+        self.assertEqual(classify(raised.exception), "other")
+
+    def test_encoder_stall_is_classified_as_encoder(self):
+
+        self.frames(101.0)
+        self.clock[0] = 106.5
+        self.session.picam.post_callback(MagicMock())
+        self.assertFalse(self.watchdog.flowing())
+
+        with self.assertRaises(RuntimeError) as raised:
+            self.watchdog.check()
+
+        self.assertEqual(classify(raised.exception), "encoder")
+
+    def test_blocked_output_kills_ffmpeg(self):
+
+        self.frames(120.0)
+        self.session.fanout.write_progress.return_value = (109.0, 11.0)
+
+        with self.assertRaises(BrokenPipeError) as raised:
+            self.watchdog.check()
+
+        self.output.ffmpeg.kill.assert_called_once()
+        self.assertEqual(classify(raised.exception), "pipe")
+
+    def test_broken_output_restarts_after_deadline(self):
+
+        self.frames(120.0)
+        self.output.output_broken = True
+        self.watchdog.check()
+
+        self.frames(131.0)
+
+        with self.assertRaises(BrokenPipeError):
+            self.watchdog.check()
+
+    def test_detached_output_is_not_watched(self):
+
+        self.output.output_broken = True
+        self.frames(140.0)
+        self.session.fanout.write_progress.return_value = None
+
+        self.watchdog.check()
+
+    def test_arm_restarts_deadlines(self):
+
+        self.clock[0] = 200.0
+        self.watchdog.arm()
+        self.clock[0] = 203.0
+        self.watchdog.check()
+
+
+class TestSdNotify(unittest.TestCase):
+
+    def test_without_systemd(self):
+
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(sd_notify("WATCHDOG=1"))
+
+    def test_sends_state(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "notify")
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as server:
+                server.bind(path)
+
+                with patch.dict(os.environ, {"NOTIFY_SOCKET": path}):
+                    self.assertTrue(sd_notify("WATCHDOG=1"))
+
+                self.assertEqual(server.recv(64), b"WATCHDOG=1")
+
+
+if __name__ == "__main__":
+    unittest.main()
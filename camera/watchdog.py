@@ -0,0 +1,157 @@
+import os, time, errno, socket, logging
+from session import CameraSession
+
+logger = logging.getLogger(__name__)
+
+# --- systemd notifications ---
+
+def sd_notify(state: str) -> bool:
+    """
+    Send a state such as "READY=1" or "WATCHDOG=1" to systemd over $NOTIFY_SOCKET.
+    Does nothing outside systemd. The unit needs Type=notify and a WatchdogSec,
+    and NotifyAccess=all when camera.py runs under start_stream.sh rather than
+    as the service's main process.
+    """
+
+    address = os.environ.get("NOTIFY_SOCKET")
+
+    if not address:
+        return False
+
+    # A leading @ is an abstract socket
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode())
+        return True
+
+    except OSError as e:
+        logger.warning(f"[Watchdog] Could not notify systemd: {e}")
+        return False
+
+# --- Frame progress watchdog ---
+
+class FrameWatchdog:
+    """
+    Tracks frames through the pipeline: completed camera requests (through
+    Picamera2's post_callback), encoded frames reaching the fanout, and frames
+    the live output actually takes. check() raises once a stage has made no
+    progress within its deadline, with an error the supervisor maps to the
+    restart that fixes that stage:
+
+        camera stopped delivering   RuntimeError          restart the pipeline
+        encoder stopped producing   RuntimeError encoder  restart the pipeline
+        output stopped taking       BrokenPipeError       restart the output
+
+    The live output is only watched while it is attached. A write to ffmpeg
+    that never returns holds the fanout lock, so ffmpeg is killed first: the
+    write then fails and the output can be detached and started again.
+    """
+
+    def __init__(self, session: CameraSession, output=None, frame_deadline=5, output_deadline=10):
+
+        self.session = session
+        self.output = output
+        self.frame_deadline = frame_deadline
+        self.output_deadline = output_deadline
+        self.trips = 0
+
+        self.last_request = None
+        self._armed = time.monotonic()
+        self._broken_since = None
+        self._previous_callback = None
+
+    def start(self):
+
+        picam = self.session.picam
+        self._previous_callback = picam.post_callback
+        picam.post_callback = self._on_request
+
+    def stop(self):
+        self.session.picam.post_callback = self._previous_callback
+
+    def arm(self):
+        """Start the deadlines over, for a pipeline that has just been (re)started."""
+
+        self._armed = time.monotonic()
+        self._broken_since = None
+
+    def _on_request(self, request):
+
+        # Runs on Picamera2's camera thread for every completed request
+        self.last_request = time.monotonic()
+
+        if self._previous_callback is not None:
+            self._previous_callback(request)
+
+    def stall(self):
+        """Return (stage, seconds without progress) for the first stalled stage, or None."""
+
+        now = time.monotonic()
+
+        def age(last):
+            return now - max(last or 0.0, self._armed)
+
+        if age(self.last_request) > self.frame_deadline:
+            return "camera", age(self.last_request)
+
+        if age(self.session.fanout.last_frame_time) > self.frame_deadline:
+            return "encoder", age(self.session.fanout.last_frame_time)
+
+        progress = self.session.fanout.write_progress(self.output) if self.output is not None else None
+
+        if progress is None:
+            self._broken_since = None
+            return None
+
+        last_write, blocked_for = progress
+
+        # FfmpegOutput drops every frame without an error once its pipe has broken
+        if getattr(self.output, "output_broken", False):
+            self._broken_since = self._broken_since or now
+
+        else:
+            self._broken_since = None
+
+        stalled_for = max(blocked_for, age(last_write), age(self._broken_since) if self._broken_since else 0.0)
+
+        if stalled_for > self.output_deadline:
+            return "output", stalled_for
+
+        return None
+
+    def flowing(self) -> bool:
+        return self.stall() is None
+
+    def check(self):
+        """Raise for a stalled stage. Called once a second from the mode loops."""
+
+        stall = self.stall()
+
+        if stall is None:
+            return
+
+        stage, seconds = stall
+        self.trips += 1
+        logger.error(f"[Watchdog] No progress from the {stage} for {seconds:.1f}s")
+        self.arm()
+
+        if stage == "camera":
+            raise RuntimeError(f"Camera delivered no frames for {seconds:.1f}s")
+
+        if stage == "encoder":
+            raise RuntimeError(f"H.264 encoder produced no frames for {seconds:.1f}s")
+
+        ffmpeg = getattr(self.output, "ffmpeg", None)
+
+        if ffmpeg is not None:
+            try:
+                ffmpeg.kill()
+
+            except OSError as e:
+                logger.warning(f"[Watchdog] Could not kill ffmpeg: {e}")
+
+        raise BrokenPipeError(errno.EPIPE, f"Live output took no frames for {seconds:.1f}s")